@@ -4,6 +4,7 @@ from six.moves.xmlrpc_client import ServerProxy
 import time
 import json
 from larch.utils.jsonutils import decode4js
+from larch.xmlrpc_server import get_array
 s = ServerProxy('http://127.0.0.1:4966')
 
 print( 'Avaialable Methods from XML-RPC server: ', s.system.listMethods())
@@ -28,5 +29,16 @@ print( 'x = ', s.get_data('x'))
 
 print('gx = ',  gx, type(gx), gx.dtype)
 
+# arrays can also be sent as binary data, which is much faster for large arrays
+s.larch('img = random.normal(size=(2000, 2000))')
+t0 = time.time()
+img = get_array(s, 'img')
+print('img = ', img.shape, img.dtype, ' %.3f sec' % (time.time()-t0))
+
+# for a server on the same host, arrays can be passed through a shared file
+t0 = time.time()
+img = get_array(s, 'img', shared=True)
+print('img = ', img.shape, img.dtype, ' %.3f sec' % (time.time()-t0))
+
 # could tell server to exit!
 # s.exit()
@@ -9,8 +9,8 @@ import sys
 ## require that numpy be available right away!!
 import numpy
 
-import matplotlib
-matplotlib.use('WXAgg')
+from .site_config import use_mpl_backend
+use_mpl_backend('WXAgg')
 
 major, minor = sys.version_info[0], sys.version_info[1]
 if major < 2 or (major == 2 and minor < 7):
@@ -194,15 +194,21 @@ def _help(*args, **kws):
     else:
         return helper.getbuffer()
 
-def _addplugin(plugin, _larch=None, verbose=False, **kws):
-    """add plugin components from plugin directory"""
+def _addplugin(plugin, _larch=None, verbose=False, path=None,
+               recorder=None, **kws):
+    """add plugin components from plugin directory
+
+    The import time for each plugin module is put in _sys.import_times.
+    With path, the plugin is searched for in that list of directories
+    instead of the plugins path.  A recorder (see plugin_manifest.py)
+    will be told about each plugin module added.
+    """
     if _larch is None:
         raise Warning("cannot add plugins. larch broken?")
     symtable = _larch.symtable
     write = _larch.writer.write
     errmsg = 'is not a valid larch plugin\n'
     pjoin = os.path.join
-    path = site_config.plugins_path
     _sysconf = symtable._sys.config
     symtable._sys.import_ok  = True
 
@@ -344,10 +350,19 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
                 retval = all(retvals)
         else:
             fh, modpath, desc = mod
+            modkey = '%s/%s' % (os.path.basename(os.path.dirname(modpath)),
+                                plugin)
             try:
+                if recorder is not None:
+                    recorder.before_module(symtable)
+                t0 = time.time()
                 out = imp.load_module(plugin, fh, modpath, desc)
                 ret = symtable.add_plugin(out, on_error, **kws)
+                symtable._sys.import_times[modkey] = time.time() - t0
                 symtable._sys.last_import = ret
+                if recorder is not None:
+                    recorder.after_module(symtable, modkey, plugin,
+                                          os.path.dirname(modpath), ret)
             except:
                 err, exc, tback = sys.exc_info()
                 lineno = getattr(exc, 'lineno', 0)
@@ -363,9 +378,15 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
 %s: %s\n""" % (modpath, lineno, etext, ' '*offset, err.__name__, emsg))
                 retval = False
                 symtable._sys.import_ok = False
+                if recorder is not None:
+                    recorder.module_failed(modkey, plugin,
+                                           os.path.dirname(modpath))
 
         if _larch.error:
             retval = False
+            if recorder is not None and not is_pkg:
+                recorder.module_failed(modkey, plugin,
+                                       os.path.dirname(modpath))
             err = _larch.error.pop(0)
             fname, lineno = err.fname, err.lineno
             output = ["Error Adding Plugin %s from file %s" % (plugin, fname),
@@ -381,7 +402,7 @@ def _addplugin(plugin, _larch=None, verbose=False, **kws):
             fh.close()
         return retval
 
-    _plugin_file(plugin)
+    _plugin_file(plugin, path=path)
     if verbose:
         try:
             groupname, syms = symtable._sys.last_import
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+"""
+   Compilation of Larch statements to Python code objects
+
+The Interpreter evaluates Larch code by walking its AST, dispatching a
+handler for each node.  For loops and Procedure bodies that are run many
+times, this module translates the AST once into a Python code object
+that is run with exec() using a namespace backed by the SymbolTable, so
+that name lookups and assignments follow the usual Larch rules (local
+group, module group, then the search groups).  Names are held in the
+namespace as fast locals while the code runs, and assigned names are
+written to the SymbolTable before each function call and at the end.
+Compilation is enabled with Interpreter(use_compiler=True).
+
+Only a subset of the Larch syntax is compiled (see COMPILE_NODES):
+statements using anything else are left to the Interpreter.  Operators
+and comparisons are compiled as calls to the Interpreter OPERATORS (which
+know about Parameters), and function calls go through a helper that
+checks for errors recorded by Procedures and Larch plugins.
+
+Compiled code for top-level statements is cached in memory and on disk,
+keyed by a hash of the statements, much like Python's .pyc files.  The
+disk cache holds at most CODECACHE_NFILES files, removing the least
+recently used files first.
+"""
+from __future__ import division, print_function
+import os
+import sys
+import ast
+import copy
+import marshal
+import hashlib
+import numpy
+import six
+
+from .larchlib import ReturnedNone, COMPILED_FILENAME
+from .utils import isValidName
+
+COMPILER_VERSION = '1'
+CODECACHE_SIZE = 1024
+CODECACHE_NFILES = 512
+
+# AST node types that can be compiled.  Operator, comparison, boolean,
+# and context nodes are always allowed
+COMPILE_NODES = ('Module', 'Expr', 'Assign', 'AugAssign', 'For', 'While',
+                 'If', 'Break', 'Continue', 'Pass', 'Return', 'Name',
+                 'Attribute', 'Subscript', 'Index', 'Slice', 'ExtSlice',
+                 'Tuple', 'List', 'Dict', 'Constant', 'Num', 'Str', 'Bytes',
+                 'NameConstant', 'Ellipsis', 'BinOp', 'UnaryOp', 'BoolOp',
+                 'Compare', 'IfExp', 'Call', 'keyword')
+
+OPERATOR_NODES = (ast.expr_context, ast.operator, ast.unaryop,
+                  ast.cmpop, ast.boolop)
+
+def _cache_tag():
+    "tag for compiled code files, specific to this Python"
+    tag = getattr(getattr(sys, 'implementation', None), 'cache_tag', None)
+    if tag is None:
+        tag = 'python%i%i' % sys.version_info[:2]
+    return '%s-lc%s' % (tag, COMPILER_VERSION)
+
+def fix_output(out):
+    """as for Interpreter.run(): convert numeric arrays with
+    dtype 'object' (as from Parameters) to float or complex"""
+    if isinstance(out, numpy.ndarray) and out.dtype == object:
+        try:
+            out = out.astype(float)
+        except TypeError:
+            try:
+                out = out.astype(complex)
+            except TypeError:
+                out = list(out)
+    return out
+
+class LarchReturn(Exception):
+    "raised by compiled 'return' statements"
+    def __init__(self, value):
+        Exception.__init__(self)
+        self.value = value
+
+class LarchErrorRecorded(Exception):
+    "raised when an error has been recorded by the Interpreter"
+    pass
+
+class CompiledCode(object):
+    """code object compiled from a list of AST statements, which are
+    kept to report errors as the Interpreter would"""
+    def __init__(self, code, nodes, procedure=False):
+        self.code = code
+        self.nodes = nodes
+        self.procedure = procedure
+
+    def find_node(self, lineno):
+        """return (top-level statement, innermost statement) for
+        a line number of the compiled code"""
+        top = self.nodes[0]
+        for node in self.nodes:
+            if node.lineno <= lineno:
+                top = node
+        inner = top
+        for node in ast.walk(top):
+            if isinstance(node, ast.stmt) and node.lineno == lineno:
+                inner = node
+        return top, inner
+
+class SymbolTableNamespace(dict):
+    """mapping for exec() of compiled code, holding the names it uses
+    as fast locals.  A name is looked up in the compiler helpers or the
+    SymbolTable the first time it is used.  Names that are assigned are
+    written to the local group of the SymbolTable by flush(), before
+    each function call and when the code finishes, so that functions
+    and procedures always see the current values."""
+    def __init__(self, symtable, helpers):
+        dict.__init__(self)
+        self.symtable = symtable
+        self.helpers = helpers
+        self.loaded = {}
+
+    def __missing__(self, name):
+        if name in self.helpers:
+            value = self.helpers[name]
+        else:
+            try:
+                value = self.symtable.get_symbol(name)
+            except (NameError, LookupError):
+                raise KeyError(name)
+        self[name] = self.loaded[name] = value
+        return value
+
+    def flush(self):
+        """write assigned names to the SymbolTable, and forget all
+        names, as a function call may change them"""
+        loaded = self.loaded
+        changed = [(name, val) for name, val in self.items()
+                   if name not in loaded or loaded[name] is not val]
+        self.clear()
+        loaded.clear()
+        if len(changed) > 0:
+            self.symtable.set_local_symbols(changed)
+
+class LarchTransformer(ast.NodeTransformer):
+    """translate Larch AST to Python AST with Larch semantics:
+    operators and calls become calls to compiler helpers"""
+    def __init__(self, procedure=False):
+        ast.NodeTransformer.__init__(self)
+        self.procedure = procedure
+
+    def helper(self, name, args):
+        out = ast.Call(func=ast.Name(id=name, ctx=ast.Load()),
+                       args=args, keywords=[])
+        if six.PY2:
+            out.starargs = out.kwargs = None
+        return out
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        out = self.helper('_larch_%s' % node.op.__class__.__name__,
+                          [node.left, node.right])
+        return ast.copy_location(out, node)
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        out = self.helper('_larch_%s' % node.ops[0].__class__.__name__,
+                          [node.left, node.comparators[0]])
+        return ast.copy_location(out, node)
+
+    def visit_AugAssign(self, node):
+        # as in the Interpreter, 'a += b' is 'a = a + b'
+        target = copy.deepcopy(node.target)
+        target.ctx = ast.Load()
+        value = ast.BinOp(left=target, op=node.op, right=node.value)
+        out = ast.Assign(targets=[node.target], value=value)
+        ast.copy_location(value, node)
+        return self.visit(ast.copy_location(out, node))
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        node.args = [node.func] + node.args
+        node.func = ast.copy_location(ast.Name(id='_larch_call', ctx=ast.Load()),
+                                      node)
+        return node
+
+    def visit_Return(self, node):
+        self.generic_visit(node)
+        value = node.value
+        if value is None:
+            value = ast.parse('None', mode='eval').body
+        out = ast.Expr(value=self.helper('_larch_return', [value]))
+        return ast.copy_location(out, node)
+
+def can_compile(node, procedure=False, unsafe_attrs=()):
+    "return whether an AST statement can be compiled"
+    for tnode in ast.walk(node):
+        if isinstance(tnode, OPERATOR_NODES):
+            if isinstance(tnode, ast.Del):
+                return False
+            continue
+        name = tnode.__class__.__name__
+        if name not in COMPILE_NODES:
+            return False
+        if name == 'Return' and not procedure:
+            return False
+        if name == 'Attribute' and tnode.attr in unsafe_attrs:
+            return False
+        if name == 'Compare' and len(tnode.ops) > 1:
+            return False
+        if name == 'Dict' and None in tnode.keys:
+            return False
+        if name == 'Name' and tnode.id.startswith('_larch_'):
+            return False
+        # names assigned in compiled code are not checked when run
+        if (name == 'Name' and isinstance(tnode.ctx, ast.Store) and
+            not isValidName(tnode.id)):
+            return False
+    return True
+
+class LarchCompiler(object):
+    """compile and run Larch statements as Python code objects
+
+    Parameters
+    ----------
+    larch:        Interpreter
+    operators:    dict of functions for AST operator classes
+    unsafe_attrs: attribute names that must not be compiled
+    cachedir:     directory for compiled code (None for no disk cache)
+    """
+    def __init__(self, larch, operators, unsafe_attrs=(), cachedir=None):
+        self._larch = larch
+        self.unsafe_attrs = unsafe_attrs
+        self.cachedir = cachedir
+        self.cache_tag = _cache_tag()
+        self.codecache = {}
+
+        helpers = {}
+        for opclass, func in operators.items():
+            helpers['_larch_%s' % opclass.__name__] = self._make_op(func)
+        helpers['_larch_call'] = self._call
+        helpers['_larch_return'] = self._return
+        self.helpers = helpers
+        self.globals = {'__builtins__': {}}
+        # namespaces of the compiled code being run, innermost last
+        self.namespaces = []
+
+    def _make_op(self, func):
+        def op(*args):
+            return fix_output(func(*args))
+        return op
+
+    def _call(self, *args, **kws):
+        func, args = args[0], args[1:]
+        larch = self._larch
+        if not callable(func):
+            raise TypeError("'%s' is not callable!!" % (func))
+        if six.PY3 and func == print:
+            kws.setdefault('file', larch.writer)
+        self.namespaces[-1].flush()
+        out = func(*args, **kws)
+        if len(larch.error) > 0:
+            raise LarchErrorRecorded()
+        if isinstance(out, enumerate):
+            out = list(out)
+        return fix_output(out)
+
+    def _return(self, value):
+        raise LarchReturn(value)
+
+    def compile(self, nodes, procedure=False, use_disk=False):
+        """compile list of AST statements to a code object, or
+        return None if they cannot be compiled"""
+        module = ast.Module(body=list(nodes))
+        module.type_ignores = []
+        # line numbers are part of the key, as they are in the code object
+        key = ast.dump(module, include_attributes=True)
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        if procedure:
+            key = 'proc_%s' % key
+        code = self.codecache.get(key, None)
+        if code is not None:
+            return code
+
+        cfile = None
+        if use_disk and self.cachedir is not None:
+            cfile = os.path.join(self.cachedir, '%s.%s.lcc' % (key, self.cache_tag))
+            code = self._read_cache(cfile)
+
+        if code is None:
+            module = LarchTransformer(procedure=procedure).visit(copy.deepcopy(module))
+            ast.fix_missing_locations(module)
+            try:
+                code = compile(module, COMPILED_FILENAME, 'exec')
+            except (SyntaxError, TypeError, ValueError):
+                return None
+            if cfile is not None:
+                self._write_cache(cfile, code)
+
+        if len(self.codecache) >= CODECACHE_SIZE:
+            self.codecache.clear()
+        self.codecache[key] = code
+        return code
+
+    def _read_cache(self, cfile):
+        try:
+            with open(cfile, 'rb') as fh:
+                code = marshal.load(fh)
+            # mark as recently used, see _prune_cache()
+            os.utime(cfile, None)
+            return code
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _write_cache(self, cfile, code):
+        tmpfile = '%s.%i' % (cfile, os.getpid())
+        try:
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir)
+            with open(tmpfile, 'wb') as fh:
+                marshal.dump(code, fh)
+            if os.path.exists(cfile):
+                os.unlink(cfile)
+            os.rename(tmpfile, cfile)
+        except (IOError, OSError):
+            pass
+        self._prune_cache()
+
+    def _prune_cache(self):
+        "remove least recently used files from the disk cache"
+        try:
+            cfiles = [os.path.join(self.cachedir, f)
+                      for f in os.listdir(self.cachedir) if f.endswith('.lcc')]
+            if len(cfiles) <= CODECACHE_NFILES:
+                return
+            cfiles.sort(key=os.path.getmtime)
+            for cfile in cfiles[:len(cfiles)-CODECACHE_NFILES]:
+                os.unlink(cfile)
+        except (IOError, OSError):
+            pass
+
+    def segments(self, body, procedure=False, use_disk=False):
+        """split a list of AST statements into a list of CompiledCode
+        (for runs of compilable statements) and AST nodes.  Outside of
+        procedures, only loops are compiled."""
+        out, run = [], []
+        for node in body:
+            compile_ok = can_compile(node, procedure=procedure,
+                                     unsafe_attrs=self.unsafe_attrs)
+            if not procedure:
+                compile_ok = compile_ok and isinstance(node, (ast.For, ast.While))
+            if compile_ok:
+                run.append(node)
+                continue
+            if len(run) > 0:
+                out.append(self._compile_run(run, procedure, use_disk))
+                run = []
+            out.append(node)
+        if len(run) > 0:
+            out.append(self._compile_run(run, procedure, use_disk))
+        # expand runs of statements that failed to compile
+        expanded = []
+        for seg in out:
+            if isinstance(seg, list):
+                expanded.extend(seg)
+            else:
+                expanded.append(seg)
+        return expanded
+
+    def _compile_run(self, nodes, procedure, use_disk):
+        code = self.compile(nodes, procedure=procedure, use_disk=use_disk)
+        if code is None:
+            return nodes
+        return CompiledCode(code, nodes, procedure=procedure)
+
+    def execute(self, compiled, fname=None, lineno=0, func=None, expr=None):
+        """run CompiledCode from segments(), with fname and lineno
+        as for the Interpreter running its statements.
+
+        Returns
+        -------
+        value of a compiled 'return' statement, or None.  Errors are
+        recorded with the Interpreter, as for Interpreter.run()
+        """
+        larch = self._larch
+        namespace = SymbolTableNamespace(larch.symtable, self.helpers)
+        self.namespaces.append(namespace)
+        try:
+            try:
+                six.exec_(compiled.code, self.globals, namespace)
+            finally:
+                self.namespaces.pop()
+                namespace.flush()
+        except LarchReturn:
+            retval = sys.exc_info()[1].value
+            if retval is None:
+                retval = ReturnedNone
+            return retval
+        except LarchErrorRecorded:
+            pass
+        except KeyboardInterrupt:
+            raise
+        except:
+            tb = sys.exc_info()[2]
+            cline = compiled.nodes[0].lineno
+            while tb is not None:
+                if tb.tb_frame.f_code.co_filename == COMPILED_FILENAME:
+                    cline = tb.tb_lineno
+                tb = tb.tb_next
+            # as with the Interpreter, report the line of the statement
+            # in the procedure body, or of the top-level input
+            top, node = compiled.find_node(cline)
+            if compiled.procedure:
+                lineno = top.lineno + lineno - 1
+            if fname is None:
+                fname = larch.fname
+            larch.raise_exception(node, expr=expr, fname=fname,
+                                  lineno=lineno, func=func)
+        return None
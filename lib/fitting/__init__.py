@@ -1,20 +1,13 @@
 #!/usr/bin/env python
 import six
 from copy import copy, deepcopy
-HAS_WXPYTHON = False
-try:
-    import wx
-    HAS_WXPYTHON = True
-except ImportError:
-    pass
-
 import numpy as np
 from scipy.stats import f
 
-import matplotlib
-
+from ..site_config import has_module, use_mpl_backend
+HAS_WXPYTHON = has_module('wx')
 if HAS_WXPYTHON:
-    matplotlib.use("WXAgg")
+    use_mpl_backend("WXAgg")
 
 import lmfit
 from lmfit import (Parameter, Parameters, Minimizer, conf_interval,
@@ -94,7 +87,7 @@ class ParameterGroup(Group):
             self.__params__.add(name, value=val.value, vary=val.vary, min=val.min,
                               max=val.max, expr=val.expr, brute_step=val.brute_step)
             val = self.__params__[name]
-        self.__dict__[name] = val
+        Group.__setattr__(self, name, val)
 
     def __add(self, name, value=None, vary=True, min=-np.inf, max=np.inf,
               expr=None, stderr=None, correl=None, brute_step=None):
@@ -106,7 +99,7 @@ class ParameterGroup(Group):
                               expr=expr, brute_step=brute_step)
             self.__params__[name].stderr = stderr
             self.__params__[name].correl = correl
-            self.__dict__[name] = self.__params__[name]
+            Group.__setattr__(self, name, self.__params__[name])
 
 
 def param_group(_larch=None, **kws):
@@ -23,6 +23,8 @@ from .larchlib import (LarchExceptionHolder, ReturnedNone,
                        Procedure, StdWriter, enable_plugins)
 from .fitting  import isParameter
 from .utils import Closure
+from .compiler import LarchCompiler
+from .plugin_manifest import read_manifest, PluginRecorder, LazyPluginLoader
 
 UNSAFE_ATTRS = ('__subclasses__', '__bases__', '__code__',
                 '__closure__', '__globals__', 'func_code',
@@ -94,7 +96,8 @@ class Interpreter:
                        'tryfinally', 'tuple', 'unaryop', 'while')
 
     def __init__(self, symtable=None, input=None, writer=None,
-                 with_plugins=True, historyfile=None, maxhistory=5000):
+                 with_plugins=True, historyfile=None, maxhistory=5000,
+                 use_compiler=False, lazy_plugins=None):
 
         self.symtable   = symtable or SymbolTable(larch=self)
         self.input      = input or InputText(_larch=self,
@@ -108,6 +111,12 @@ class Interpreter:
         self.func       = None
         self.fname      = '<stdin>'
         self.lineno     = 0
+        # loops and procedure bodies are compiled to Python code objects
+        self.use_compiler = use_compiler
+        self.compiler   = LarchCompiler(self, OPERATORS,
+                                        unsafe_attrs=UNSAFE_ATTRS,
+                                        cachedir=os.path.join(site_config.usr_larchdir,
+                                                              'compiled'))
         builtingroup    = self.symtable._builtin
         mathgroup       = self.symtable._math
         setattr(mathgroup, 'j', 1j)
@@ -146,22 +155,41 @@ class Interpreter:
         self.node_handlers = dict(((node, getattr(self, "on_%s" % node))
                                    for node in self.supported_nodes))
 
+        # with lazy_plugins, plugin modules listed in the plugin manifest
+        # are imported on first use of their symbols
+        if lazy_plugins is None:
+            lazy_plugins = site_config.lazy_plugins
+        self.plugin_loader = None
         if with_plugins: # add all plugins in standard plugins folder
             plugins_dir = os.path.join(site_config.larchdir, 'plugins')
-            loaded_plugins = []
-            for pname in site_config.core_plugins:
-                pdir = os.path.join(plugins_dir, pname)
-                if os.path.isdir(pdir):
-                    builtins._addplugin(pdir, _larch=self)
-                    loaded_plugins.append(pname)
-
-            for pname in sorted(os.listdir(plugins_dir)):
-                if pname not in loaded_plugins:
+            manifest, recorder = None, None
+            if lazy_plugins:
+                manifest = read_manifest(plugins_dir)
+                if manifest is None:
+                    recorder = PluginRecorder(plugins_dir)
+
+            if manifest is not None:
+                self.plugin_loader = LazyPluginLoader(manifest, _larch=self)
+                self.plugin_loader.setup()
+            else:
+                loaded_plugins = []
+                for pname in site_config.core_plugins:
                     pdir = os.path.join(plugins_dir, pname)
                     if os.path.isdir(pdir):
-                        builtins._addplugin(pdir, _larch=self)
+                        builtins._addplugin(pdir, _larch=self,
+                                            recorder=recorder)
                         loaded_plugins.append(pname)
 
+                for pname in sorted(os.listdir(plugins_dir)):
+                    if pname not in loaded_plugins:
+                        pdir = os.path.join(plugins_dir, pname)
+                        if os.path.isdir(pdir):
+                            builtins._addplugin(pdir, _larch=self,
+                                                recorder=recorder)
+                            loaded_plugins.append(pname)
+                if recorder is not None:
+                    recorder.save()
+
         reset_fiteval = getattr(mathgroup, 'reset_fiteval', None)
         if callable(reset_fiteval):
             reset_fiteval(_larch=self)
@@ -430,8 +458,18 @@ class Interpreter:
     def on_module(self, node):    # ():('body',)
         "module def"
         out = None
-        for tnode in node.body:
-            out = self.run(tnode)
+        body = node.body
+        # a 'return' ends loops until the end of a procedure call
+        self.retval = None
+        if self.use_compiler:
+            body = self.compiler.segments(body, use_disk=True)
+        expr, fname, lineno = self.expr, self.fname, self.lineno
+        for tnode in body:
+            if isinstance(tnode, ast.AST):
+                out = self.run(tnode)
+            else:
+                out = self.compiler.execute(tnode, expr=expr, fname=fname,
+                                            lineno=lineno)
         return out
 
     def on_expression(self, node):
@@ -535,13 +573,7 @@ class Interpreter:
         elif node.__class__ == ast.Subscript:
             sym    = self.run(node.value)
             xslice = self.run(node.slice)
-            if isinstance(node.slice, ast.Index):
-                sym[xslice] = val
-            elif isinstance(node.slice, ast.Slice):
-                i = xslice.start
-                sym[slice(xslice.start, xslice.stop)] = val
-            elif isinstance(node.slice, ast.ExtSlice):
-                sym[(xslice)] = val
+            sym[xslice] = val
         elif node.__class__ in (ast.Tuple, ast.List):
             if len(val) == len(node.elts):
                 for telem, tval in zip(node.elts, val):
@@ -679,6 +711,8 @@ class Interpreter:
             block = node.orelse
         for tnode in block:
             self.run(tnode)
+            if self.retval is not None:
+                break
 
     def on_ifexp(self, node):    # ('test', 'body', 'orelse')
         "if expressions"
@@ -693,9 +727,9 @@ class Interpreter:
             self._interrupt = None
             for tnode in node.body:
                 self.run(tnode)
-                if self._interrupt is not None:
+                if self._interrupt is not None or self.retval is not None:
                     break
-            if isinstance(self._interrupt, ast.Break):
+            if isinstance(self._interrupt, ast.Break) or self.retval is not None:
                 break
         else:
             for tnode in node.orelse:
@@ -713,9 +747,9 @@ class Interpreter:
                 self.run(tnode)
                 if len(self.error) > 0:
                     return
-                if self._interrupt is not None:
+                if self._interrupt is not None or self.retval is not None:
                     break
-            if isinstance(self._interrupt, ast.Break):
+            if isinstance(self._interrupt, ast.Break) or self.retval is not None:
                 break
         else:
             for tnode in node.orelse:
@@ -53,6 +53,12 @@ class Empty:
 # holder for 'returned None' from Larch procedure
 ReturnedNone = Empty()
 
+# file name for Larch code compiled to Python code objects, and the
+# compiler module: frames from these are left out of error messages
+COMPILED_FILENAME = '<larch compiled>'
+COMPILER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'compiler.py')
+
 def get_filetext(fname, lineno):
     """try to extract line from source text file"""
     out = '<could not find text>'
@@ -142,6 +148,8 @@ class LarchExceptionHolder:
 
         tblist = []
         for tb in traceback.extract_tb(self.exc_info[2]):
+            if tb[0] in (COMPILED_FILENAME, COMPILER_FILE):
+                continue
             if not (sys.prefix in tb[0] and
                     ('ast.py' in tb[0] or
                      os.path.join('larch', 'utils') in tb[0] or
@@ -212,6 +220,7 @@ class Procedure(object):
         self._larch    = _larch
         self.modgroup = _larch.symtable._sys.moduleGroup
         self.body     = body
+        self._body    = None
         self.argnames = args
         self.kwargs   = kwargs
         self.vararg   = vararg
@@ -240,6 +249,16 @@ class Procedure(object):
                 sig = "%s, **%s" % (sig, self.varkws)
         return "%s(%s)" % (self.name, sig)
 
+    def _get_body(self):
+        """body as a list of AST nodes and compiled code objects,
+        compiled on first use if the interpreter has a compiler"""
+        if self._body is None:
+            self._body = self.body
+            if getattr(self._larch, 'use_compiler', False):
+                self._body = self._larch.compiler.segments(self.body,
+                                                           procedure=True)
+        return self._body
+
     def raise_exc(self, **kws):
         ekws = dict(lineno=self.lineno, func=self, fname=self.__file__)
         ekws.update(kws)
@@ -330,9 +349,13 @@ class Procedure(object):
         retval = None
         self._larch.retval = None
         self._larch.debug = True
-        for node in self.body:
-            self._larch.run(node, fname=self.__file__, func=self,
-                            lineno=node.lineno+self.lineno-1, with_raise=False)
+        for node in self._get_body():
+            if isinstance(node, ast.AST):
+                self._larch.run(node, fname=self.__file__, func=self,
+                                lineno=node.lineno+self.lineno-1, with_raise=False)
+            else:
+                self._larch.retval = self._larch.compiler.execute(
+                    node, fname=self.__file__, func=self, lineno=self.lineno)
             if len(self._larch.error) > 0:
                 break
             if self._larch.retval is not None:
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Plugin manifest for lazy loading of Larch plugins
+
+Importing all plugin modules at startup can take several seconds, as
+many plugins import large packages (wx, epics, pyFAI, sqlalchemy...).
+When all plugins are loaded, a manifest is written recording, for each
+plugin module, the symbols it added to each Group, along with the
+commands it registered.  Plugin modules that failed to load are
+recorded too, and are skipped.
+
+With a current manifest, the plugin Groups are created as LazyGroups
+with these symbols pending, and each plugin module is imported only
+when one of its symbols is first used.  Plugin modules that change
+other parts of _sys (for example, adding to _sys.fiteval_init), that
+register save/restore Group classes, or that replace symbols from other
+plugins are always imported at startup.
+
+The manifest is invalidated when any plugin file changes, and can be
+removed to retry loading failed plugin modules.  Lazy loading is used
+with Interpreter(lazy_plugins=True), 'larch --lazy', or by setting the
+environmental variable LARCHLAZYPLUGINS=1.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+
+from . import builtins
+from . import site_config
+from .symboltable import Group, make_lazy
+
+MANIFEST_FILE = 'plugin_manifest.json'
+MANIFEST_VERSION = 2
+
+# members of _sys that plugins may change without needing to be
+# imported at startup
+SYS_IGNORE = ('last_import', 'import_ok', 'import_times', 'valid_commands',
+              'saverestore_groups', 'searchGroups', 'searchGroupObjects',
+              '__cache__', 'frames', 'localGroup', 'moduleGroup')
+
+def manifest_filename():
+    "default manifest file, in the users larch folder"
+    return os.path.join(site_config.usr_larchdir, MANIFEST_FILE)
+
+def plugin_signature(plugins_dir):
+    """list of [filename, mtime, size] for the plugin files in a
+    plugins folder, used to tell whether a manifest is current"""
+    out = []
+    for dirpath, dirnames, filenames in os.walk(plugins_dir):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if (fname.endswith('.py') or
+                fname in (builtins.PLUGINSTXT, builtins.PLUGINSREQ)):
+                fullpath = os.path.join(dirpath, fname)
+                stat = os.stat(fullpath)
+                out.append([os.path.relpath(fullpath, plugins_dir),
+                            int(stat.st_mtime), stat.st_size])
+    return out
+
+def read_manifest(plugins_dir, filename=None):
+    """read plugin manifest, returning None if it does not exist
+    or is out of date for the plugins folder"""
+    if filename is None:
+        filename = manifest_filename()
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, 'r') as fh:
+            manifest = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+    if (manifest.get('version', None) != MANIFEST_VERSION or
+        manifest.get('larch_version', None) != site_config.larch_version or
+        manifest.get('python', None) != list(sys.version_info[:2]) or
+        manifest.get('plugins_dir', None) != os.path.abspath(plugins_dir) or
+        manifest.get('signature', None) != plugin_signature(plugins_dir)):
+        return None
+    return manifest
+
+def _group_members(symtable):
+    """{group name: {member name: id}} for all top-level Groups
+    and their subgroups"""
+    out = {}
+    for gname, grp in symtable.__dict__.items():
+        if not isinstance(grp, Group) or grp is symtable:
+            continue
+        out[gname] = dict((k, id(v)) for k, v in grp.__dict__.items())
+        for sname, sgrp in grp.__dict__.items():
+            if isinstance(sgrp, Group) and sgrp is not symtable:
+                out['%s.%s' % (gname, sname)] = dict((k, id(v)) for k, v
+                                                     in sgrp.__dict__.items())
+    return out
+
+def _sys_state(symtable):
+    "{name: (id, length)} for members of _sys"
+    out = {}
+    for key, val in symtable._sys.__dict__.items():
+        if key not in SYS_IGNORE:
+            out[key] = (id(val), len(val) if isinstance(val, (list, dict)) else -1)
+    return out
+
+class PluginRecorder(object):
+    """records the symbols added by plugin modules as they are loaded
+    by builtins._addplugin(), and writes the manifest"""
+    def __init__(self, plugins_dir):
+        self.plugins_dir = os.path.abspath(plugins_dir)
+        self.modules = []
+        self._before = None
+
+    def before_module(self, symtable):
+        "save the state of the symbol table before loading a module"
+        _sys = symtable._sys
+        self._before = (_group_members(symtable), _sys_state(symtable),
+                        set(symtable.__dict__.keys()),
+                        len(_sys.valid_commands), len(_sys.saverestore_groups))
+
+    def after_module(self, symtable, key, name, path, ret):
+        "record what a module added to the symbol table"
+        members, sysstate, toplevel, ncmds, nsave = self._before
+        groupname = None
+        if isinstance(ret, tuple) and len(ret) > 0:
+            groupname = ret[0]
+
+        eager = False
+        symbols = {}
+        for gname, names in _group_members(symtable).items():
+            before = members.get(gname, {})
+            new = [n for n in names if n not in before and
+                   not (n.startswith('__') and n.endswith('__'))]
+            # modules replacing symbols, and the modules that defined
+            # them, need to be loaded in order at startup
+            for n, nid in names.items():
+                if (n in before and before[n] != nid and
+                    not (n.startswith('__') and n.endswith('__')) and
+                    not (gname == '_sys' and n in SYS_IGNORE)):
+                    eager = True
+                    for mod in self.modules:
+                        if n in mod.get('symbols', {}).get(gname, ()):
+                            mod['eager'] = True
+            if gname == '_sys':
+                new = [n for n in new if n not in SYS_IGNORE and
+                       not isinstance(getattr(symtable._sys, n), Group)]
+                eager = eager or len(new) > 0
+            elif (gname.startswith('_sys.') and gname != groupname and
+                  len(new) > 0):
+                eager = True
+            elif len(new) > 0:
+                symbols[gname] = sorted(new)
+
+        # save/restore Group classes are needed by save() and restore()
+        if len(symtable._sys.saverestore_groups) > nsave:
+            eager = True
+
+        for tname in set(symtable.__dict__.keys()) - toplevel:
+            if not isinstance(getattr(symtable, tname), Group):
+                eager = True
+        after = _sys_state(symtable)
+        for skey, sval in sysstate.items():
+            if after.get(skey, None) != sval:
+                eager = True
+
+        _sys = symtable._sys
+        self.modules.append({'key': key, 'name': name, 'path': path,
+                             'group': groupname, 'symbols': symbols,
+                             'commands': _sys.valid_commands[ncmds:],
+                             'eager': eager})
+
+    def module_failed(self, key, name, path):
+        "record a plugin module that failed to load"
+        self.modules = [mod for mod in self.modules if mod['key'] != key]
+        self.modules.append({'key': key, 'name': name, 'path': path,
+                             'failed': True})
+
+    def save(self, filename=None):
+        """write the manifest, returning whether it was written."""
+        if filename is None:
+            filename = manifest_filename()
+        manifest = {'version': MANIFEST_VERSION,
+                    'larch_version': site_config.larch_version,
+                    'python': list(sys.version_info[:2]),
+                    'plugins_dir': self.plugins_dir,
+                    'signature': plugin_signature(self.plugins_dir),
+                    'modules': self.modules}
+        tmpfile = '%s.%i' % (filename, os.getpid())
+        try:
+            dirname = os.path.dirname(filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            with open(tmpfile, 'w') as fh:
+                json.dump(manifest, fh, indent=1)
+            if os.path.exists(filename):
+                os.unlink(filename)
+            os.rename(tmpfile, filename)
+        except (IOError, OSError, TypeError, ValueError):
+            try:
+                os.unlink(tmpfile)
+            except (IOError, OSError):
+                pass
+            return False
+        return True
+
+class LazyPluginLoader(object):
+    """set up plugin Groups from a manifest, and import plugin
+    modules when their symbols are first used"""
+    def __init__(self, manifest, _larch=None):
+        self._larch = _larch
+        self.manifest = manifest
+        self.pending = {}
+        self.groups = {}
+
+    def setup(self):
+        "create plugin Groups and pending symbols"
+        symtable = self._larch.symtable
+        _sys = symtable._sys
+        for mod in self.manifest['modules']:
+            if mod.get('failed', False):
+                continue
+            if mod['eager']:
+                builtins._addplugin(mod['name'], _larch=self._larch,
+                                    path=[mod['path']])
+                continue
+            key = mod['key']
+            self.pending[key] = mod
+            self.groups[key] = []
+            for cmd in mod['commands']:
+                if cmd not in _sys.valid_commands:
+                    _sys.valid_commands.append(cmd)
+
+            groupname = mod['group']
+            if groupname is not None:
+                if not symtable.has_group(groupname):
+                    symtable.new_group(groupname)
+                if groupname not in _sys.searchGroups:
+                    _sys.searchGroups.append(groupname)
+
+            for gname, names in mod['symbols'].items():
+                if not symtable.has_group(gname):
+                    symtable.new_group(gname)
+                grp = make_lazy(symtable.get_group(gname), self.load)
+                grp._set_pending(names, key)
+                self.groups[key].append(grp)
+        symtable._fix_searchGroups(force=True)
+
+    def load(self, key):
+        "import a plugin module, adding all of its symbols"
+        mod = self.pending.pop(key, None)
+        if mod is None:
+            return
+        for grp in self.groups.pop(key, []):
+            grp._clear_pending(key)
+        # plugins add symbols relative to the top-level group
+        symtable = self._larch.symtable
+        symtable.save_frame()
+        symtable.set_frame((symtable, symtable))
+        try:
+            builtins._addplugin(mod['name'], _larch=self._larch,
+                                path=[mod['path']])
+        finally:
+            symtable.restore_frame()
+
+    def load_all(self):
+        "import all remaining plugin modules"
+        for mod in self.manifest['modules']:
+            if not mod.get('failed', False):
+                self.load(mod['key'])
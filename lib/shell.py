@@ -4,11 +4,11 @@ import cmd
 import os
 import sys
 import numpy
-import matplotlib
 
 from .symboltable import SymbolTable
 from .interpreter import Interpreter
-from .site_config import history_file, show_site_config
+from .site_config import (history_file, show_site_config, has_module,
+                          use_mpl_backend)
 from .version import __version__, __date__, make_banner
 from .inputText import InputText
 from .larchlib import StdWriter
@@ -20,18 +20,15 @@ try:
 except ImportError:
     pass
 
-HAS_WXPYTHON = False
-try:
-    import wx
-    HAS_WXPYTHON = True
-except ImportError:
-    pass
+# wx is imported only when used
+HAS_WXPYTHON = has_module('wx')
 
 
 class shell(cmd.Cmd):
     def __init__(self,  completekey='tab', debug=False, quiet=False,
                  stdin=None, stdout=None, banner_msg=None,
-                 maxhist=5000, with_wx=False, with_plugins=True):
+                 maxhist=5000, with_wx=False, with_plugins=True,
+                 lazy_plugins=None):
 
         with_wx = HAS_WXPYTHON and with_wx
 
@@ -53,14 +50,16 @@ class shell(cmd.Cmd):
                 print('could not read history from %s' % history_file)
 
         if with_wx:
-            matplotlib.use('WXAgg')
+            use_mpl_backend('WXAgg')
 
         self.larch = Interpreter(with_plugins=with_plugins,
                                  historyfile=history_file,
-                                 maxhistory=maxhist)
+                                 maxhistory=maxhist,
+                                 lazy_plugins=lazy_plugins)
         self.larch.writer = StdWriter(_larch=self.larch)
 
         if with_wx:
+            import wx
             symtable = self.larch.symtable
 
             app = wx.App(redirect=False, clearSigInt=False)
@@ -10,6 +10,7 @@ from __future__ import print_function
 
 import sys
 import os
+import imp
 from os.path import exists, abspath, join
 from .utils import get_homedir, nativepath
 from .version import __version__ as larch_version
@@ -82,6 +83,9 @@ if 'LARCHSTARTUP' in os.environ:
     if exists(startup):
         init_files = [nativepath(startup)]
 
+# with LARCHLAZYPLUGINS set, plugin modules are imported on first use
+lazy_plugins = os.environ.get('LARCHLAZYPLUGINS', '0').lower() not in ('', '0', 'no', 'false')
+
 # history file:
 history_file = pjoin(usr_larchdir, 'history.lar')
 
@@ -139,6 +143,62 @@ def show_site_config():
        history_file, init_files,
        modules_path, plugins_path))
 
+# matplotlib backend to select when matplotlib is imported
+mpl_backend = None
+
+class MPLBackendFinder(object):
+    """import hook to select the matplotlib backend chosen with
+    use_mpl_backend() when matplotlib is first imported"""
+    def remove(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != 'matplotlib':
+            return None
+        self.remove()
+        import importlib.util
+        spec = importlib.util.find_spec(fullname)
+        if spec is not None and hasattr(spec.loader, 'exec_module'):
+            exec_module = spec.loader.exec_module
+            def exec_and_select(module):
+                exec_module(module)
+                module.use(mpl_backend)
+            spec.loader.exec_module = exec_and_select
+        return spec
+
+    def find_module(self, fullname, path=None):
+        if fullname == 'matplotlib':
+            return self
+        return None
+
+    def load_module(self, fullname):
+        self.remove()
+        module = __import__(fullname)
+        module.use(mpl_backend)
+        return module
+
+def use_mpl_backend(backend='WXAgg'):
+    """select the matplotlib backend.  If matplotlib has not been
+    imported yet, the backend is selected when it is imported"""
+    global mpl_backend
+    mpl_backend = backend
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use(backend)
+    elif not any(isinstance(f, MPLBackendFinder) for f in sys.meta_path):
+        sys.meta_path.insert(0, MPLBackendFinder())
+
+def has_module(modname):
+    """return whether a top-level module can be imported,
+    without importing it"""
+    if modname in sys.modules:
+        return True
+    try:
+        imp.find_module(modname)
+        return True
+    except ImportError:
+        return False
+
 def system_settings():
     """set system-specific Environmental Variables, and make sure
     that the user larchdirs exist.
@@ -11,6 +11,19 @@ import copy
 from .utils import Closure, fixName, isValidName
 from . import site_config
 
+SYMCACHE_SIZE = 4096
+
+# symbol lookup cache state, shared by all SymbolTables: the ids of
+# Groups that are currently in a search path (with a count of the
+# SymbolTables searching them), and a generation counter that is
+# incremented whenever the members of one of those groups or the
+# search path itself changes.  See SymbolTable._lookup()
+_searched_groups = {}
+_lookup_generation = [0]
+
+def _bump_generation():
+    _lookup_generation[0] += 1
+
 class Group(object):
     """
     Generic Group: a container for variables, modules, and subgroups.
@@ -24,6 +37,16 @@ class Group(object):
         for key, val in kws.items():
             setattr(self, key, val)
 
+    def __setattr__(self, name, value):
+        if id(self) in _searched_groups and name not in self.__dict__:
+            _bump_generation()
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if id(self) in _searched_groups:
+            _bump_generation()
+        object.__delattr__(self, name)
+
     def __len__(self):
         return max(1, len(dir(self))-1)
 
@@ -78,6 +101,63 @@ class Group(object):
                 r[key] = self.__dict__[key]
         return r
 
+class LazyGroup(Group):
+    """
+    Group with members that are not yet defined: on first access of a
+    pending member, the loader is called with the key for that member
+    (for example, the plugin module defining it), and should define it.
+
+    Use make_lazy() to convert an existing Group.
+    """
+    def __getattr__(self, name):
+        pending = self.__dict__.get('_LazyGroup__pending', None)
+        if pending is None or name not in pending:
+            raise AttributeError("'%s' has no attribute '%s'" %
+                                 (self.__dict__.get('__name__', 'Group'),
+                                  name))
+        self.__dict__['_LazyGroup__loader'](pending[name])
+        if name in self.__dict__:
+            return self.__dict__[name]
+        raise AttributeError("'%s' could not be loaded for '%s'" %
+                             (name, self.__name__))
+
+    __methods = ('_set_pending', '_clear_pending')
+
+    def __dir__(self):
+        "return list of member names, including pending members"
+        names = [n for n in Group.__dir__(self) if n not in self.__methods]
+        pending = self.__dict__.get('_LazyGroup__pending', {})
+        return names + sorted([n for n in pending if n not in names])
+
+    def _set_pending(self, names, key):
+        "set pending member names, to be loaded with key"
+        pending = self.__dict__['_LazyGroup__pending']
+        for name in names:
+            if name not in self.__dict__:
+                pending[name] = key
+
+    def _clear_pending(self, key):
+        """remove pending members for key, returning the Group
+        to a plain Group when there are none left"""
+        pending = self.__dict__['_LazyGroup__pending']
+        for name in [n for n, k in pending.items() if k == key]:
+            pending.pop(name)
+        if len(pending) == 0:
+            self.__dict__.pop('_LazyGroup__pending')
+            self.__dict__.pop('_LazyGroup__loader')
+            self.__class__ = Group
+
+def make_lazy(group, loader):
+    """convert a Group to a LazyGroup with a loader for its pending
+    members, and return it"""
+    if not isinstance(group, LazyGroup):
+        if type(group) is not Group:
+            raise TypeError("cannot make '%s' a LazyGroup" % repr(group))
+        group.__class__ = LazyGroup
+        group.__dict__['_LazyGroup__pending'] = {}
+    group.__dict__['_LazyGroup__loader'] = loader
+    return group
+
 def isgroup(grp, *args):
     """tests if input is a Group
 
@@ -148,7 +228,12 @@ class SymbolTable(Group):
         self._sys.valid_commands = []
         self._sys.moduleGroup = self
         self._sys.__cache__  = [None]*4
+        self._sys.lookup_cache = True
+        self.__symcache = {}
+        self.__watched = []
+        self.__parents = []
         self._sys.saverestore_groups = []
+        self._sys.import_times = {}
         for g in self.core_groups:
             self._sys.searchGroups.append(g)
         self._sys.core_groups = tuple(self._sys.searchGroups[:])
@@ -271,10 +356,36 @@ class SymbolTable(Group):
                 sgroups.append(grp)
                 snames.append(name)
 
+        if self not in sgroups:
+            sgroups.append(self)
+        # the lookup cache holds symbols found after the local and module
+        # groups, and is invalidated when those other groups change
+        watched = [grp for grp in sgroups
+                   if grp is not sys.localGroup and grp is not sys.moduleGroup]
+        if (len(watched) != len(self.__watched) or
+            any(a is not b for a, b in zip(watched, self.__watched))):
+            self.__set_watched(watched)
+
         self._sys.searchGroups = cache[2] = snames[:]
         sys.searchGroupObjects = cache[3] = sgroups[:]
         return sys.searchGroupObjects
 
+    def __set_watched(self, groups):
+        """set the Groups watched for changes by the lookup cache,
+        and invalidate the cache"""
+        for grp in self.__watched:
+            key = id(grp)
+            if key in _searched_groups:
+                _searched_groups[key] -= 1
+                if _searched_groups[key] <= 0:
+                    _searched_groups.pop(key)
+        for grp in groups:
+            key = id(grp)
+            _searched_groups[key] = _searched_groups.get(key, 0) + 1
+        self.__watched = groups
+        _bump_generation()
+        self.__symcache.clear()
+
     def get_parentpath(self, sym):
         """ get parent path for a symbol"""
         obj = self._lookup(sym)
@@ -291,10 +402,24 @@ class SymbolTable(Group):
         """looks up symbol in search path
         returns symbol given symbol name,
         creating symbol if needed (and create=True)"""
-        debug = False # not ('force'in name)
-        if debug:  print( '====\nLOOKUP ', name)
         searchGroups = self._fix_searchGroups()
-        self.__parents = []
+        parents = self.__parents
+        del parents[:]
+
+        if '.' not in name and self._sys.lookup_cache:
+            # names not in the local or module group are looked up in
+            # the group that held them last time, as long as none of
+            # the other search groups have changed
+            for grp in (self._sys.localGroup, self._sys.moduleGroup):
+                if (hasattr(grp, name) and
+                    not (grp is self and name in self._private)):
+                    parents.append(grp)
+                    return getattr(grp, name)
+            cached = self.__symcache.get(name, None)
+            if cached is not None and cached[0] == _lookup_generation[0]:
+                parents.append(cached[1])
+                return getattr(cached[1], name)
+
         if self not in searchGroups:
             searchGroups.append(self)
 
@@ -306,7 +431,11 @@ class SymbolTable(Group):
         if len(parts) == 1:
             for grp in searchGroups:
                 if public_attr(grp, name):
-                    self.__parents.append(grp)
+                    parents.append(grp)
+                    if self._sys.lookup_cache:
+                        if len(self.__symcache) >= SYMCACHE_SIZE:
+                            self.__symcache.clear()
+                        self.__symcache[name] = (_lookup_generation[0], grp)
                     return getattr(grp, name)
 
         # more complex case: not immediately found in Local or Module Group
@@ -412,6 +541,18 @@ class SymbolTable(Group):
                 func(*args, **kws)
         return getattr(grp, child)
 
+    def set_local_symbols(self, symbols):
+        """set symbols in the local group from a list of (name, value),
+        as for set_symbol(), for simple names already known to be valid"""
+        grp = self._sys.localGroup
+        for name, value in symbols:
+            setattr(grp, name, value)
+            if (grp, name) in self.__callbacks:
+                for func, args, kws in self.__callbacks[(grp, name)]:
+                    kws.update({'group': grp, 'value': value,
+                                'symbolname': name})
+                    func(*args, **kws)
+
     def del_symbol(self, name):
         "delete a symbol"
         sym = self._lookup(name, create=False)
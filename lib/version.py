@@ -5,7 +5,6 @@ __version__ = '0.9.37'
 import sys
 import numpy
 import scipy
-import matplotlib
 
 try:
     import wx
@@ -14,6 +13,7 @@ except:
     wxversion = 'not available'
 
 def make_banner():
+    import matplotlib
     lines = '=' * 78
     banner = """%s
 Larch %s (%s) M. Newville, M. Koker, B. Ravel, and others
@@ -6,11 +6,14 @@ import sys
 from time import time, sleep
 import signal
 import socket
+import tempfile
 from six.moves.xmlrpc_server import SimpleXMLRPCServer
-from six.moves.xmlrpc_client import ServerProxy
+from six.moves.xmlrpc_client import ServerProxy, Binary
+import numpy as np
 
 import larch
-from larch.utils.jsonutils import encode4js
+from larch import isgroup
+from larch.utils.jsonutils import encode4js, decode4js
 from threading import Thread
 
 try:
@@ -22,6 +25,13 @@ except ImportError:
 NOT_IN_USE, CONNECTED, NOT_LARCHSERVER = range(3)
 POLL_TIME = 2.0
 
+# folder for arrays shared with clients on the same host, and the
+# time in seconds after which unread shared files are removed
+SHARED_DIR = tempfile.gettempdir()
+if os.path.isdir('/dev/shm'):
+    SHARED_DIR = '/dev/shm'
+SHARED_MAXAGE = 600.0
+
 """Notes:
    0.  test server with HOST/PORT, report status (CREATED, ALREADY_RUNNING, FAILED).
    1.  prompt to kill a running server on HOST/PORT, preferably giving a 'last used by {APPNAME} with {PROCESS_ID} at {DATETIME}'
@@ -63,6 +73,129 @@ def test_server(host='localhost', port=4966):
     return CONNECTED
 
 
+def shared_prefix():
+    "file name prefix for shared arrays written by this process"
+    return 'larch_%i_' % os.getpid()
+
+def clean_shared_files(maxage=SHARED_MAXAGE):
+    """remove shared array files written by this process that
+    are older than maxage seconds, as for clients that did not
+    read them"""
+    prefix = shared_prefix()
+    now = time()
+    for fname in os.listdir(SHARED_DIR):
+        if fname.startswith(prefix) and fname.endswith('.npy'):
+            fname = os.path.join(SHARED_DIR, fname)
+            try:
+                if now - os.path.getmtime(fname) >= maxage:
+                    os.unlink(fname)
+            except OSError:
+                pass
+
+def encode4rpc(obj, shared=False):
+    """encode an object for XML-RPC, with numeric arrays sent
+    as binary data, and other objects as for encode4js
+
+    Arguments
+      obj: object to encode
+      shared (bool): whether to write arrays to a file in SHARED_DIR,
+                     for clients on the same host [False]
+
+    Returns
+      for numeric arrays, dictionary with '__class__' = 'BinaryArray',
+      '__dtype__', '__shape__', and 'value' holding the raw array data
+      as an xmlrpc Binary, or with '__class__' = 'SharedArray' and
+      'filename' of the saved array.  Arrays in Groups, lists, tuples,
+      and dicts are encoded in the same way.
+    """
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'biufc':
+        if shared:
+            fd, fname = tempfile.mkstemp(prefix=shared_prefix(),
+                                         suffix='.npy', dir=SHARED_DIR)
+            with os.fdopen(fd, 'wb') as fh:
+                np.save(fh, obj)
+            return {'__class__': 'SharedArray', 'filename': fname,
+                    '__dtype__': obj.dtype.str, '__shape__': list(obj.shape)}
+        return {'__class__': 'BinaryArray', '__dtype__': obj.dtype.str,
+                '__shape__': list(obj.shape),
+                'value': Binary(np.ascontiguousarray(obj).tobytes())}
+    elif isgroup(obj):
+        out = {'__class__': 'Group'}
+        for item in dir(obj):
+            out[item] = encode4rpc(getattr(obj, item), shared=shared)
+        return out
+    elif isinstance(obj, (tuple, list)):
+        ctype = 'Tuple' if isinstance(obj, tuple) else 'List'
+        return {'__class__': ctype,
+                'value': [encode4rpc(item, shared=shared) for item in obj]}
+    elif isinstance(obj, dict):
+        out = {'__class__': 'Dict'}
+        for key, val in obj.items():
+            out[encode4js(key)] = encode4rpc(val, shared=shared)
+        return out
+    return encode4js(obj)
+
+def _read_shared(obj):
+    "read and remove a shared array file"
+    fname = os.path.realpath(obj['filename'])
+    if (os.path.dirname(fname) != os.path.realpath(SHARED_DIR) or
+        not os.path.basename(fname).startswith('larch_')):
+        raise ValueError("'%s' is not a shared array file" % obj['filename'])
+    try:
+        return np.load(fname)
+    finally:
+        os.unlink(fname)
+
+def _decode_arrays(obj):
+    "decode binary and shared arrays in data from encode4rpc()"
+    if isinstance(obj, dict):
+        classname = obj.get('__class__', None)
+        if classname == 'SharedArray':
+            return _read_shared(obj)
+        elif classname == 'BinaryArray':
+            value = obj['value']
+            if isinstance(value, Binary):
+                value = value.data
+            out = np.frombuffer(value, dtype=np.dtype(obj['__dtype__']))
+            return out.reshape(obj['__shape__'])
+        return dict((key, _decode_arrays(val)) for key, val in obj.items())
+    elif isinstance(obj, list):
+        return [_decode_arrays(val) for val in obj]
+    return obj
+
+def decode4rpc(obj):
+    """decode data from get_binarydata(), as from encode4rpc()
+
+    Arguments
+      obj: object to decode
+
+    Returns
+      decoded object.  Arrays sent as binary data are read-only views
+      of the received data.  Files for shared arrays are removed, and
+      must be 'larch_*' files in SHARED_DIR.
+    """
+    return decode4js(_decode_arrays(obj))
+
+def get_array(server, expr, shared=False):
+    """get data for a larch expression from a Larch server, with
+    arrays transferred as binary data
+
+    Arguments
+      server (ServerProxy): connection to Larch server
+      expr (str): larch expression
+      shared (bool): whether to pass arrays through a shared file,
+                     which is much faster for large arrays, but only
+                     for a server on the same host [False]
+
+    Returns
+      value of expression
+
+    Example
+      >>> server = ServerProxy('http://localhost:4966')
+      >>> roimap = get_array(server, 'map.roimap', shared=True)
+    """
+    return decode4rpc(server.get_binarydata(expr, shared))
+
 def get_next_port(host='localhost', port=4966, nmax=100):
     """Return next available port for a Larch server on host
 
@@ -137,6 +270,7 @@ class LarchServer(SimpleXMLRPCServer):
 
         self.client = self.larch.symtable._sys.client
         self.port = port
+        self.request_address = None
         SimpleXMLRPCServer.__init__(self, (host, port),
                                     logRequests=logRequests,
                                     allow_none=allow_none)
@@ -147,6 +281,7 @@ class LarchServer(SimpleXMLRPCServer):
         for method in ('ls', 'chdir', 'cd', 'cwd', 'shutdown',
                         'set_keepalive_time', 'set_client_info',
                         'get_client_info', 'get_data', 'get_rawdata',
+                        'get_binarydata',
                         'get_messages', 'len_messages'):
             self.register_function(getattr(self, method), method)
 
@@ -155,6 +290,19 @@ class LarchServer(SimpleXMLRPCServer):
         signal.signal(signal.SIGINT, self.signal_handler)
         self.activity_thread = Thread(target=self.check_activity)
 
+    def verify_request(self, request, client_address):
+        "note the address of the client for each request"
+        self.request_address = client_address
+        return SimpleXMLRPCServer.verify_request(self, request, client_address)
+
+    def is_local_request(self):
+        "whether the current request is from a client on the same host"
+        if self.request_address is None:
+            return False
+        host = self.request_address[0]
+        return (host in ('::1', 'localhost') or host.startswith('127.') or
+                host.startswith('::ffff:127.'))
+
     def write(self, text, **kws):
         if text is None:
             text = ''
@@ -276,6 +424,17 @@ class LarchServer(SimpleXMLRPCServer):
         self.larch('_sys.client.last_event = %i' % time())
         return encode4js(self.larch.eval(expr))
 
+    def get_binarydata(self, expr, shared=False):
+        """return data for a larch expression, with numeric arrays
+        as binary data, or written to a shared file for clients on
+        the same host:  use get_array() or decode4rpc() to decode"""
+        if shared:
+            if not self.is_local_request():
+                raise ValueError("shared arrays are only for clients on the same host")
+            clean_shared_files()
+        self.larch('_sys.client.last_event = %i' % time())
+        return encode4rpc(self.larch.eval(expr), shared=shared)
+
     def run(self):
         """run server until times out"""
         self.activity_thread.start()
@@ -284,6 +443,7 @@ class LarchServer(SimpleXMLRPCServer):
                 self.handle_request()
             except:
                 break
+        clean_shared_files(maxage=0)
 
 if __name__ == '__main__':
     s = LarchServer(host='localhost', port=4966)
@@ -12,7 +12,7 @@ from .hdf5group import h5file, h5group, netcdf_file, netcdf_group
 from .gse_escan import gsescan_group, gsescan_deadtime_correct
 from .gse_xdiscan import read_gsexdi, gsexdi_deadtime_correct, is_GSEXDI
 from .gse_mcafile import gsemca_group, GSEMCA_File
-from .save_restore import save, restore
+from .save_restore import save, restore, savefile_contents
 from .tiff_plugin import read_tiff, tiff_object
 from .athena_project import is_athena_project, read_athena, AthenaProject
 from .csvfiles import groups2csv
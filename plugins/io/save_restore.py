@@ -2,6 +2,8 @@
 import json
 import time
 import numpy as np
+import six
+import h5py
 
 from collections import OrderedDict
 
@@ -10,9 +12,18 @@ from larch import ValidateLarchPlugin
 from larch.utils.jsonutils import encode4js, decode4js
 from larch_plugins.io import fix_varname
 
+SAVE_VERSION = '2.0'
+SAVE_FORMATS = ('hdf5', 'json')
+
+# arrays smaller than this are stored without compression
+MIN_COMPRESS_NBYTES = 4096
+
+# name used by save() for unnamed arguments, as fixed for a variable name
+UNKNOWN_NAME = fix_varname('_unknown_')
+
 @ValidateLarchPlugin
 def save(fname,  *args, **kws):
-    """save groups and data into a portable json file
+    """save groups and data into a portable Larch save file
 
     save(fname, arg1, arg2, ....)
 
@@ -20,22 +31,30 @@ def save(fname,  *args, **kws):
     ----------
        fname   name of output save file.
        args    list of groups, data items to be saved.
+       format  file format, 'hdf5' (default) or 'json'.
+       compression       compression for arrays in 'hdf5' files:
+                         'gzip' (default), 'lzf', or None.
+       compression_opts  compression level for 'gzip' [1]
+
+    Notes
+    -----
+    1. 'hdf5' files keep the raw data of arrays, which can be read back
+       individually with restore(fname, items=[...]).
+    2. 'json' files are the text format of Larch 0.9.
 
-    See Also:  restore()
+    See Also:  restore(), savefile_contents()
     """
     _larch = kws.get('_larch', None)
     isgroup =  _larch.symtable.isgroup
+    fmt = kws.get('format', 'hdf5').lower()
+    if fmt not in SAVE_FORMATS:
+        raise ValueError("save format must be one of %s" % repr(SAVE_FORMATS))
 
     expr = getattr(_larch, 'this_expr', 'save(foo)')
     expr = expr.replace('\n', ' ').replace('\r', ' ')
 
     grouplist = _larch.symtable._sys.saverestore_groups[:]
 
-    buff = ["#Larch Save File: 1.0",
-            "#save.date: %s" % time.strftime('%Y-%m-%d %H:%M:%S'),
-            "#save.command: %s" % expr,
-            "#save.nitems:  %i" % len(args)]
-
     names = []
     if expr.startswith('save('):
         names = [a.strip() for a in expr[5:-1].split(',')]
@@ -43,9 +62,24 @@ def save(fname,  *args, **kws):
         names.pop(0)
     except:
         pass
+    names = [n for n in names if '=' not in n]
     if len(names) < len(args):
         names.extend(["_unknown_"]*(len(args) - len(names)))
 
+    if fmt == 'json':
+        _save_json(fname, names, args, expr, grouplist)
+    else:
+        _save_hdf5(fname, names, args, expr, grouplist,
+                   compression=kws.get('compression', 'gzip'),
+                   compression_opts=kws.get('compression_opts', 1))
+
+def _save_json(fname, names, args, expr, grouplist):
+    "save to json text file"
+    buff = ["#Larch Save File: 1.0",
+            "#save.date: %s" % time.strftime('%Y-%m-%d %H:%M:%S'),
+            "#save.command: %s" % expr,
+            "#save.nitems:  %i" % len(args)]
+
     for name, arg in zip(names, args):
         buff.append("#=> %s" % name)
         buff.append(json.dumps(encode4js(arg, grouplist=grouplist)))
@@ -53,28 +87,178 @@ def save(fname,  *args, **kws):
     with open(fname, "w") as fh:
         fh.write("\n".join(buff))
 
+def _group_classname(obj, grouplist):
+    "class name for a Group, as for encode4js"
+    for g in (grouplist or []):
+        if obj.__class__.__name__ == g.__name__:
+            return g.__name__
+    return 'Group'
 
-@ValidateLarchPlugin
-def restore(fname, top_level=True, _larch=None):
-    """restore data from a json Larch save file
+def _needs_hdf5(obj):
+    """whether an object contains arrays or groups, and so should
+    be written as HDF5 objects instead of JSON"""
+    if isinstance(obj, np.ndarray) or isinstance(obj, Group):
+        return True
+    if isinstance(obj, (list, tuple)):
+        return any(_needs_hdf5(v) for v in obj)
+    if isinstance(obj, dict):
+        return any(_needs_hdf5(v) for v in obj.values())
+    return False
 
-    Arguments
-    ---------
-    top_level  bool  whether to restore to _main [True]
+def _write_item(parent, key, obj, grouplist, compress):
+    """write an object to an HDF5 group: numeric arrays and numpy
+    scalars as datasets, Groups, lists, and dicts that hold arrays as
+    HDF5 groups, and other objects as JSON strings"""
+    if (isinstance(obj, (np.ndarray, np.generic)) and
+        obj.dtype.kind in 'biufc'):
+        opts = {}
+        if obj.ndim > 0 and obj.nbytes >= MIN_COMPRESS_NBYTES:
+            opts = compress
+        dset = parent.create_dataset(key, data=obj, **opts)
+        dset.attrs['__class__'] = 'Array'
+    elif isinstance(obj, Group):
+        grp = parent.create_group(key)
+        grp.attrs['__class__'] = _group_classname(obj, grouplist)
+        for item in dir(obj):
+            _write_item(grp, item, getattr(obj, item), grouplist, compress)
+    elif isinstance(obj, (list, tuple)) and _needs_hdf5(obj):
+        grp = parent.create_group(key)
+        grp.attrs['__class__'] = 'Tuple' if isinstance(obj, tuple) else 'List'
+        grp.attrs['length'] = len(obj)
+        for i, val in enumerate(obj):
+            _write_item(grp, str(i), val, grouplist, compress)
+    elif isinstance(obj, dict) and _needs_hdf5(obj):
+        grp = parent.create_group(key)
+        grp.attrs['__class__'] = 'Dict'
+        keys = []
+        for i, (dkey, val) in enumerate(obj.items()):
+            keys.append(encode4js(dkey, grouplist=grouplist))
+            _write_item(grp, 'k%i' % i, val, grouplist, compress)
+        grp.attrs['__keys__'] = json.dumps(keys)
+    else:
+        val = json.dumps(encode4js(obj, grouplist=grouplist))
+        dset = parent.create_dataset(key, data=val)
+        dset.attrs['__class__'] = 'JSON'
+
+def _save_hdf5(fname, names, args, expr, grouplist,
+               compression='gzip', compression_opts=1):
+    "save to HDF5 file"
+    compress = {}
+    if compression is not None:
+        compress = {'compression': compression, 'shuffle': True}
+        if compression == 'gzip':
+            compress['compression_opts'] = compression_opts
+
+    keys = []
+    for i, name in enumerate(names):
+        key = fix_varname(name)
+        if key in (None, 'None', UNKNOWN_NAME) or key in keys:
+            key = 'var_%5.5i' % (i+1)
+        keys.append(key)
+
+    with h5py.File(fname, 'w') as fh:
+        fh.attrs['larch_save_version'] = SAVE_VERSION
+        fh.attrs['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        fh.attrs['command'] = expr
+        fh.attrs['nitems'] = len(args)
+        fh.attrs['names'] = json.dumps(keys)
+        for key, arg in zip(keys, args):
+            _write_item(fh, key, arg, grouplist, compress)
 
+def _attr_str(val):
+    if isinstance(val, bytes):
+        val = val.decode('utf-8')
+    return val
+
+def _read_item(node, grouplist):
+    "read an object written by _write_item()"
+    classname = _attr_str(node.attrs.get('__class__', 'Array'))
+    if classname == 'Array':
+        return node[()]
+    elif classname == 'JSON':
+        return decode4js(json.loads(_attr_str(node[()])), grouplist)
+    elif classname in ('List', 'Tuple'):
+        out = [_read_item(node[str(i)], grouplist)
+               for i in range(node.attrs['length'])]
+        if classname == 'Tuple':
+            out = tuple(out)
+        return out
+    elif classname == 'Dict':
+        keys = json.loads(_attr_str(node.attrs['__keys__']))
+        return OrderedDict((decode4js(key, grouplist),
+                            _read_item(node['k%i' % i], grouplist))
+                           for i, key in enumerate(keys))
+
+    _groups = {'Group': Group}
+    for g in (grouplist or []):
+        _groups[g.__name__] = g
+    kws = dict((key, _read_item(node[key], grouplist)) for key in node)
+    return _groups.get(classname, Group)(**kws)
+
+def _describe(node):
+    "short description of an item in an HDF5 save file"
+    classname = _attr_str(node.attrs.get('__class__', 'Array'))
+    if classname == 'Array':
+        return "array<shape=%s, type=%s>" % (repr(node.shape), node.dtype)
+    elif classname == 'JSON':
+        return 'value'
+    elif classname in ('List', 'Tuple'):
+        return '%s, length %i' % (classname.lower(), node.attrs['length'])
+    return classname
+
+def savefile_contents(fname, _larch=None):
+    """list the contents of a Larch HDF5 save file, without reading it
 
     Returns
     -------
-    None   with `top_level=True` or group with `top_level=False`
-
-    Notes
-    -----
-    1.  With top_level=False, a new group containing the
-        recovered data will be returned.
+    list of (name, description) for all items, with names as used
+    in restore(fname, items=[...])
     """
+    out = []
+    with h5py.File(fname, 'r') as fh:
+        def visit(path, node):
+            name = path.replace('/', '.')
+            if name.startswith('_restore_metadata_'):
+                return
+            out.append((name, _describe(node)))
+        for key in json.loads(_attr_str(fh.attrs['names'])):
+            visit(key, fh[key])
+            if isinstance(fh[key], h5py.Group):
+                fh[key].visititems(lambda p, n: visit('%s/%s' % (key, p), n))
+    return out
 
-    grouplist = _larch.symtable._sys.saverestore_groups
+def _restore_hdf5(fname, out, items, grouplist):
+    "restore from HDF5 file into group, returning header"
+    with h5py.File(fname, 'r') as fh:
+        header = {'version': _attr_str(fh.attrs['larch_save_version']).split('.')}
+        for key in ('date', 'command', 'nitems'):
+            val = fh.attrs.get(key, None)
+            if key == 'nitems':
+                val = int(val)
+            header[key] = _attr_str(val)
+        names = json.loads(_attr_str(fh.attrs['names']))
+        if items is None:
+            for name in names:
+                setattr(out, name, _read_item(fh[name], grouplist))
+            return header
+
+        if isinstance(items, six.string_types):
+            items = [items]
+        for item in items:
+            path = item.split('.')
+            if path[0] not in names or '/'.join(path) not in fh:
+                raise KeyError("'%s' not found in save file %s" % (item, fname))
+            # partial groups hold only the selected members
+            top = out
+            for i, word in enumerate(path[:-1]):
+                if not isinstance(getattr(top, word, None), Group):
+                    setattr(top, word, Group(name=word))
+                top = getattr(top, word)
+            setattr(top, path[-1], _read_item(fh['/'.join(path)], grouplist))
+    return header
 
+def _restore_json(fname, out, grouplist):
+    "restore from json text file into group, returning header"
     datalines = open(fname, 'r').readlines()
     line1 = datalines.pop(0)
     if not line1.startswith("#Larch Save File:"):
@@ -85,8 +269,6 @@ def restore(fname, top_level=True, _larch=None):
     ivar = 0
     header = {'version': version_info}
     varnames = []
-    gname = fix_varname('restore_%s' % fname)
-    out = Group(name=gname)
     for line in datalines:
         line = line[:-1]
         if line.startswith('#save.'):
@@ -97,12 +279,49 @@ def restore(fname, top_level=True, _larch=None):
         elif line.startswith('#=>'):
             name = fix_varname(line[4:].strip())
             ivar += 1
-            if name in (None, 'None', '__unknown__') or name in varnames:
+            if name in (None, 'None', UNKNOWN_NAME) or name in varnames:
                 name = 'var_%5.5i' % (ivar)
             varnames.append(name)
         else:
             val = decode4js(json.loads(line), grouplist)
             setattr(out, varnames[-1], val)
+    return header
+
+@ValidateLarchPlugin
+def restore(fname, top_level=True, items=None, _larch=None):
+    """restore data from a Larch save file
+
+    Arguments
+    ---------
+    top_level  bool  whether to restore to _main [True]
+    items      list of names of items to restore, for HDF5 save files.
+               Names can be members of groups, as 'dat.mu' [None: all]
+
+    Returns
+    -------
+    None   with `top_level=True` or group with `top_level=False`
+
+    Notes
+    -----
+    1.  With top_level=False, a new group containing the
+        recovered data will be returned.
+    2.  With items, only the selected data is read from the file:
+        a Group is restored holding only its selected members.
+    3.  Both HDF5 and json save files can be read.
+
+    See Also:  save(), savefile_contents()
+    """
+
+    grouplist = _larch.symtable._sys.saverestore_groups
+
+    gname = fix_varname('restore_%s' % fname)
+    out = Group(name=gname)
+    if h5py.is_hdf5(fname):
+        header = _restore_hdf5(fname, out, items, grouplist)
+    elif items is not None:
+        raise ValueError("items can be selected only for HDF5 save files")
+    else:
+        header = _restore_json(fname, out, grouplist)
     setattr(out, '_restore_metadata_', header)
 
     if top_level:
@@ -113,4 +332,5 @@ def restore(fname, top_level=True, _larch=None):
     return out
 
 def registerLarchPlugin():
-    return ('_io', { 'save': save, 'restore': restore})
+    return ('_io', { 'save': save, 'restore': restore,
+                     'savefile_contents': savefile_contents})
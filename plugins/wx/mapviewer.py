@@ -2082,8 +2082,7 @@ class MapViewerFrame(wx.Frame):
         self.xrddisplay2D = None
 
         self.watch_files = False
-        self.file_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.onFileWatchTimer, self.file_timer)
+        self.watch_threads = {}
         self.files_in_progress = []
 
         self.hotcols = False
@@ -2768,6 +2767,8 @@ class MapViewerFrame(wx.Frame):
             self.filelist.Append(fname)
         if self.check_ownership(fname):
             self.process_file(fname)
+            if self.watch_files:
+                self.watch_file(fname)
         self.ShowFile(filename=fname)
         if parent is not None and len(parent) > 0:
             try:
@@ -2883,22 +2884,44 @@ class MapViewerFrame(wx.Frame):
 
         self.watch_files = event.IsChecked()
         if not self.watch_files:
-            self.file_timer.Stop()
+            for filename, thread in self.watch_threads.items():
+                self.filemap[filename].stop_watch()
+                thread.join()
+            self.watch_threads = {}
             msg = 'Watching Files/Folders for Changes: Off'
         else:
-            self.file_timer.Start(5000)
+            for filename in self.filemap:
+                self.watch_file(filename)
             msg = 'Watching Files/Folders for Changes: On'
         self.message(msg)
         ##print(msg)
 
-    def onFileWatchTimer(self, event=None):
-        for filename in self.filemap:
-            if (filename not in self.files_in_progress and
-                self.filemap[filename].folder_has_newdata()):
-                self.process_file(filename)
-                thispanel = self.nbpanels[self.nb.GetSelection()]
-                if hasattr(thispanel, 'onROIMap'):
-                    thispanel.onROIMap(event=None, new=False)
+    def watch_file(self, filename):
+        "start watching an open map file for new rows, if possible"
+        xrmfile = self.filemap[filename]
+        if (filename in self.files_in_progress or
+            filename in self.watch_threads or
+            not xrmfile.check_hostid()):
+            return
+        thread = Thread(target=xrmfile.watch,
+                        kwargs={'subscriber': self.onNewMapRow})
+        thread.daemon = True
+        thread.start()
+        self.watch_threads[filename] = thread
+
+    def onNewMapRow(self, row=None, maxrow=None, filename=None):
+        "called from watch() thread of a map file when a row is added"
+        wx.CallAfter(self.ShowNewMapRow, row=row, maxrow=maxrow,
+                     filename=filename)
+
+    def ShowNewMapRow(self, row=None, maxrow=None, filename=None):
+        fname = os.path.split(filename)[1] if filename else ''
+        self.message('MapViewer watching %s:  row %i of %i' % (fname, row+1, maxrow))
+        if (self.current_file is not None and
+            self.current_file.filename == filename):
+            thispanel = self.nbpanels[self.nb.GetSelection()]
+            if hasattr(thispanel, 'onROIMap'):
+                thispanel.onROIMap(event=None, new=False)
 
     def process_file(self, filename):
         """Request processing of map file.
@@ -2935,7 +2958,10 @@ class MapViewerFrame(wx.Frame):
         if self.h5convert_done:
             self.htimer.Stop()
             self.h5convert_thread.join()
-            self.files_in_progress = []
+            converted, self.files_in_progress = self.files_in_progress, []
+            if self.watch_files:
+                for filename in converted:
+                    self.watch_file(filename)
             self.message('MapViewer processing %s: complete!' % fname)
             self.ShowFile(filename=self.h5convert_fname)
 
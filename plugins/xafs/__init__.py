@@ -1,14 +1,15 @@
 from .xafsutils import KTOE, ETOK, set_xafsGroup
 
-from .xafsft import xftf, xftr, xftf_fast, xftr_fast, ftwindow
+from .xafsft import (xftf, xftr, xftf_fast, xftr_fast, ftwindow,
+                     xftf_many, xftr_many)
 
 from .pre_edge import pre_edge, preedge, find_e0, pre_edge_baseline
 
-from .feffdat import FeffPathGroup, FeffDatFile, _ff2chi
+from .feffdat import FeffPathGroup, FeffDatFile, FeffPathStack, _ff2chi
 
 from .feffit import FeffitDataSet, TransformGroup, feffit
 
-from .autobk import autobk
+from .autobk import autobk, autobk_many
 from .mback import mback
 from .diffkk import diffkk
 from .fluo import fluo_corr
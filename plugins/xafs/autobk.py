@@ -13,7 +13,7 @@ from larch import (Group, Make_CallArgs, ValidateLarchPlugin,
 from larch.utils import (index_of, index_nearest, realimag, remove_dups)
 
 from larch_plugins.xafs import (ETOK, set_xafsGroup, ftwindow, xftf_fast,
-                                find_e0, pre_edge)
+                                find_e0, pre_edge, preedge)
 
 
 # check for uncertainties package
@@ -32,6 +32,184 @@ def spline_eval(kraw, mu, knots, coefs, order, kout):
     chi = UnivariateSpline(kraw, (mu-bkg), s=0)(kout)
     return bkg, chi
 
+def spline_basis(kraw, knots, order, ncoefs):
+    """B-spline basis matrix: column i is the spline for unit coefficient i,
+    so that splev(kraw, [knots, coefs, order]) == basis.dot(coefs[:ncoefs])
+    """
+    basis = np.zeros((len(kraw), ncoefs))
+    unit  = np.zeros(len(knots))
+    for i in range(ncoefs):
+        unit[:] = 0
+        unit[i] = 1.0
+        basis[:, i] = splev(kraw, [knots, unit, order])
+    return basis
+
+def regrid_matrix(kraw, kout):
+    """linear operator for the interpolating (s=0) spline of spline_eval,
+    so that UnivariateSpline(kraw, y, s=0)(kout) == regrid.dot(y)
+    """
+    nraw = len(kraw)
+    regrid = np.zeros((len(kout), nraw))
+    unit = np.zeros(nraw)
+    for i in range(nraw):
+        unit[:] = 0
+        unit[i] = 1.0
+        regrid[:, i] = UnivariateSpline(kraw, unit, s=0)(kout)
+    return regrid
+
+def regrid_rows(kraw, arr, kout):
+    """apply the interpolating spline of spline_eval to each row of a
+    2-d array, building the regrid_matrix only when that is cheaper"""
+    if len(arr) > len(kraw):
+        return arr.dot(regrid_matrix(kraw, kout).T)
+    return np.array([UnivariateSpline(kraw, row, s=0)(kout) for row in arr])
+
+def ft_matrix(ftwin, irbkg, nfft=2048):
+    """real matrix for the linear map used in the autobk residual:
+    realimag(xftf_fast(chi*ftwin, nfft=nfft)[:irbkg]) == ftmat.dot(chi)
+    """
+    npts = len(ftwin)
+    # scale of xftf_fast from its response to a unit impulse
+    scale = xftf_fast(np.ones(1), nfft=nfft)[0].real
+    cmat  = np.exp(-2j*np.pi*np.outer(np.arange(irbkg), np.arange(npts))/nfft)
+    cmat  = scale * cmat * ftwin
+    ftmat = np.zeros((2*irbkg, npts))
+    ftmat[0::2] = cmat.real
+    ftmat[1::2] = cmat.imag
+    return ftmat
+
+def clamp_weights(kout, kweight=1, nclamp=0, clamp_lo=1, clamp_hi=1):
+    """indices into chi(k) and weights for the low- and high-k clamps,
+    in the order used by the autobk residual"""
+    nk = len(kout)
+    iclamp = np.concatenate((np.arange(nk)[:nclamp],
+                             np.arange(nk)[-nclamp:]))
+    nlo = min(nclamp, nk)
+    cwts = kout[iclamp]**kweight
+    cwts[:nlo] *= abs(clamp_lo)
+    cwts[nlo:] *= abs(clamp_hi)
+    return iclamp, cwts
+
+def autobk_operators(kraw, mu, knots, order, nspl, kout, ftwin, irbkg,
+                     nfft=2048, chi_std=None, kweight=1, nclamp=0,
+                     clamp_lo=1, clamp_hi=1):
+    """precompute the linear operators for the autobk residual.
+
+    With spline coefficients c, chi(k) = zvec - pmat.dot(c), and the
+    low-R Fourier components are yvec - amat.dot(c).  mu can be 1-d or
+    2-d (nspectra, len(kraw)): zvec, yvec and cvec always have one row
+    per spectrum.
+
+    Returns a Group with
+       basis   B-spline basis on kraw  (len(kraw), nspl)
+       pmat    regridded basis  (len(kout), nspl)
+       amat    low-R FT of regridded basis (2*irbkg, nspl)
+       zvec    regridded mu, less chi_std  (nspectra, len(kout))
+       yvec    low-R FT of zvec (nspectra, 2*irbkg)
+       cmat    weighted clamp rows of pmat, or None if nclamp == 0
+       cvec    weighted clamp values of zvec, or None if nclamp == 0
+    """
+    basis = spline_basis(kraw, knots, order, nspl)
+    ftmat = ft_matrix(ftwin, irbkg, nfft=nfft)
+
+    pmat = regrid_rows(kraw, basis.T, kout).T
+    zvec = regrid_rows(kraw, np.atleast_2d(mu), kout)
+    if chi_std is not None:
+        zvec = zvec - chi_std
+    ops = Group(basis=basis, pmat=pmat,
+                amat=ftmat.dot(pmat), zvec=zvec, yvec=zvec.dot(ftmat.T),
+                cmat=None, cvec=None)
+    if nclamp > 0:
+        iclamp, cwts = clamp_weights(kout, kweight=kweight, nclamp=nclamp,
+                                     clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+        ops.cmat = cwts[:, None] * pmat[iclamp]
+        ops.cvec = cwts * zvec[:, iclamp]
+    return ops
+
+def clamped_jacobian(coefs, amat, yvec, cmat, cvec, nclamp):
+    """low-R residual, clamp terms, clamp scale and Jacobian of the
+    scaled clamp terms for a stack of coefficients (nspectra, ncoefs)"""
+    fac   = 1.0/(amat.shape[0]*nclamp)
+    out   = yvec - coefs.dot(amat.T)
+    clamp = cvec - coefs.dot(cmat.T)
+    scale = fac*(1.0 + 100*(out*out).sum(axis=1))
+    dscale = -200*fac*out.dot(amat)
+    jbot = (clamp[:, :, None]*dscale[:, None, :] -
+            scale[:, None, None]*cmat[None, :, :])
+    return out, clamp, scale, jbot
+
+def clamped_lsq(coefs, amat, yvec, cmat=None, cvec=None, nclamp=0,
+                niter=200, tol=1.e-9):
+    """solve for spline coefficients of a stack of spectra minimizing
+    the autobk residual, which is linear in the coefficients except
+    for the scale of the clamp terms:
+
+        out   = yvec - amat.dot(coefs)
+        resid = [out, scale(out) * (cvec - cmat.dot(coefs))]
+
+    using damped Newton (Levenberg-Marquardt) steps with the exact
+    Jacobian and Hessian, iterated until the relative change in
+    coefficients of every spectrum is below tol.
+
+    Parameters:
+    -----------
+      coefs:   2-d array (nspectra, ncoefs) of initial coefficients
+      amat:    2-d array (nout, ncoefs), low-R FT of the regridded basis
+      yvec:    2-d array (nspectra, nout), low-R FT of regridded mu
+      cmat:    2-d array (nclamp_pts, ncoefs), weighted clamp basis rows
+      cvec:    2-d array (nspectra, nclamp_pts), weighted clamp data
+      nclamp:  number of clamp points, as for autobk [0]
+      niter:   maximum number of iterations [200]
+      tol:     relative tolerance on coefficient change [1.e-9]
+
+    Returns:
+    --------
+      coefs, niter, converged  (coefficients (nspectra, ncoefs),
+                                iterations used, whether tol was reached)
+    """
+    if nclamp == 0 or cmat is None:
+        coefs = np.linalg.lstsq(amat, yvec.T)[0].T
+        return coefs, 1, True
+    coefs = np.array(coefs, dtype='float64')
+    ata  = amat.T.dot(amat)
+    eye  = np.eye(ata.shape[0])
+    fac  = 1.0/(amat.shape[0]*nclamp)
+    out, clamp, scale, jbot = clamped_jacobian(coefs, amat, yvec,
+                                               cmat, cvec, nclamp)
+    cost = (out*out).sum(axis=1) + ((scale[:, None]*clamp)**2).sum(axis=1)
+    lam  = 1.e-3*np.ones(len(coefs))
+    done = np.zeros(len(coefs), dtype=bool)
+    for i in range(niter):
+        sclamp = scale[:, None]*clamp
+        jtr = np.einsum('sip,si->sp', jbot, sclamp) - out.dot(amat)
+        # Hessian of the cost, including the second derivatives of the
+        # clamp scale, which are not small when the residual is large
+        jtj = ata + np.einsum('sip,siq->spq', jbot, jbot)
+        dscale = -200*fac*out.dot(amat)
+        cross = np.einsum('sp,sq->spq', dscale, sclamp.dot(cmat))
+        hess = (jtj - cross - cross.transpose(0, 2, 1) +
+                (200*fac*(sclamp*clamp).sum(axis=1))[:, None, None]*ata)
+        damp = lam[:, None, None]*np.einsum('spp->sp', jtj)[:, :, None]*eye
+        delta = np.linalg.solve(hess + damp, jtr[:, :, None])[:, :, 0]
+        delta[done] = 0
+        trial = coefs - delta
+        tout, tclamp, tscale, tjbot = clamped_jacobian(trial, amat, yvec,
+                                                       cmat, cvec, nclamp)
+        tcost = ((tout*tout).sum(axis=1) +
+                 ((tscale[:, None]*tclamp)**2).sum(axis=1))
+        better = (tcost <= cost) & ~done
+        coefs[better] = trial[better]
+        out[better], clamp[better] = tout[better], tclamp[better]
+        scale[better], jbot[better] = tscale[better], tjbot[better]
+        cost[better] = tcost[better]
+        lam = np.where(better, lam/10.0, lam*10.0)
+        small = (abs(delta).max(axis=1) <=
+                 tol*np.maximum(1.e-12, abs(coefs).max(axis=1)))
+        done |= small
+        if done.all():
+            break
+    return coefs, i+1, bool(done.all())
+
 def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
             kraw=None, mu=None, kout=None, ftwin=1, kweight=1, chi_std=None,
             nclamp=0, clamp_lo=1, clamp_hi=1, **kws):
@@ -51,13 +229,37 @@ def __resid(pars, ncoefs=1, knots=None, order=3, irbkg=1, nfft=2048,
                            abs(clamp_lo)*scaled_chik[:nclamp],
                            abs(clamp_hi)*scaled_chik[-nclamp:]))
 
+def __jacobian(pars, nspl=1, ops=None, nclamp=0, **kws):
+    """analytic Jacobian of __resid for the varied coefficients"""
+    if nclamp == 0:
+        return -ops.amat
+    coefs = np.array([[pars[FMT_COEF % i].value for i in range(nspl)]])
+    jbot = clamped_jacobian(coefs, ops.amat, ops.yvec, ops.cmat,
+                            ops.cvec, nclamp)[3]
+    return np.concatenate((-ops.amat, jbot[0]))
+
+def linear_result(params, nfev, fit_kws):
+    """fit result, with covariance and parameter uncertainties,
+    for coefficients found with clamped_lsq()"""
+    nspl = fit_kws['nspl']
+    resid = __resid(params, **fit_kws)
+    jac = __jacobian(params, **fit_kws)
+    nfree = max(1, len(resid) - nspl)
+    redchi = (resid*resid).sum() / nfree
+    covar = np.linalg.inv(jac.T.dot(jac)) * redchi
+    for i in range(nspl):
+        params[FMT_COEF % i].stderr = np.sqrt(covar[i, i])
+    return Group(params=params, nfev=nfev, redchi=redchi, covar=covar,
+                 residual=resid, nfree=nfree)
+
 @ValidateLarchPlugin
 @Make_CallArgs(["energy" ,"mu"])
 def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
            edge_step=None, kmin=0, kmax=None, kweight=1, dk=0.1,
            win='hanning', k_std=None, chi_std=None, nfft=2048, kstep=0.05,
            pre_edge_kws=None, nclamp=4, clamp_lo=1, clamp_hi=1,
-           calc_uncertainties=True, err_sigma=1, _larch=None, **kws):
+           calc_uncertainties=True, err_sigma=1, method='leastsq',
+           _larch=None, **kws):
     """Use Autobk algorithm to remove XAFS background
 
     Parameters:
@@ -86,9 +288,18 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
       calc_uncertaintites:  Flag to calculate uncertainties in
                             mu_0(E) and chi(k) [True]
       err_sigma: sigma level for uncertainties in mu_0(E) and chi(k) [1]
+      method:    fit method, one of 'leastsq' or 'linear' ['leastsq']
 
     Output arrays are written to the provided group.
 
+    Notes:
+    ------
+     The residual is linear in the spline coefficients except for the
+     scale of the clamp terms.  With method='leastsq', the fit uses
+     Levenberg-Marquardt with an analytic Jacobian. With method='linear',
+     the coefficients are found by a linear least-squares solve followed
+     by damped Newton steps for the clamps, iterated to convergence.
+
     Follows the 'First Argument Group' convention.
     """
     msg = _larch.writer.write
@@ -98,6 +309,9 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
         msg('Unrecognized a:rguments for autobk():\n')
         msg('    %s\n' % (', '.join(kws.keys())))
         return
+    if method not in ('leastsq', 'linear'):
+        msg("autobk(): method must be one of 'leastsq' or 'linear'\n")
+        return
     energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
                                          defaults=(mu,), group=group,
                                          fcn_name='autobk')
@@ -177,16 +391,38 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     initbkg, initchi = spline_eval(kraw[:iemax-ie0+1], mu[ie0:iemax+1],
                                    knots, coefs, order, kout)
 
+    # the residual is linear in the spline coefficients, apart from
+    # the clamp scale: build the operators for the Jacobian
+    ops = autobk_operators(kraw[:iemax-ie0+1], mu[ie0:iemax+1], knots,
+                           order, nspl, kout, ftwin, irbkg, nfft=nfft,
+                           chi_std=chi_std, kweight=kweight, nclamp=nclamp,
+                           clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+
+    fit_kws = dict(ncoefs=len(coefs), chi_std=chi_std,
+                   knots=knots, order=order,
+                   kraw=kraw[:iemax-ie0+1],
+                   mu=mu[ie0:iemax+1], irbkg=irbkg, kout=kout,
+                   ftwin=ftwin, kweight=kweight,
+                   nfft=nfft, nclamp=nclamp,
+                   clamp_lo=clamp_lo, clamp_hi=clamp_hi,
+                   nspl=nspl, ops=ops)
     # do fit
-    result = minimize(__resid, params, method='leastsq',
-                      gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
-                      kws = dict(ncoefs=len(coefs), chi_std=chi_std,
-                                 knots=knots, order=order,
-                                 kraw=kraw[:iemax-ie0+1],
-                                 mu=mu[ie0:iemax+1], irbkg=irbkg, kout=kout,
-                                 ftwin=ftwin, kweight=kweight,
-                                 nfft=nfft, nclamp=nclamp,
-                                 clamp_lo=clamp_lo, clamp_hi=clamp_hi))
+    if method == 'linear':
+        lcoefs, nfev, converged = clamped_lsq(coefs[:nspl][None, :],
+                                              ops.amat, ops.yvec,
+                                              cmat=ops.cmat, cvec=ops.cvec,
+                                              nclamp=nclamp)
+        if not converged:
+            msg('autobk(): linear fit did not converge in %d iterations\n'
+                % nfev)
+        for i in range(nspl):
+            params[FMT_COEF % i].value = lcoefs[0, i]
+        result = linear_result(params, nfev, fit_kws)
+    else:
+        result = minimize(__resid, params, method='leastsq', Dfun=__jacobian,
+                          gtol=1.e-5, ftol=1.e-5, xtol=1.e-5, epsfcn=1.e-5,
+                          kws=fit_kws)
+        converged = result.success
 
     # write final results
     coefs = [result.params[FMT_COEF % i].value for i in range(len(coefs))]
@@ -213,51 +449,23 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
     details.knots_y  = np.array([coefs[i] for i in range(nspl)])
     details.init_knots_y = spl_y
     details.nfev = result.nfev
+    details.converged = converged
+    details.redchi = result.redchi
     details.kmin = kmin
     details.kmax = kmax
     group.autobk_details = details
 
-    # uncertainties in mu0 and chi: can be fairly slow.
+    # uncertainties in mu0 and chi
     if calc_uncertainties:
         nchi = len(chi)
         nmue = iemax-ie0 + 1
         redchi = result.redchi
         covar  = result.covar / redchi
-        jac_chi = np.zeros(nchi*nspl).reshape((nspl, nchi))
-        jac_bkg = np.zeros(nmue*nspl).reshape((nspl, nmue))
-
-        cvals, cerrs = [], []
-        for i in range(len(coefs)):
-             par = result.params[FMT_COEF % i]
-             cvals.append(getattr(par, 'value', 0.0))
-             cdel = getattr(par, 'stderr', 0.0)
-             if cdel is None:
-                 cdel = 0.0
-             cerrs.append(cdel/2.0)
-        cvals = np.array(cvals)
-        cerrs = np.array(cerrs)
-
-        # find derivatives by hand!
-        _k = kraw[:nmue]
-        _m = mu[ie0:iemax+1]
-        for i in range(nspl):
-            cval0 = cvals[i]
-            cvals[i] = cval0 + cerrs[i]
-            bkg1, chi1 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0 - cerrs[i]
-            bkg2, chi2 = spline_eval(_k, _m, knots, cvals, order, kout)
-
-            cvals[i] = cval0
-            jac_chi[i] = (chi1 - chi2) / (2*cerrs[i])
-            jac_bkg[i] = (bkg1 - bkg2) / (2*cerrs[i])
-
-        dfchi = np.zeros(nchi)
-        dfbkg = np.zeros(nmue)
-        for i in range(nspl):
-            for j in range(nspl):
-                dfchi += jac_chi[i]*jac_chi[j]*covar[i,j]
-                dfbkg += jac_bkg[i]*jac_bkg[j]*covar[i,j]
+        # chi and bkg are linear in the spline coefficients
+        jac_chi = -ops.pmat.T
+        jac_bkg = ops.basis.T
+        dfchi = (covar.dot(jac_chi)*jac_chi).sum(axis=0)
+        dfbkg = (covar.dot(jac_bkg)*jac_bkg).sum(axis=0)
 
         prob = 0.5*(1.0 + erf(err_sigma/np.sqrt(2.0)))
         dchi = t.ppf(prob, nchi-nspl) * np.sqrt(dfchi*redchi)
@@ -268,5 +476,182 @@ def autobk(energy, mu=None, group=None, rbkg=1, nknots=None, e0=None,
         group.delta_bkg[ie0:ie0+len(dbkg)] = dbkg
 
 
+@ValidateLarchPlugin
+@Make_CallArgs(["energy" ,"mu"])
+def autobk_many(energy, mu=None, group=None, rbkg=1, e0=None,
+                edge_step=None, kmin=0, kmax=None, kweight=1, dk=0.1,
+                win='hanning', k_std=None, chi_std=None, nfft=2048,
+                kstep=0.05, pre_edge_kws=None, nclamp=4, clamp_lo=1,
+                clamp_hi=1, niter=200, _larch=None, **kws):
+    """Autobk background removal for many spectra sharing one energy grid
+
+    Parameters:
+    -----------
+      energy:    1-d array of x-ray energies, in eV, or group
+      mu:        2-d array of mu(E), shape (nspectra, len(energy))
+      group:     output group (and input group for e0 and edge_step).
+      rbkg:      distance (in Ang) for chi(R) above
+                 which the signal is ignored. Default = 1.
+      e0:        edge energy, in eV, shared by all spectra.
+                 If None, it will be determined from the mean spectrum.
+      edge_step: edge step, scalar or 1-d array of length nspectra.
+                 If None, it will be determined for each spectrum.
+      pre_edge_kws:  keyword arguments to pass to preedge()
+      kmin:      minimum k value   [0]
+      kmax:      maximum k value   [full data range].
+      kweight:   k weight for FFT.  [1]
+      dk:        FFT window window parameter.  [0.1]
+      win:       FFT window function name.     ['hanning']
+      nfft:      array size to use for FFT [2048]
+      kstep:     k step size to use for FFT [0.05]
+      k_std:     optional k array for standard chi(k).
+      chi_std:   optional chi array for standard chi(k).
+      nclamp:    number of energy end-points for clamp [4]
+      clamp_lo:  weight of low-energy clamp [1]
+      clamp_hi:  weight of high-energy clamp [1]
+      niter:     maximum number of Newton iterations [200]
+
+    Output arrays are written to the provided group, with
+    group.bkg, group.chie (nspectra, len(energy)),  group.chi
+    (nspectra, len(k)), and group.k, shared by all spectra.
+
+    Notes:
+    ------
+     This gives the same background as autobk() for each spectrum, but
+     builds the spline basis, regridding, and Fourier transform
+     operators once, and solves for the spline coefficients of all
+     spectra together.  Uncertainties in bkg and chi are not calculated.
+
+    Follows the 'First Argument Group' convention.
+    """
+    msg = _larch.writer.write
+    if 'kw' in kws:
+        kweight = kws.pop('kw')
+    if len(kws) > 0:
+        msg('Unrecognized arguments for autobk_many():\n')
+        msg('    %s\n' % (', '.join(kws.keys())))
+        return
+    energy, mu, group = parse_group_args(energy, members=('energy', 'mu'),
+                                         defaults=(mu,), group=group,
+                                         fcn_name='autobk_many')
+    if len(energy.shape) > 1:
+        energy = energy.squeeze()
+    mu = np.atleast_2d(mu)
+    energy = remove_dups(energy)
+    nspec = mu.shape[0]
+
+    group = set_xafsGroup(group, _larch=_larch)
+    if edge_step is None and isgroup(group, 'edge_step'):
+        edge_step = group.edge_step
+    if e0 is None and isgroup(group, 'e0'):
+        e0 = group.e0
+    if e0 is None or edge_step is None:
+        pre_kws = dict(nnorm=3, nvict=0, pre1=None,
+                       pre2=-50., norm1=100., norm2=None)
+        if pre_edge_kws is not None:
+            pre_kws.update(pre_edge_kws)
+        pre_dat = preedge(energy, mu.mean(axis=0), e0=e0, **pre_kws)
+        if e0 is None:
+            e0 = pre_dat['e0']
+        if edge_step is None:
+            edge_step = _edge_steps(energy, mu, e0, pre_dat)
+    edge_step = edge_step*np.ones(nspec)
+
+    # energy grid, k grids, and FT window, as for autobk()
+    ie0 = index_of(energy, e0)
+    rgrid = np.pi/(kstep*nfft)
+    if rbkg < 2*rgrid: rbkg = 2*rgrid
+    irbkg = int(1.01 + rbkg/rgrid)
+
+    enpe = energy[ie0:] - e0
+    kraw = np.sign(enpe)*np.sqrt(ETOK*abs(enpe))
+    if kmax is None:
+        kmax = max(kraw)
+    else:
+        kmax = max(0, min(max(kraw), kmax))
+    kout  = kstep * np.arange(int(1.01+kmax/kstep), dtype='float64')
+    iemax = min(len(energy), 2+index_of(energy, e0+kmax*kmax/ETOK)) - 1
+    nraw = iemax-ie0+1
+    kraw = kraw[:nraw]
+    mraw = mu[:, ie0:iemax+1]
+
+    if chi_std is not None and k_std is not None:
+        chi_std = np.interp(kout, k_std, chi_std)
+    ftwin = kout**kweight * ftwindow(kout, xmin=kmin, xmax=kmax,
+                                     window=win, dx=dk, dx2=dk)
+
+    # knots are shared, initial knot values are per spectrum
+    nspl = max(5, min(64, int(2*rbkg*(kmax-kmin)/np.pi) + 2))
+    spl_k, spl_e = np.zeros(nspl), np.zeros(nspl)
+    spl_y = np.zeros((nspec, nspl))
+    for i in range(nspl):
+        q  = kmin + i*(kmax-kmin)/(nspl - 1)
+        ik = index_nearest(kraw, q)
+        i1 = min(len(kraw)-1, ik + 5)
+        i2 = max(0, ik - 5)
+        spl_k[i] = kraw[ik]
+        spl_e[i] = energy[ik+ie0]
+        spl_y[:, i] = (2*mu[:, ik+ie0] + mu[:, i1+ie0] + mu[:, i2+ie0]) / 4.0
+
+    knots, coefs, order = splrep(spl_k, spl_y.mean(axis=0))
+    init_coefs = np.linalg.solve(spline_basis(spl_k, knots, order, nspl),
+                                 spl_y.T).T
+
+    ops = autobk_operators(kraw, mraw, knots, order, nspl, kout, ftwin,
+                           irbkg, nfft=nfft, chi_std=chi_std,
+                           kweight=kweight, nclamp=nclamp,
+                           clamp_lo=clamp_lo, clamp_hi=clamp_hi)
+
+    coefs, nfev, converged = clamped_lsq(init_coefs, ops.amat, ops.yvec,
+                                         cmat=ops.cmat, cvec=ops.cvec,
+                                         nclamp=nclamp, niter=niter)
+    if not converged:
+        msg('autobk_many(): fit did not converge in %d iterations\n' % nfev)
+
+    bkg = coefs.dot(ops.basis.T)
+    chi = ops.zvec - coefs.dot(ops.pmat.T)
+    if chi_std is not None:
+        chi = chi + chi_std
+    obkg = np.copy(mu)
+    obkg[:, ie0:ie0+nraw] = bkg
+
+    group.bkg  = obkg
+    group.chie = (mu-obkg)/edge_step[:, None]
+    group.k    = kout
+    group.chi  = chi/edge_step[:, None]
+    group.e0   = e0
+    group.edge_step = edge_step
+
+    init_bkg = np.copy(mu)
+    init_bkg[:, ie0:ie0+nraw] = init_coefs.dot(ops.basis.T)
+    details = Group(knots_e=spl_e, knots_y=coefs, init_knots_y=spl_y,
+                    init_bkg=init_bkg, nfev=nfev, converged=converged,
+                    kmin=kmin, kmax=kmax)
+    group.autobk_many_details = details
+
+def _edge_steps(energy, mu, e0, pre_dat):
+    """edge steps for each row of a 2-d mu, using the fit ranges
+    found by preedge() for the mean spectrum"""
+    nvict, nnorm = pre_dat['nvict'], pre_dat['nnorm']
+    omu = mu*energy**nvict
+    ie0 = index_nearest(energy, e0)
+    ee0 = energy[ie0]
+
+    p1 = index_of(energy, pre_dat['pre1']+e0)
+    p2 = index_nearest(energy, pre_dat['pre2']+e0)
+    if p2-p1 < 2:
+        p2 = min(len(energy), p1 + 2)
+    precoefs = np.polyfit(energy[p1:p2], omu[:, p1:p2].T, 1)
+
+    p1 = index_of(energy, pre_dat['norm1']+e0)
+    p2 = index_nearest(energy, pre_dat['norm2']+e0)
+    if p2-p1 < 2:
+        p2 = min(len(energy), p1 + 2)
+    postcoefs = np.polyfit(energy[p1:p2], omu[:, p1:p2].T, nnorm)
+
+    pre  = np.polyval(precoefs, ee0) * ee0**(-nvict)
+    post = np.polyval(postcoefs, ee0) * ee0**(-nvict)
+    return post - pre
+
 def registerLarchPlugin():
-    return ('_xafs', {'autobk': autobk})
+    return ('_xafs', {'autobk': autobk, 'autobk_many': autobk_many})
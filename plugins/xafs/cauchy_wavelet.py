@@ -23,24 +23,81 @@
 # 2014-Apr M Newville : translated to Python for Larch
 
 import numpy as np
+from scipy.fftpack import fft, ifft
 from larch import ValidateLarchPlugin, parse_group_args
 from larch.utils import complex_phase
 from larch_plugins.xafs import set_xafsGroup
 
+# cache of filter banks, keyed by (kstep, nfft, rmax, dtype)
+_FILTER_BANKS = {}
+
+# number of R values transformed together, small enough that the
+# work array stays in cache
+ROW_BLOCK = 16
+
+def cauchy_filters(kstep=0.05, nfft=2048, rmax=10, dtype='float64'):
+    """
+    R values and bank of Cauchy wavelet filters, one row for each R value.
+
+    Parameters:
+    -----------
+      kstep:    k step of chi(k)
+      nfft:     value to use for N_fft (2048).
+      rmax:     highest R value (10 Ang)
+      dtype:    precision of the filters ('float64')
+
+    Returns:
+    ---------
+      r, filters  -- 1-d array of R, and 2-d array of shape (len(r), nfft)
+
+    The filter banks are cached by (kstep, nfft, rmax, dtype), and
+    should not be altered.
+    """
+    key = (kstep, nfft, rmax, np.dtype(dtype).name)
+    if key not in _FILTER_BANKS:
+        if len(_FILTER_BANKS) > 7:
+            _FILTER_BANKS.clear()
+        rstep = (np.pi/2048)/kstep
+        rmin = 1.e-7
+        nrpts = int(np.round((rmax-rmin)/rstep))
+
+        # FT parameters
+        freq = (1.0/kstep)*np.arange(nfft)/(2*nfft)
+        omega = 2*np.pi*freq
+
+        # scale parameter
+        r  = np.linspace(0, rmax, nrpts)
+        r[0] = 1.e-19
+        a  = nrpts/(2*r)
+
+        # Characteristic values for Cauchy wavelet:
+        cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
+
+        aom = a[:, None]*omega[None, :]
+        aom[np.where(aom==0)] = 1.e-19
+        filters = np.exp(cauchy_sum + nrpts*np.log(aom) - aom)
+        _FILTER_BANKS[key] = (r, filters.astype(dtype))
+    return _FILTER_BANKS[key]
+
 @ValidateLarchPlugin
 def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
-                   nfft=2048, _larch=None):
+                   nfft=2048, rmin_out=0, kmin_out=None, kmax_out=None,
+                   dtype='float64', _larch=None):
     """
     Cauchy Wavelet Transform for XAFS, following work of Munoz, Argoul, and Farges
 
     Parameters:
     -----------
       k:        1-d array of photo-electron wavenumber in Ang^-1 or group
-      chi:      1-d array of chi
+      chi:      1-d array of chi, or 2-d array of shape (nspectra, len(k))
       group:    output Group
       rmax_out: highest R for output data (10 Ang)
       kweight:  exponent for weighting spectra by k**kweight
       nfft:     value to use for N_fft (2048).
+      rmin_out: lowest R for output data (0 Ang)
+      kmin_out: lowest k for output data [None, k[0]]
+      kmax_out: highest k for output data [None, k[-1]]
+      dtype:    precision of output, 'float64' or 'float32' ['float64']
 
       Returns:
     ---------
@@ -50,11 +107,19 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
     -------
     Arrays written to output group:
     r                  uniform array of R, out to rmax_out.
+    wcauchy_k          array of k for the output wavelet
     wcauchy            complex cauchy wavelet(k, R)
     wcauchy_mag        magnitude of wavelet(k, R)
     wcauchy_re         real part of wavelet(k, R)
     wcauchy_im         imaginary part of wavelet(k, R)
 
+    For 2-d chi, the wavelet arrays have shape (nspectra, len(r),
+    len(wcauchy_k)).
+
+    The bank of wavelet filters is cached by (kstep, nfft, rmax_out), and
+    the inverse FFTs are done for blocks of R values.  A 2-d chi gives
+    the same results as transforming each spectrum in turn.
+
     Supports First Argument Group convention (with group
     member names 'k' and 'chi')
 
@@ -64,53 +129,58 @@ def cauchy_wavelet(k, chi=None, group=None, kweight=0, rmax_out=10,
                                      fcn_name='cauchy_wavelet')
 
     kstep = np.round(1000.*(k[1]-k[0]))/1000.0
-    rstep = (np.pi/2048)/kstep
-    rmin = 1.e-7
-    rmax = rmax_out
-    nrpts = int(np.round((rmax-rmin)/rstep))
     nkout = len(k)
+    chi = np.asarray(chi)
+    is_2d = len(chi.shape) > 1
+    chi = np.atleast_2d(chi)
+    nspec = chi.shape[0]
     if kweight != 0:
         chi = chi * k**kweight
 
     # extend EXAFS to 1024 data points...
     NFT = int(nfft/2)
-    if len(k) < NFT:
-        knew = np.arange(NFT) * kstep
-        xnew = np.zeros(NFT) * kstep
-        xnew[:len(k)] = chi
+    xnew = np.zeros((nspec, NFT))
+    npts = min(NFT, nkout)
+    xnew[:, :npts] = chi[:, :npts]
+    nkout = min(nkout, 2*nfft)
+
+    # output ranges
+    if dtype in ('float32', np.float32):
+        dtype, ctype = 'float32', 'complex64'
     else:
-        knew = k[:NFT]
-        xnew = chi[:NFT]
-
-    # FT parameters
-    freq = (1.0/kstep)*np.arange(nfft)/(2*nfft)
-    omega = 2*np.pi*freq
+        dtype, ctype = 'float64', 'complex128'
+    r, filters = cauchy_filters(kstep, nfft=nfft, rmax=rmax_out, dtype=dtype)
+    irmin = int(np.searchsorted(r, rmin_out))
+    filters = filters[irmin:]
+    ikmin, ikmax = 0, nkout
+    if kmin_out is not None:
+        ikmin = int(np.searchsorted(k[:nkout], kmin_out))
+    if kmax_out is not None:
+        ikmax = int(np.searchsorted(k[:nkout], kmax_out, side='right'))
 
     # simple FT calculation
-    tff = np.fft.fft(xnew, n= 2*nfft)
-
-    # scale parameter
-    r  = np.linspace(0, rmax, nrpts)
-    r[0] = 1.e-19
-    a  = nrpts/(2*r)
-
-    # Characteristic values for Cauchy wavelet:
-    cauchy_sum = np.log(2*np.pi) - np.log(1.0+np.arange(nrpts)).sum()
-
-    # Main calculation:
-    out = np.zeros(nkout*nrpts,
-                   dtype='complex128').reshape(nrpts, nkout)
-    for i in range(nrpts):
-        aom = a[i]*omega
-        aom[np.where(aom==0)] = 1.e-19
-        filt = cauchy_sum + nrpts*np.log(aom) - aom
-        tmp  = np.conj(np.exp(filt))*tff[:nfft]
-        out[i, :] = np.fft.ifft(tmp, 2*nfft)[:nkout]
+    tff = fft(xnew, n=2*nfft, axis=-1)[:, :nfft].astype(ctype)
+
+    # Main calculation, one spectrum and a block of R values at a time,
+    # with the zero-padding of the work array done in place
+    nrpts = filters.shape[0]
+    out = np.zeros((nspec, nrpts, ikmax-ikmin), dtype=ctype)
+    work = np.zeros((min(ROW_BLOCK, nrpts), 2*nfft), dtype=ctype)
+    for i in range(nspec):
+        for j in range(0, nrpts, ROW_BLOCK):
+            tmp = work[:min(ROW_BLOCK, nrpts-j)]
+            np.multiply(filters[j:j+ROW_BLOCK], tff[i], out=tmp[:, :nfft])
+            tmp[:, nfft:] = 0
+            out[i, j:j+ROW_BLOCK] = ifft(tmp, axis=-1,
+                                         overwrite_x=True)[:, ikmin:ikmax]
+    if not is_2d:
+        out = out[0]
 
     group = set_xafsGroup(group, _larch=_larch)
-    group.r  =  r
+    group.r  =  r[irmin:]
+    group.wcauchy_k = k[ikmin:ikmax]
     group.wcauchy =  out
-    group.wcauchy_mag =  np.sqrt(out.real**2 + out.imag**2)
+    group.wcauchy_mag =  abs(out)
     group.wcauchy_re =  out.real
     group.wcauchy_im =  out.imag
 
@@ -2,6 +2,7 @@
 import time
 import numpy as np
 from scipy.special import erfc
+from scipy.signal import fftconvolve
 
 from larch import Group
 from larch.utils import interp
@@ -78,7 +79,7 @@ def kkmclf_sca(e, finp):
     fout = [0.0]*npts
     if npts >= 2:
         factor = FOPI * (e[npts-1] - e[0]) / (npts - 1)
-        nptsk = npts / 2
+        nptsk = int(npts / 2)
         for i in range(npts):
             fout[i] = 0.0
             ei2 = e[i]*e[i]
@@ -113,7 +114,7 @@ def kkmclr_sca(e, finp):
     fout = [0.0]*npts
 
     factor = -FOPI * (e[npts-1] - e[0]) / (npts - 1)
-    nptsk  = npts / 2
+    nptsk  = int(npts / 2)
     for i in range(npts):
         fout[i] = 0.0
         ei2 = e[i]*e[i]
@@ -200,6 +201,85 @@ def kkmclr(e, finp):
     return fout
 
 
+###
+###  These are FFT forms of the MacLaurin series algorithm.  On an even grid
+###  e[j] = e[0] + j*h, the sums over alternate points can be split with
+###      1/(e[j]**2 - e[i]**2) = (1/(e[j]-e[i]) - 1/(e[j]+e[i])) / (2*e[i])
+###      e[j]/(e[j]**2 - e[i]**2) = (1/(e[j]-e[i]) + 1/(e[j]+e[i])) / 2
+###  into two sums whose kernels depend only on j-i and on i+j, so that
+###  each is a convolution, done with FFTs in O(N log N).
+###
+
+def _kk_sums(e, finp):
+    """
+    sums over points j of opposite parity to i of
+       finp[j]/(e[j]-e[i])   and   finp[j]/(e[j]+e[i])
+    for an even grid, calculated as convolutions with FFTs.
+    """
+    npts  = len(e)
+    estep = (e[-1] - e[0]) / (npts-1)
+    offs  = np.arange(-(npts-1), npts)
+    odd   = (offs % 2 != 0)
+
+    # kernel for e[j]-e[i] = (j-i)*estep, indexed by i-j
+    kdiff = np.zeros(len(offs))
+    kdiff[odd] = -1.0/(offs[odd]*estep)
+    sdiff = fftconvolve(finp, kdiff)[npts-1:2*npts-1]
+
+    # kernel for e[j]+e[i] = 2*e[0] + (i+j)*estep, indexed by i+j,
+    # applied to the reversed input
+    ipj  = np.arange(2*npts-1)
+    odd  = (ipj % 2 != 0)
+    ksum = np.zeros(len(ipj))
+    ksum[odd] = 1.0/(2*e[0] + ipj[odd]*estep)
+    ssum = fftconvolve(finp[::-1], ksum)[npts-1:2*npts-1]
+    return sdiff, ssum
+
+def kkmclf_fft(e, finp):
+    """
+    forward (f'->f'') kk transform, using maclaurin series algorithm
+    with FFT convolutions
+
+    arguments:
+      e      energy array *must be on an even grid with an even number of points* [npts] (in)
+      finp   f' array [npts] (in)
+      fout   f'' array [npts] (out)
+    """
+    npts = len(e)
+    if npts != len(finp):
+        raise ValueError("Input arrays not of same length for diff KK transform in kkmclf_fft")
+    if npts < 2:
+        raise ValueError("Array too short for diff KK transform in kkmclf_fft")
+    if npts % 2:
+        raise ValueError("Array has an odd number of elements for diff KK transform in kkmclf_fft")
+
+    factor = FOPI * (e[-1] - e[0]) / (npts-1)
+    sdiff, ssum = _kk_sums(e, np.asarray(finp, dtype='float64'))
+    return factor * (sdiff - ssum) / 2.0
+
+def kkmclr_fft(e, finp):
+    """
+    reverse (f''->f') kk transform, using maclaurin series algorithm
+    with FFT convolutions
+
+    arguments:
+      e      energy array *must be on an even grid with an even number of points* [npts] (in)
+      finp   f'' array [npts] (in)
+      fout   f' array [npts] (out)
+    """
+    npts = len(e)
+    if npts != len(finp):
+        raise ValueError("Input arrays not of same length for diff KK transform in kkmclr_fft")
+    if npts < 2:
+        raise ValueError("Array too short for diff KK transform in kkmclr_fft")
+    if npts % 2:
+        raise ValueError("Array has an odd number of elements for diff KK transform in kkmclr_fft")
+
+    factor = -FOPI * (e[-1] - e[0]) / (npts-1)
+    sdiff, ssum = _kk_sums(e, np.asarray(finp, dtype='float64'))
+    return factor * (sdiff + ssum) / 2.0
+
+
 class diffKKGroup(Group):
     """
     A Larch Group for generating f'(E) and f"(E) from a XAS measurement of mu(E).
@@ -225,7 +305,7 @@ class diffKKGroup(Group):
 
 
 # e0=None, z=None, edge=None, order=3, form='mback', whiteline=False, how=None
-    def kk(self, energy=None, mu=None, z=None, edge='K', how='scalar', mback_kws=None):
+    def kk(self, energy=None, mu=None, z=None, edge='K', how='fft', mback_kws=None):
         """
         Convert mu(E) data into f'(E) and f"(E).  f"(E) is made by
         matching mu(E) to the tabulated values of the imaginary part
@@ -238,6 +318,7 @@ class diffKKGroup(Group):
             mu:         array with mu(E) data
             z:          Z number of absorber
             edge:       absorption edge, usually 'K' or 'L3'
+            how:        KK engine, one of 'fft', 'vector', or 'scalar' ['fft']
             mback_kws:  arguments for the mback algorithm
 
           Returns
@@ -280,10 +361,13 @@ class diffKKGroup(Group):
         fpp = interp(self.energy, self.f2-self.fpp, self.grid, fill_value=0.0)
 
         ## do difference KK
-        if repr(how).startswith('sca'):
+        how = str(how).lower()
+        if how.startswith('sca'):
             fp = kkmclr_sca(self.grid, fpp)
-        else:
+        elif how.startswith('vec'):
             fp = kkmclr(self.grid, fpp)
+        else:
+            fp = kkmclr_fft(self.grid, fpp)
 
         ## interpolate back to original grid and add diffKK result to f1 to make fp array
         self.fp = self.f1 + interp(self.grid, fp, self.energy, fill_value=0.0)
@@ -429,6 +429,199 @@ class FeffPathGroup(Group):
         self.chi = cchi.imag
         self.chi_imag = -cchi.real
 
+class FeffPathStack(object):
+    """A list of FeffPath Groups packed into 2-d arrays (npaths, nk)
+    so that chi(k) for all paths is calculated with one set of array
+    operations.
+
+    The interpolated Feff tables (pha, amp, rep, lam) for each path are
+    cached, keyed by that path's e0 and the k grid, so that they are only
+    re-interpolated when e0 for that path or the k grid changes.
+
+    A pickled FeffPathStack keeps the Feff tables but not the Path Groups,
+    so that it can be sent to a worker process.  There, values for the
+    path parameters must be passed to calc_chi() and calc_dchi().
+    """
+    def __init__(self, pathlist, k=None, _larch=None):
+        self.pathlist = pathlist
+        self._larch = _larch
+        self.npaths = len(pathlist)
+        self.reff = np.array([p._feffdat.reff for p in pathlist])
+        self.splines = []
+        for path in pathlist:
+            if path.spline_coefs is None:
+                path.create_spline_coefs()
+            self.splines.append(path.spline_coefs)
+        self.k = None
+        if k is not None:
+            self.set_k(k)
+
+    def __getstate__(self):
+        "pickle without the Path Groups or larch interpreter"
+        state = self.__dict__.copy()
+        state['pathlist'] = None
+        state['_larch'] = None
+        return state
+
+    def set_k(self, k):
+        """set k grid, resetting cached tables if it has changed"""
+        k = np.asarray(k, dtype='float64')
+        if (self.k is not None and len(k) == len(self.k) and
+            np.all(k == self.k)):
+            return
+        self.k = k.copy()
+        shape = (self.npaths, len(k))
+        self.q   = np.zeros(shape)
+        self.pha = np.zeros(shape)
+        self.amp = np.zeros(shape)
+        self.rep = np.zeros(shape)
+        self.lam = np.zeros(shape)
+        self._e0 = [None]*self.npaths
+        # derivatives of Feff tables with respect to q, for calc_dchi()
+        self.dpha = np.zeros(shape)
+        self.damp = np.zeros(shape)
+        self.drep = np.zeros(shape)
+        self.dlam = np.zeros(shape)
+        self._de0 = [None]*self.npaths
+
+    def _update_tables(self, e0):
+        """interpolate Feff tables for paths whose e0 has changed"""
+        k2 = self.k*self.k
+        for i, splines in enumerate(self.splines):
+            if e0[i] == self._e0[i]:
+                continue
+            en = k2 - e0[i]*ETOK
+            if min(abs(en)) < SMALL:
+                en[np.where(abs(en) < 2*SMALL)] = SMALL
+            q = np.sign(en)*np.sqrt(abs(en))
+            self.q[i]   = q
+            self.pha[i] = splines['pha'](q)
+            self.amp[i] = splines['amp'](q)
+            self.rep[i] = splines['rep'](q)
+            self.lam[i] = splines['lam'](q)
+            self._e0[i] = e0[i]
+
+    def _update_dtables(self, e0):
+        """interpolate q-derivatives of Feff tables for paths whose
+        e0 has changed.  The tables must already be up to date."""
+        for i, splines in enumerate(self.splines):
+            if e0[i] == self._de0[i]:
+                continue
+            q = self.q[i]
+            self.dpha[i] = splines['pha'](q, 1)
+            self.damp[i] = splines['amp'](q, 1)
+            self.drep[i] = splines['rep'](q, 1)
+            self.dlam[i] = splines['lam'](q, 1)
+            self._de0[i] = e0[i]
+
+    def path_params(self):
+        """evaluate path parameters for all paths, returning a 2-d array
+        with columns (degen, s02, e0, ei, deltar, sigma2, third, fourth)"""
+        out = np.zeros((self.npaths, len(PATH_PARS)))
+        for i, path in enumerate(self.pathlist):
+            pars = path.path_paramvals()
+            out[i] = [pars[name] for name in PATH_PARS]
+        return out
+
+    def calc_chi(self, k=None, kmax=None, kstep=0.05, set_paths=True,
+                 pars=None):
+        """calculate chi(k) for all paths, returning the sum of chi(k).
+
+        With set_paths=True, the arrays k, p, chi, and chi_imag are
+        also set for each path, as from FeffPathGroup._calc_chi().
+
+        pars can be an array of path parameter values, as returned by
+        path_params(), to use instead of evaluating the path parameters.
+        """
+        if k is None and self.k is None:
+            if kmax is None:
+                kmax = 30.0
+            for path in self.pathlist:
+                kmax = min(max(path._feffdat.k), kmax)
+            if kstep is None: kstep = 0.05
+            k = kstep * np.arange(int(1.01 + kmax/kstep), dtype='float64')
+        if k is not None:
+            self.set_k(k)
+
+        if pars is None:
+            pars = self.path_params()
+        pars = self.pars = np.asarray(pars, dtype='float64')
+        self._update_tables(pars[:, 2])
+        degen, s02, e0, ei, deltar, sigma2, third, fourth = \
+               [col[:, None] for col in pars.T]
+        reff = self.reff[:, None]
+        ok = self.reff >= 0.05
+
+        # p = complex wavenumber, and its square:
+        pp = (self.rep + 1j/self.lam)**2 + 1j * ei * ETOK
+        p  = np.sqrt(pp)
+
+        # the xafs equation, without the amplitude factors
+        # (degen, s02, amp) which are kept for calc_dchi():
+        uchi = np.exp(-2*reff*p.imag - 2*pp*(sigma2 - pp*fourth/3) +
+                      1j*(2*self.q*reff + self.pha +
+                          2*p*(deltar - 2*sigma2/reff - 2*pp*third/3) ))
+        uchi = uchi / (self.q*(reff + deltar)**2)
+
+        cchi = degen * s02 * self.amp * uchi
+        cchi[:, 0] = 2*cchi[:, 1] - cchi[:, 2]
+        if not all(ok):
+            if self._larch is not None:
+                self._larch.writer.write('reff is too small to calculate chi(k)')
+            cchi[~ok] = 0
+        self.pp, self.p, self.uchi = pp, p, uchi
+        self.cchi = cchi
+        if set_paths:
+            for i, path in enumerate(self.pathlist):
+                path.k = self.k
+                path.p = p[i]
+                path.chi = cchi[i].imag
+                path.chi_imag = -cchi[i].real
+        return cchi.imag.sum(axis=0)
+
+    def calc_dchi(self, pars=None):
+        """calculate the derivatives of the complex chi(k) for each path
+        with respect to each path parameter, for the current values of
+        the path parameters or for pars, as for calc_chi().
+
+        Returns a complex array of shape (npaths, 8, nk), with the
+        derivatives ordered as (degen, s02, e0, ei, deltar, sigma2,
+        third, fourth).  The derivatives of chi(k) are the imaginary part.
+        """
+        self.calc_chi(set_paths=False, pars=pars)
+        degen, s02, e0, ei, deltar, sigma2, third, fourth = \
+               [col[:, None] for col in self.pars.T]
+        reff = self.reff[:, None]
+        ok = self.reff >= 0.05
+        self._update_dtables(self.pars[:, 2])
+        pp, p, q, amp = self.pp, self.p, self.q, self.amp
+
+        def dexpon(dpp):
+            "derivative of the exponent, given the derivative of p**2"
+            dp = dpp/(2*p)
+            return (-2*reff*dp.imag - 2*dpp*(sigma2 - 2*pp*fourth/3) +
+                    2j*dp*(deltar - 2*sigma2/reff - 2*pp*third/3) -
+                    4j*p*dpp*third/3)
+
+        cchi = degen * s02 * amp * self.uchi
+        out = np.zeros((self.npaths, len(PATH_PARS), len(self.k)),
+                       dtype='complex128')
+        out[:, 0] = s02 * amp * self.uchi
+        out[:, 1] = degen * amp * self.uchi
+        # e0 shifts q, and so the Feff tables
+        dq = -ETOK/(2*abs(q))
+        dpp = 2*(self.rep + 1j/self.lam)*(self.drep - 1j*self.dlam/self.lam**2)
+        out[:, 2] = degen * s02 * self.uchi * dq * (
+            self.damp + amp*(dexpon(dpp) - 1/q + 1j*(2*reff + self.dpha)))
+        out[:, 3] = cchi * dexpon(1j*ETOK)
+        out[:, 4] = cchi * (2j*p - 2/(reff + deltar))
+        out[:, 5] = cchi * (-2*pp - 4j*p/reff)
+        out[:, 6] = cchi * (-4j*p*pp/3)
+        out[:, 7] = cchi * (2*pp*pp/3)
+        out[:, :, 0] = 2*out[:, :, 1] - out[:, :, 2]
+        out[~ok] = 0
+        return out
+
 @ValidateLarchPlugin
 def _path2chi(path, paramgroup=None, _larch=None, **kws):
     """calculate chi(k) for a Feff Path,
@@ -457,7 +650,7 @@ def _path2chi(path, paramgroup=None, _larch=None, **kws):
 
 @ValidateLarchPlugin
 def _ff2chi(pathlist, group=None, paramgroup=None, _larch=None,
-            k=None, kmax=None, kstep=0.05, **kws):
+            k=None, kmax=None, kstep=0.05, pathstack=None, **kws):
     """sum chi(k) for a list of FeffPath Groups.
 
     Parameters:
@@ -467,33 +660,36 @@ def _ff2chi(pathlist, group=None, paramgroup=None, _larch=None,
       kmax:        maximum k value for chi calculation [20].
       kstep:       step in k value for chi calculation [0.05].
       k:           explicit array of k values to calculate chi.
+      pathstack:   FeffPathStack for pathlist, holding cached Feff
+                   tables from earlier calls [None]
     Returns:
     ---------
        group contain arrays for k and chi
 
-    This essentially calls path2chi() for each of the paths in the
-    pathlist and writes the resulting arrays to group.k and group.chi.
+    This calculates chi(k) for all the paths in the pathlist together
+    (as with path2chi() for each path), writes chi(k) for each path to
+    its path group, and writes the sum to group.k and group.chi.
 
+    If pathstack is given, the path parameters are assumed to have
+    already been created, as by FeffitDataSet.prepare_fit().
     """
     params = group2params(paramgroup, _larch=_larch)
 
     msg = _larch.writer.write
-    for path in pathlist:
-        if not isNamedClass(path, FeffPathGroup):
-            msg('%s is not a valid Feff Path' % path)
-            return
-        path.create_path_params()
-        path._calc_chi(k=k, kstep=kstep, kmax=kmax)
-    k = pathlist[0].k[:]
-    out = np.zeros_like(k)
-    for path in pathlist:
-        out += path.chi
+    if pathstack is None:
+        for path in pathlist:
+            if not isNamedClass(path, FeffPathGroup):
+                msg('%s is not a valid Feff Path' % path)
+                return
+            path.create_path_params()
+        pathstack = FeffPathStack(pathlist, _larch=_larch)
+    out = pathstack.calc_chi(k=k, kstep=kstep, kmax=kmax)
 
     if group is None:
         group = Group()
     else:
         group = set_xafsGroup(group, _larch=_larch)
-    group.k = k
+    group.k = pathstack.k[:]
     group.chi = out
     return group
 
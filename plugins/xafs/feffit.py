@@ -5,10 +5,14 @@
 from collections import Iterable
 from copy import copy, deepcopy
 from functools import partial
+import multiprocessing
+import traceback
+import six
 import numpy as np
 from numpy import array, arange, interp, pi, zeros, sqrt, concatenate
 
 from scipy import constants
+from scipy.fftpack import fft, ifft
 from scipy.optimize import leastsq as scipy_leastsq
 
 from lmfit import Parameters, Parameter, Minimizer, fit_report
@@ -17,10 +21,12 @@ from larch import (Group, isParameter, ValidateLarchPlugin, isNamedClass)
 
 from larch.utils import index_of, realimag, complex_phase
 from larch_plugins.xafs import (xftf_fast, xftr_fast, ftwindow,
-                                set_xafsGroup, FeffPathGroup, _ff2chi)
+                                set_xafsGroup, FeffPathGroup, FeffPathStack,
+                                _ff2chi)
 
-from larch_plugins.xafs.sigma2_models import sigma2_correldebye, sigma2_debye
-from larch_plugins.xafs.feffdat import PATHPAR_FMT
+from larch_plugins.xafs.sigma2_models import (sigma2_correldebye, sigma2_debye,
+                                              sigma2_debye_feffdat)
+from larch_plugins.xafs.feffdat import PATHPAR_FMT, PATH_PARS
 # use larch's uncertainties package
 from larch.fitting import (correlated_values, eval_stderr,
                            group2params, params2group)
@@ -28,13 +34,12 @@ from larch.fitting import (correlated_values, eval_stderr,
 class TransformGroup(Group):
     """A Group of transform parameters.
     The apply() method will return the result of applying the transform,
-    ready to use in a Fit.   This caches the FT windows (k and r windows)
-    and assumes that once created (not None), these do not need to be
-    recalculated....
+    ready to use in a Fit.
 
-    That is: don't simply change the parameters and expect different results.
-    If you do change parameters, reset kwin / rwin to None to cause them to be
-    recalculated.
+    The FT windows (k and r windows), the k-weighted k window, padded
+    work arrays, and the Cauchy wavelet filter bank are cached as a
+    'plan' for each set of transform parameters and k-weight, so that
+    changing any of the parameters will cause these to be recalculated.
     """
     def __init__(self, kmin=0, kmax=20, kweight=2, dk=4, dk2=None,
                  window='kaiser', nfft=2048, kstep=0.05,
@@ -70,6 +75,7 @@ class TransformGroup(Group):
 
         self.kwin = None
         self.rwin = None
+        self._plans = {}
         self.make_karrays()
 
     def __repr__(self):
@@ -108,6 +114,38 @@ class TransformGroup(Group):
         self.k_ = self.kstep * arange(self.nfft, dtype='float64')
         self.r_ = self.rstep * arange(self.nfft, dtype='float64')
 
+    def get_plan(self, kweight=None):
+        """return the cached transform plan for the current transform
+        parameters and kweight, creating it if needed.
+
+        The plan is a dictionary with the k window 'kwin', the r window
+        'rwin', the k window times k**kweight 'kwin_kw', and zero-padded
+        work arrays 'kbuff' and 'rbuff'.  Items for the Cauchy wavelet
+        transform are added by cwt().
+        """
+        self.make_karrays()
+        if kweight is None:
+            kweight = self.get_kweight()
+        key = (self.kmin, self.kmax, self.dk, self.dk2, self.window,
+               kweight, self.nfft, self.kstep, self.rmin, self.rmax,
+               self.dr, self.dr2, self.rwindow)
+        plan = self._plans.get(key, None)
+        if plan is None:
+            if len(self._plans) > 15:
+                self._plans = {}
+            kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
+                            dx=self.dk, dx2=self.dk2, window=self.window)
+            rwin = ftwindow(self.r_, xmin=self.rmin, xmax=self.rmax,
+                            dx=self.dr, dx2=self.dr2, window=self.rwindow)
+            plan = {'kwin': kwin, 'rwin': rwin,
+                    'kwin_kw': kwin * self.k_**kweight,
+                    'kbuff': zeros(self.nfft, dtype='complex128'),
+                    'rbuff': zeros(self.nfft, dtype='complex128')}
+            self._plans[key] = plan
+        self.kwin = plan['kwin']
+        self.rwin = plan['rwin']
+        return plan
+
     def _xafsft(self, chi, group=None, rmax_out=10, **kws):
         "returns "
         for key, val in kws:
@@ -140,88 +178,82 @@ class TransformGroup(Group):
     def fftf(self, chi, kweight=None):
         """ forward FT -- meant to be used internally.
         chi must be on self.k_ grid"""
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.kwin is None:
-            self.kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
-                                 dx=self.dk, dx2=self.dk2, window=self.window)
-        if kweight is None:
-            kweight = self.get_kweight()
-        cx = chi * self.kwin[:len(chi)] * self.k_[:len(chi)]**kweight
-        return xftf_fast(cx, kstep=self.kstep, nfft=self.nfft)
+        plan = self.get_plan(kweight=kweight)
+        nk = len(chi)
+        cx = plan['kbuff']
+        cx[:nk] = chi * plan['kwin_kw'][:nk]
+        cx[nk:] = 0
+        # as for xftf_fast(), using the padded work array of the plan
+        return (self.kstep/sqrt(pi)) * fft(cx, overwrite_x=True)[:int(self.nfft/2)]
 
     def fftr(self, chir):
         " reverse FT -- meant to be used internally"
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.rwin is None:
-            self.rwin = ftwindow(self.r_, xmin=self.rmin, xmax=self.rmax,
-                                 dx=self.dr, dx2=self.dr2, window=self.rwindow)
-
-        cx = chir * self.rwin[:len(chir)]
-        return xftr_fast(cx, kstep=self.kstep, nfft=self.nfft)
-
+        plan = self.get_plan()
+        nr = len(chir)
+        cx = plan['rbuff']
+        cx[:nr] = chir * plan['rwin'][:nr]
+        cx[nr:] = 0
+        # as for xftr_fast(), using the padded work array of the plan
+        return (4*sqrt(pi)/self.kstep) * ifft(cx, overwrite_x=True)[:int(self.nfft/2)]
 
     def make_cwt_arrays(self, nkpts, nrpts):
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
-        if self.kwin is None:
-            self.kwin = ftwindow(self.k_, xmin=self.kmin, xmax=self.kmax,
-                                 dx=self.dk, dx2=self.dk2, window=self.window)
-
-        if self._cauchymask is None:
-            if self.wavelet_mask is not None:
-                self._cauchymask = self.wavelet_mask
-            else:
-                ikmin = int(max(0, 0.01 + self.kmin/self.kstep))
-                ikmax = int(min(self.nfft/2,  0.01 + self.kmax/self.kstep))
-                irmin = int(max(0, 0.01 + self.rmin/self.rstep))
-                irmax = int(min(self.nfft/2,  0.01 + self.rmax/self.rstep))
-                cm = np.zeros(nrpts*nkpts, dtype='int').reshape(nrpts, nkpts)
-                cm[irmin:irmax, ikmin:ikmax] = 1
-                self._cauchymask = cm
-                self._cauchyslice =(slice(irmin, irmax), slice(ikmin, ikmax))
+        """set the mask and output slice for the Cauchy wavelet
+        transform for nkpts k points and nrpts R points, cached in
+        the current plan"""
+        plan = self.get_plan()
+        masks = plan.setdefault('cwt_masks', {})
+        if self.wavelet_mask is not None:
+            self._cauchymask = self.wavelet_mask
+            self._cauchyslice = (slice(0, nrpts), slice(0, nkpts))
+        elif (nkpts, nrpts) in masks:
+            self._cauchymask, self._cauchyslice = masks[(nkpts, nrpts)]
+        else:
+            ikmin = int(max(0, 0.01 + self.kmin/self.kstep))
+            ikmax = int(min(self.nfft/2,  0.01 + self.kmax/self.kstep))
+            irmin = int(max(0, 0.01 + self.rmin/self.rstep))
+            irmax = int(min(self.nfft/2,  0.01 + self.rmax/self.rstep))
+            cm = np.zeros(nrpts*nkpts, dtype='int').reshape(nrpts, nkpts)
+            cm[irmin:irmax, ikmin:ikmax] = 1
+            self._cauchymask = cm
+            self._cauchyslice =(slice(irmin, irmax), slice(ikmin, ikmax))
+            masks[(nkpts, nrpts)] = (self._cauchymask, self._cauchyslice)
+
+    def cwt_filters(self, nrpts):
+        """return the (nrpts, nfft) bank of Cauchy wavelet filters,
+        cached in the current plan"""
+        plan = self.get_plan()
+        filters = plan.get('cwt_filters', None)
+        if filters is None or filters.shape[0] != nrpts:
+            omega = pi*np.arange(self.nfft)/(self.kstep*self.nfft)
+            r = self.rstep * arange(nrpts)
+            r[0] = 1.e-19
+            alpha = nrpts/(2*r)
+            cauchy_sum = np.log(2*pi) - np.log(1.0+np.arange(nrpts)).sum()
+            aom = alpha[:, None]*omega[None, :]
+            filters = np.exp(cauchy_sum + nrpts*np.log(aom) - aom)
+            plan['cwt_filters'] = filters
+        return filters
 
     def cwt(self, chi, rmax=None, kweight=None):
         """cauchy wavelet transform -- meant to be used internally"""
-        if self.kstep != self.__kstep or self.nfft != self.__nfft:
-            self.make_karrays()
+        if rmax is not None:
+            self.rmax = rmax
+        plan = self.get_plan(kweight=kweight)
         nkpts = len(chi)
-        nrpts = int(np.round(self.rmax/self.rstep))
-        if self.kwin is None:
-            self.make_cwt_arrays(nkpts, nrpts)
-
-        omega = pi*np.arange(self.nfft)/(self.kstep*self.nfft)
 
         if kweight is None:
             kweight = self.get_kweight()
         if kweight != 0:
-            chi = chi * self.kwin[:len(chi)] * self.k_[:len(chi)]**kweight
-
-        if rmax is not None:
-            self.rmax = rmax
+            chi = chi * plan['kwin_kw'][:nkpts]
 
-        chix   = np.zeros(int(self.nfft/2)) * self.kstep
+        chix   = np.zeros(int(self.nfft/2))
         chix[:nkpts] = chi
-        chix   = chix[:int(self.nfft/2)]
-        _ffchi = np.fft.fft(chix, n=2*self.nfft)[:self.nfft]
+        _ffchi = fft(chix, n=2*self.nfft)[:self.nfft]
 
         nrpts = int(np.round(self.rmax/self.rstep))
-        r   = self.rstep * arange(nrpts)
-        r[0] = 1.e-19
-        alpha = nrpts/(2*r)
-
         self.make_cwt_arrays(nkpts, nrpts)
-
-        cauchy_sum = np.log(2*pi) - np.log(1.0+np.arange(nrpts)).sum()
-
-        out = np.zeros(nrpts*nkpts, dtype='complex128').reshape(nrpts, nkpts)
-
-        for i in range(nrpts):
-            aom = alpha[i]*omega
-            filt = cauchy_sum + nrpts*np.log(aom) - aom
-            out[i, :] = np.fft.ifft(np.exp(filt)*_ffchi, 2*self.nfft)[:nkpts]
-
+        filters = self.cwt_filters(nrpts)
+        out = ifft(filters*_ffchi, 2*self.nfft, axis=1)[:, :nkpts]
         return (out*self._cauchymask)[self._cauchyslice]
 
 class FeffitDataSet(Group):
@@ -243,6 +275,7 @@ class FeffitDataSet(Group):
         self.model.k = None
         self.__chi = None
         self.__prepared = False
+        self._pathstack = None
 
     def __repr__(self):
         return '<FeffitDataSet Group: %s>' % self.__name__
@@ -296,6 +329,10 @@ class FeffitDataSet(Group):
             if path.spline_coefs is None:
                 path.create_spline_coefs()
 
+        # all paths packed together, with Feff tables interpolated
+        # onto the model k grid cached between residual calls
+        self._pathstack = FeffPathStack(self.pathlist, k=self.model.k,
+                                        _larch=self._larch)
         self.__prepared = True
 
 
@@ -377,15 +414,73 @@ class FeffitDataSet(Group):
             self.prepare_fit()
 
         _ff2chi(self.pathlist, paramgroup=paramgroup, k=self.model.k,
-                _larch=self._larch, group=self.model)
+                _larch=self._larch, group=self.model,
+                pathstack=self._pathstack)
+
+        diff  = (self.__chi - self.model.chi)
+        if data_only:  # for extracting transformed data separately from residual
+            diff  = self.__chi
+        return self._transform(diff)
+
+    def _jacobian(self, params, paramgroup, var_names):
+        """return the Jacobian of the residual for this data set, with
+        shape (nresid, nvars) for the fit variables in var_names.
+
+        The derivatives of chi(k) for each path with respect to its path
+        parameters are calculated analytically and chained through the
+        path parameter and constraint expressions to the variables, then
+        put through the same (linear) transform as the residual.
+        """
+        if not self.__prepared:
+            self.prepare_fit()
+        pars = self._pathstack.path_params()
+        dpars = _pathpar_derivs(self._pathstack, params, paramgroup,
+                                var_names, pars)
+        return self._jacobian_pars(pars, dpars)
+
+    def _residual_pars(self, pars):
+        """return the residual for this data set for an array of path
+        parameter values, as from FeffPathStack.path_params()"""
+        self.model.chi = self._pathstack.calc_chi(pars=pars, set_paths=False)
+        return self._transform(self.__chi - self.model.chi)
+
+    def _jacobian_pars(self, pars, dpars):
+        """return the Jacobian of the residual for this data set for an
+        array of path parameter values and their derivatives with respect
+        to the fit variables, as from _pathpar_derivs()"""
+        dchi = self._pathstack.calc_dchi(pars=pars).imag
+        dmodel = np.einsum('ipk,ipj->jk', dchi, dpars)
+        return -np.array([self._transform(d) for d in dmodel]).T
+
+    def _worker_state(self):
+        """return picklable data needed to calculate the residual for
+        this data set in a worker process, without the larch interpreter
+        or the Path Groups"""
+        if not self.__prepared:
+            self.prepare_fit()
+        trans = copy(self.transform)
+        trans._larch = None
+        return dict(k=self.model.k, chi=self.__chi, transform=trans,
+                    epsilon_k=self.epsilon_k, epsilon_r=self.epsilon_r,
+                    pathstack=self._pathstack)
+
+    def _set_worker_state(self, state):
+        """set up a data set in a worker process from _worker_state()"""
+        self.transform = state['transform']
+        self.model.k = state['k']
+        self.__chi = state['chi']
+        self.epsilon_k = state['epsilon_k']
+        self.epsilon_r = state['epsilon_r']
+        self._pathstack = state['pathstack']
+        self.__prepared = True
 
+    def _transform(self, diff):
+        """apply the transform for the fit space to chi(k) on the
+        model k grid, scaled by the uncertainties"""
         eps_k = self.epsilon_k
         if isinstance(eps_k, np.ndarray):
             eps_k[np.where(eps_k<1.e-12)[0]] = 1.e-12
 
-        diff  = (self.__chi - self.model.chi)
-        if data_only:  # for extracting transformed data separately from residual
-            diff  = self.__chi
         trans = self.transform
         k     = trans.k_[:len(diff)]
 
@@ -441,6 +536,146 @@ class FeffitDataSet(Group):
             for p in self.pathlist:
                 xft(p.chi, group=p, rmax_out=rmax_out)
 
+def _pathpar_derivs(pathstack, params, paramgroup, var_names, pars0):
+    """derivatives of the path parameters for all paths in a FeffPathStack
+    with respect to the fit variables in var_names, given the current
+    path parameter values pars0 (from pathstack.path_params()).
+
+    Returns an array of shape (npaths, 8, nvars), with path parameters
+    ordered as for FeffPathStack.path_params().
+
+    Each variable is shifted in turn, and the constraint expressions and
+    path parameters are re-evaluated in the fiteval namespace, so that
+    the derivatives follow any user constraint expressions.
+    """
+    fiteval = pathstack._larch.symtable._sys.fiteval
+    out = np.zeros((pathstack.npaths, len(PATH_PARS), len(var_names)))
+    for j, name in enumerate(var_names):
+        par = params[name]
+        val = par.value
+        step = 1.e-7*max(abs(val), 1.e-3)
+        if val + step > par.max:
+            step = -step
+        par.value = val + step
+        params.update_constraints()
+        params2group(params, paramgroup)
+        _params2fiteval(params, fiteval)
+        out[:, :, j] = (pathstack.path_params() - pars0)/step
+        par.value = val
+    params.update_constraints()
+    params2group(params, paramgroup)
+    _params2fiteval(params, fiteval)
+    return out
+
+def _params2fiteval(params, fiteval):
+    """put the current values of Parameters into the fiteval namespace,
+    where the path parameters are evaluated.  The Parameters passed to
+    the residual and Jacobian functions by the Minimizer are a copy
+    which does not use fiteval."""
+    for name, par in params.items():
+        fiteval.symtable[name] = par.value
+
+def _feffit_worker(conn, states):
+    """worker process for feffit: rebuild data sets from their worker
+    states, then return residual or Jacobian blocks for each set of path
+    parameter values sent over conn until None is sent."""
+    datasets = []
+    for state in states:
+        ds = FeffitDataSet()
+        ds._set_worker_state(state)
+        datasets.append(ds)
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        task, args = msg
+        try:
+            if task == 'jacobian':
+                out = [ds._jacobian_pars(pars, dpars)
+                       for ds, (pars, dpars) in zip(datasets, args)]
+            else:
+                out = [ds._residual_pars(pars)
+                       for ds, pars in zip(datasets, args)]
+        except:
+            out = traceback.format_exc()
+        conn.send(out)
+    conn.close()
+
+class FeffitWorkers(object):
+    """persistent worker processes for a fit to several data sets.
+
+    The data sets are divided between the workers, each of which keeps
+    its data sets' k grid, data, transform and Feff tables.  For each
+    residual or Jacobian, the current Parameter values are put into the
+    fiteval namespace and the path parameters are evaluated here (they
+    may use any symbol in fiteval), and only their values are sent to
+    the workers.
+    """
+    def __init__(self, datasets, nworkers, _larch=None):
+        self.datasets = datasets
+        self.fiteval = _larch.symtable._sys.fiteval
+        nworkers = max(1, min(nworkers, len(datasets)))
+        self.groups = [list(range(len(datasets)))[i::nworkers]
+                       for i in range(nworkers)]
+        self.conns, self.procs = [], []
+        for group in self.groups:
+            states = [datasets[i]._worker_state() for i in group]
+            conn, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=_feffit_worker,
+                                           args=(child, states))
+            proc.daemon = True
+            proc.start()
+            child.close()
+            self.conns.append(conn)
+            self.procs.append(proc)
+
+    def _run(self, task, args):
+        "send args for each data set to the workers, gather the results"
+        for conn, group in zip(self.conns, self.groups):
+            conn.send((task, [args[i] for i in group]))
+        out = [None]*len(self.datasets)
+        errors = []
+        for conn, group in zip(self.conns, self.groups):
+            result = conn.recv()
+            if isinstance(result, six.string_types):
+                errors.append(result)
+                continue
+            for i, block in zip(group, result):
+                out[i] = block
+        if len(errors) > 0:
+            raise RuntimeError('feffit worker failed:\n%s' % errors[0])
+        return out
+
+    def residual(self, params):
+        "residual for all data sets, for the current Parameters"
+        _params2fiteval(params, self.fiteval)
+        pars = [ds._pathstack.path_params() for ds in self.datasets]
+        return concatenate(self._run('residual', pars))
+
+    def jacobian(self, params, paramgroup, var_names):
+        "Jacobian for all data sets, for the current Parameters"
+        _params2fiteval(params, self.fiteval)
+        args = []
+        for ds in self.datasets:
+            pars = ds._pathstack.path_params()
+            args.append((pars, _pathpar_derivs(ds._pathstack, params,
+                                               paramgroup, var_names, pars)))
+        return concatenate(self._run('jacobian', args))
+
+    def close(self):
+        "stop the worker processes"
+        for conn in self.conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except (IOError, OSError):
+                pass
+        for proc in self.procs:
+            proc.join(5)
+            if proc.is_alive():
+                proc.terminate()
+        self.conns, self.procs = [], []
+
 @ValidateLarchPlugin
 def feffit_dataset(data=None, pathlist=None, transform=None,
                    epsilon_k=None, _larch=None):
@@ -491,7 +726,8 @@ def feffit_transform(_larch=None, **kws):
     return TransformGroup(_larch=_larch, **kws)
 
 @ValidateLarchPlugin
-def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **kws):
+def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True,
+           jacobian=True, workers=1, _larch=None, **kws):
     """execute a Feffit fit: a fit of feff paths to a list of datasets
 
     Parameters:
@@ -500,6 +736,10 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
       datasets:     Feffit Dataset group or list of Feffit Dataset group.
       rmax_out:     maximum R value to calculate output arrays.
       path_output:  Flag to set whether all Path outputs should be written.
+      jacobian:     Flag to use the analytic Jacobian, rather than
+                    finite differences [True]
+      workers:      number of worker processes to use for calculating
+                    the residuals of the datasets [1]
 
     Returns:
     ---------
@@ -523,12 +763,26 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
     """
 
 
-    def _resid(params, datasets=None, paramgroup=None,
+    def _resid(params, datasets=None, paramgroup=None, workers=None,
                _larch=None, **kwargs):
         """ this is the residual function"""
         params2group(params, paramgroup)
+        if workers is not None:
+            return workers.residual(params)
         return concatenate([d._residual(paramgroup) for d in datasets])
 
+    def _jacobian(params, datasets=None, paramgroup=None, workers=None,
+                  _larch=None, **kwargs):
+        """ this is the Jacobian of the residual function"""
+        params2group(params, paramgroup)
+        _params2fiteval(params, _larch.symtable._sys.fiteval)
+        var_names = [name for name, par in params.items()
+                     if par.expr is None and par.vary]
+        if workers is not None:
+            return workers.jacobian(params, paramgroup, var_names)
+        return concatenate([d._jacobian(params, paramgroup, var_names)
+                            for d in datasets])
+
     if isNamedClass(datasets, FeffitDataSet):
         datasets = [datasets]
 
@@ -540,12 +794,20 @@ def feffit(paramgroup, datasets, rmax_out=10, path_outputs=True, _larch=None, **
             return
         ds.prepare_fit()
 
+    pool = None
+    if workers > 1 and len(datasets) > 1:
+        pool = FeffitWorkers(datasets, workers, _larch=_larch)
+
     fit = Minimizer(_resid, params,
-                    fcn_kws=dict(datasets=datasets,
-                                 paramgroup=paramgroup),
+                    fcn_kws=dict(datasets=datasets, paramgroup=paramgroup,
+                                 workers=pool, _larch=_larch),
                     scale_covar=True, **kws)
 
-    result = fit.leastsq()
+    try:
+        result = fit.leastsq(Dfun=_jacobian if jacobian else None)
+    finally:
+        if pool is not None:
+            pool.close()
 
     params2group(result.params, paramgroup)
     dat = concatenate([d._residual(paramgroup, data_only=True) for d in datasets])
@@ -807,24 +1069,7 @@ def sigma2_eins(t, theta):
 def sigma2_debye(t, theta):
     if feffpath is None:
          return 0.
-
-    if theta < 1.e-5: theta = 1.e-5
-    if t < 1.e-5:     t = 1.e-5
-
-    tempk  = float(t)
-    thetad = float(theta)
-
-    natoms = len(feffpath.geom)
-    rnorm  = feffpath.rnorman
-    atomx, atomy, atomz, atomm = [], [], [], []
-    for sym, iz, ipot, am, x, y, z in feffpath.geom:
-        atomx.append(x)
-        atomy.append(y)
-        atomz.append(z)
-        atomm.append(am)
-
-    return sigma2_correldebye(natoms, tempk, thetad, rnorm,
-                              atomx, atomy, atomz, atomm)
+    return sigma2_debye_feffdat(t, theta, feffpath)
 """
 
 def initializeLarchPlugin(_larch=None):
@@ -839,6 +1084,7 @@ def initializeLarchPlugin(_larch=None):
     add(('const_kboltz', constants.k))
     add(('const_amu', constants.atomic_mass))
     add(('sigma2_correldebye', sigma2_correldebye))
+    add(('sigma2_debye_feffdat', sigma2_debye_feffdat))
     add(sigma2xafs_)
 
 def registereLarchGroups():
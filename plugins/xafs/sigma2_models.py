@@ -16,6 +16,23 @@ EINS_FACTOR = 1.e20*consts.hbar**2/(2*consts.k*consts.atomic_mass)
 
 FEFF6LIB = None
 
+# constants for corrfn, as used by feff6 (see corrfn() below)
+CORRFN_CONH = 72.7630804732553
+CORRFN_CONR = 4.5693349700844
+
+# Gauss-Legendre nodes and weights on [0, 1] for debint_array().
+# The integrand is smooth and has at most ~rx/(2pi) oscillations on
+# [0, 1], so 64 nodes agree with the Romberg integration of debint()
+# to better than 1.e-9 for distances up to ~20 Ang and theta/T < 100.
+DEBINT_NODES, DEBINT_WEIGHTS = np.polynomial.legendre.leggauss(64)
+DEBINT_NODES   = (DEBINT_NODES + 1.0)/2.0
+DEBINT_WEIGHTS = DEBINT_WEIGHTS/2.0
+
+# cache of correlated Debye sigma2 values, keyed by
+# (temperature, Debye temperature, Norman radius, path geometry)
+SIGMA2_CACHE = {}
+SIGMA2_CACHE_SIZE = 4096
+
 @ValidateLarchPlugin
 def sigma2_eins(t, theta, path=None, _larch=None):
     """calculate sigma2 for a Feff Path wih the einstein model
@@ -80,24 +97,42 @@ def sigma2_debye(t, theta, path=None, _larch=None):
 
     if feffpath is None:
         return 0.
+    return sigma2_debye_feffdat(t, theta, feffpath)
 
-    if theta < 1.e-5: theta = 1.e-5
-    if t < 1.e-5:     t = 1.e-5
+def sigma2_debye_feffdat(t, theta, feffdat):
+    """sigma2 for a FeffDat geometry with the correlated Debye model
 
-    tempk  = float(t)
-    thetad = float(theta)
+    sigma2 = sigma2_debye_feffdat(t, theta, feffdat)
 
-    natoms = len(feffpath.geom)
-    rnorm  = feffpath.rnorman
-    atomx, atomy, atomz, atomm = [], [], [], []
-    for sym, iz, ipot, am, x, y, z in feffpath.geom:
-        atomx.append(x)
-        atomy.append(y)
-        atomz.append(z)
-        atomm.append(am)
+    Parameters:
+    -----------
+      t        sample temperature (in K)
+      theta    Debye temperature (in K)
+      feffdat  FeffDat group, with `geom` and `rnorman`
 
-    return sigma2_correldebye(natoms, tempk, thetad, rnorm,
-                              atomx, atomy, atomz, atomm)
+    Notes:
+       results are cached by temperature, Debye temperature, and
+       path geometry, so that repeated evaluation for the same
+       path and values (as in fit constraint expressions) is cheap.
+    """
+    if feffdat is None:
+        return 0.
+    tempk  = max(1.e-5, float(t))
+    thetad = max(1.e-5, float(theta))
+    rnorm  = feffdat.rnorman
+    key = (tempk, thetad, rnorm, tuple(feffdat.geom))
+    if key not in SIGMA2_CACHE:
+        geom = np.array([atom[3:7] for atom in feffdat.geom], dtype='float64')
+        atomm, atomx, atomy, atomz = geom.T
+        _cache_sigma2(key, sigma2_correldebye_np(len(geom), tempk, thetad,
+                                                 rnorm, atomx, atomy,
+                                                 atomz, atomm))
+    return SIGMA2_CACHE[key]
+
+def _cache_sigma2(key, val):
+    if len(SIGMA2_CACHE) >= SIGMA2_CACHE_SIZE:
+        SIGMA2_CACHE.clear()
+    SIGMA2_CACHE[key] = val
 
 def sigma2_correldebye(natoms, tk, theta, rnorm, x, y, z, atwt):
     """
@@ -115,6 +150,38 @@ def sigma2_correldebye(natoms, tk, theta, rnorm, x, y, z, atwt):
       x       *double, array of z coord (Ang)        [in]
       atwt    *double, array of atomic_weight (amu)  [in]
 
+   Returns:
+      sig2_cordby  double, calculated sigma2
+
+   Notes:
+      uses the vectorized sigma2_correldebye_np(), with results
+      cached by temperatures and path geometry.
+    """
+    key = (float(tk), float(theta), float(rnorm),
+           tuple(x[:natoms]), tuple(y[:natoms]),
+           tuple(z[:natoms]), tuple(atwt[:natoms]))
+    if key not in SIGMA2_CACHE:
+        _cache_sigma2(key, sigma2_correldebye_np(natoms, tk, theta, rnorm,
+                                                 x, y, z, atwt))
+    return SIGMA2_CACHE[key]
+
+def sigma2_correldebye_feff6(natoms, tk, theta, rnorm, x, y, z, atwt):
+    """
+    internal sigma2 calc for a Feff Path wih the correlated Debye model,
+    using the compiled feff6 library
+
+    these routines come courtesy of jj rehr and si zabinsky.
+
+    Arguments:
+      natoms  *int, lengths for x, y, z, atwt        [in]
+      tk      *double, sample temperature (K)        [in]
+      theta   *double, Debye temperature (K)         [in]
+      rnorm   *double, Norman radius (Ang)           [in]
+      x       *double, array of x coord (Ang)        [in]
+      y       *double, array of y coord (Ang)        [in]
+      x       *double, array of z coord (Ang)        [in]
+      atwt    *double, array of atomic_weight (amu)  [in]
+
    Returns:
       sig2_cordby  double, calculated sigma2
     """
@@ -138,6 +205,50 @@ def sigma2_correldebye(natoms, tk, theta, rnorm, x, y, z, atwt):
 
     return FEFF6LIB.sigma2_debye(na, t, th, rs, ax, ay, az, am)
 
+def sigma2_correldebye_np(natoms, tk, theta, rnorm, x, y, z, atwt):
+    """calculate the XAFS debye-waller factor for a path based
+    on the temperature, debye temperature, average norman radius,
+    atoms in the path, and their positions.
+
+    This gives the same result as sigma2_correldebye_py(), but
+    evaluates all atom pairs at once with numpy arrays.
+
+    Arguments:
+      natoms  *int, lengths for x, y, z, atwt        [in]
+      tk      *double, sample temperature (K)        [in]
+      theta   *double, Debye temperature (K)         [in]
+      rnorm   *double, Norman radius (Ang)           [in]
+      x       *double, array of x coord (Ang)        [in]
+      y       *double, array of y coord (Ang)        [in]
+      x       *double, array of z coord (Ang)        [in]
+      atwt    *double, array of atomic_weight (amu)  [in]
+
+   Returns:
+      sig2_cordby  double, calculated sigma2
+    """
+    pos  = np.array([x[:natoms], y[:natoms], z[:natoms]], dtype='float64').T
+    atwt = np.asarray(atwt[:natoms], dtype='float64')
+
+    # all pairs (i0, j0) with j0 >= i0, and the following atoms (i1, j1)
+    i0, j0 = np.triu_indices(natoms)
+    i1 = (i0 + 1) % natoms
+    j1 = (j0 + 1) % natoms
+
+    def _dist(a, b):
+        return np.sqrt(((pos[a] - pos[b])**2).sum(axis=1))
+
+    ridotj = ((pos[i0] - pos[i1]) * (pos[j0] - pos[j1])).sum(axis=1)
+
+    # correlations for the 4 atom pairs, all at once
+    ia = np.concatenate((i0, i1, i0, i1))
+    ib = np.concatenate((j0, j1, j1, j0))
+    corr = corrfn_array(_dist(ia, ib), theta, tk, atwt[ia], atwt[ib], rnorm)
+    ci0j0, ci1j1, ci0j1, ci1j0 = corr.reshape(4, len(i0))
+
+    sig2ij = ridotj*(ci0j0 + ci1j1 - ci0j1 - ci1j0)/(_dist(i0, i1)*_dist(j0, j1))
+    sig2ij[i0 == j0] /= 2.0
+    return sig2ij.sum()/2.0
+
 
 def sigma2_correldebye_py(natoms, tk, theta, rnorm, x, y, z, atwt):
     """calculate the XAFS debye-waller factor for a path based
@@ -252,8 +363,8 @@ def corrfn(rij, theta, tk, am1, am2, rs):
     NOTE: for backward compatibility, the constants used by feff6 are
     retained, even though some have been refined later.
     """
-    conh = 72.7630804732553
-    conr = 4.5693349700844
+    conh = CORRFN_CONH
+    conr = CORRFN_CONR
 
     # theta in degrees k, t temperature in degrees k
     rx     = conr  * rij / rs
@@ -261,6 +372,16 @@ def corrfn(rij, theta, tk, am1, am2, rs):
     rmass  = theta * np.sqrt(am1 * am2)
     return conh  * debint(rx, tx) / rmass
 
+def corrfn_array(rij, theta, tk, am1, am2, rs):
+    """calculate correlation function c(ri, rj) = <xi xj> in the
+    debye approximation, as corrfn(), for arrays of distances and
+    atomic masses, using debint_array().
+    """
+    rx     = CORRFN_CONR * np.asarray(rij) / rs
+    tx     = theta / tk
+    rmass  = theta * np.sqrt(am1 * am2)
+    return CORRFN_CONH * debint_array(rx, tx) / rmass
+
 def debfun(w, rx, tx):
     """ debye function, ported from feff6 sigms.f
 
@@ -321,6 +442,18 @@ def debint(rx, tx):
         bo = result
     return result
 
+def debint_array(rx, tx):
+    """integral of debfun(w, rx, tx) for w between [0, 1], as debint(),
+    for an array of rx, using a fixed Gauss-Legendre quadrature.
+
+    debint_array = int_0^1 (sin(w*rx)/rx) * coth(w*tx/2) dw
+    """
+    rx = np.asarray(rx, dtype='float64')
+    w  = DEBINT_NODES
+    # sin(w*rx)/rx, including the limit w for rx = 0
+    fsin = w * np.sinc(np.multiply.outer(rx, w)/np.pi)
+    return (fsin/np.tanh(w*tx/2.0)).dot(DEBINT_WEIGHTS)
+
 def registerLarchPlugin():
     return ('_xafs', {'sigma2_eins': sigma2_eins,
                       'sigma2_debye': sigma2_debye})
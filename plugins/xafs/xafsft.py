@@ -305,18 +305,20 @@ def xftf_fast(chi, nfft=2048, kstep=0.05, _larch=None, **kws):
 
     Parameters:
     ------------
-      chi:      1-d array of chi to be transformed
+      chi:      1-d array of chi to be transformed, or 2-d array
+                with one spectrum per row.
       nfft:     value to use for N_fft (2048).
       kstep:    value to use for delta_k (0.05).
 
     Returns:
     --------
-      complex 1-d array chi(R)
+      complex 1-d array chi(R), or 2-d array for 2-d chi.
 
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chi)] = chi
-    return (kstep / sqrt(pi)) * fft(cchi)[:int(nfft/2)]
+    chi = np.asarray(chi)
+    cchi = zeros(chi.shape[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:chi.shape[-1]] = chi
+    return (kstep / sqrt(pi)) * fft(cchi, axis=-1)[..., :int(nfft/2)]
 
 def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
     """
@@ -329,24 +331,179 @@ def xftr_fast(chir, nfft=2048, kstep=0.05, _larch=None, **kws):
 
     Parameters:
     -------------
-      chir:     1-d array of chi(R) to be transformed
+      chir:     1-d array of chi(R) to be transformed, or 2-d array
+                with one spectrum per row.
       nfft:     value to use for N_fft (2048).
       kstep:    value to use for delta_k (0.05).
 
     Returns:
     ----------
-      complex 1-d array for chi(q).
+      complex 1-d array for chi(q), or 2-d array for 2-d chir.
 
     This is useful for repeated FTs, as inside loops.
     """
-    cchi = zeros(nfft, dtype='complex128')
-    cchi[0:len(chir)] = chir
-    return  (4*sqrt(pi)/kstep) * ifft(cchi)[:int(nfft/2)]
+    chir = np.asarray(chir)
+    cchi = zeros(chir.shape[:-1] + (nfft,), dtype='complex128')
+    cchi[..., 0:chir.shape[-1]] = chir
+    return  (4*sqrt(pi)/kstep) * ifft(cchi, axis=-1)[..., :int(nfft/2)]
+
+def interp_rows(x, xp, fp):
+    """linear interpolation of each row of the 2-d array fp, all on the
+    grid xp, onto x, as for numpy.interp() of each row."""
+    x, xp = np.asarray(x), np.asarray(xp)
+    idx = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, len(xp)-2)
+    frac = np.clip((x - xp[idx]) / (xp[idx+1] - xp[idx]), 0, 1)
+    return fp[:, idx]*(1-frac) + fp[:, idx+1]*frac
+
+def _work_array(out, shape):
+    "return a complex work array of the given shape, using out if possible"
+    if (out is not None and out.shape == shape and
+        out.dtype == np.dtype('complex128')):
+        out[:] = 0
+        return out
+    return zeros(shape, dtype='complex128')
+
+@ValidateLarchPlugin
+@Make_CallArgs(["k", "chi"])
+def xftf_many(k, chi=None, group=None, kmin=0, kmax=20, kweight=0,
+              dk=1, dk2=None, with_phase=False, window='kaiser',
+              rmax_out=10, nfft=2048, kstep=0.05, out=None, _larch=None,
+              **kws):
+    """
+    forward XAFS Fourier transform for many spectra sharing one k grid.
+
+    Parameters:
+    -----------
+      k:        1-d array of photo-electron wavenumber in Ang^-1 or group
+      chi:      2-d array of chi, shape (nspectra, len(k))
+      group:    output Group
+      out:      optional complex work array of shape (nspectra, nfft),
+                which will hold the results (see Notes).
+      other parameters are as for xftf()
+
+    Returns:
+    ---------
+      None   -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group are as for xftf(), with kwin and r
+    1-d arrays shared by all spectra, and chir, chir_mag, chir_re, chir_im
+    (and chir_pha if with_phase=True) 2-d arrays, one row per spectrum.
+
+    The window and k-weighting are applied to all spectra together, and
+    one FFT is done for all spectra.  If a work array is given with out,
+    the FFT is done in place and chir is a view into out, so that
+    repeated calls for blocks of spectra can avoid allocating new arrays.
+
+    Supports First Argument Group convention (with group member names 'k' and 'chi')
+    """
+    if 'kw' in kws:
+        kweight = kws['kw']
+
+    k, chi, group = parse_group_args(k, members=('k', 'chi'),
+                                     defaults=(chi,), group=group,
+                                     fcn_name='xftf_many')
+    chi = np.atleast_2d(chi)
+    if dk2 is None: dk2 = dk
+    npts = int(1.01 + max(k)/kstep)
+    k_max = max(max(k), kmax+dk2)
+    k_   = kstep * np.arange(int(1.01+k_max/kstep), dtype='float64')
+    win  = ftwindow(k_, xmin=kmin, xmax=kmax, dx=dk, dx2=dk2, window=window)
+    npts = min(npts, nfft)
+
+    cchi = _work_array(out, (chi.shape[0], nfft))
+    cchi[:, :npts] = interp_rows(k_[:npts], k, chi)
+    cchi[:, :npts] *= win[:npts] * k_[:npts]**kweight
+    cchi[:] = fft(cchi, axis=-1, overwrite_x=True)
+    cchi *= kstep / sqrt(pi)
+
+    rstep = pi/(kstep*nfft)
+    irmax = int(min(nfft/2, 1.01 + rmax_out/rstep))
+
+    group = set_xafsGroup(group, _larch=_larch)
+    chir = cchi[:, :irmax]
+    group.kwin = win[:npts]
+    group.r    = rstep * arange(irmax)
+    group.chir = chir
+    group.chir_mag = abs(chir)
+    group.chir_re  = chir.real
+    group.chir_im  = chir.imag
+    if with_phase:
+        group.chir_pha = complex_phase(chir)
+
+@ValidateLarchPlugin
+@Make_CallArgs(["r", "chir"])
+def xftr_many(r, chir=None, group=None, rmin=0, rmax=20, with_phase=False,
+              dr=1, dr2=None, rw=0, window='kaiser', qmax_out=None,
+              nfft=2048, kstep=0.05, out=None, _larch=None, **kws):
+    """
+    reverse XAFS Fourier transform for many spectra sharing one R grid.
+
+    Parameters:
+    ------------
+      r:        1-d array of distance, or group.
+      chir:     2-d array of chi(R), shape (nspectra, len(r))
+      group:    output Group
+      out:      optional complex work array of shape (nspectra, nfft),
+                which will hold the results, as for xftf_many().
+      other parameters are as for xftr()
+
+    Returns:
+    ---------
+      None -- outputs are written to supplied group.
+
+    Notes:
+    -------
+    Arrays written to output group are as for xftr(), with rwin and q
+    1-d arrays shared by all spectra, and chiq, chiq_mag, chiq_re, chiq_im
+    (and chiq_pha if with_phase=True) 2-d arrays, one row per spectrum.
+
+    Supports First Argument Group convention (with group member names 'r' and 'chir')
+    """
+    if 'rweight' in kws:
+        rw = kws['rweight']
+
+    r, chir, group = parse_group_args(r, members=('r', 'chir'),
+                                     defaults=(chir,), group=group,
+                                     fcn_name='xftr_many')
+    chir = np.atleast_2d(chir)
+    rstep = r[1] - r[0]
+    kstep = pi/(rstep*nfft)
+    scale = 1.0
+    if chir.dtype == np.dtype('complex128'):
+        scale = 0.5
+
+    r_  = rstep * arange(nfft, dtype='float64')
+    win = ftwindow(r_, xmin=rmin, xmax=rmax, dx=dr, dx2=dr2, window=window)
+    nr  = min(chir.shape[1], nfft)
+
+    cchir = _work_array(out, (chir.shape[0], nfft))
+    cchir[:, :nr] = chir[:, :nr] * (win * r_**rw)[:nr]
+    cchir[:] = ifft(cchir, axis=-1, overwrite_x=True)
+    cchir *= scale * 4*sqrt(pi)/kstep
+
+    if qmax_out is None: qmax_out = 30.0
+    q = linspace(0, qmax_out, int(1.05 + qmax_out/kstep))
+    nkpts = len(q)
+
+    group = set_xafsGroup(group, _larch=_larch)
+    chiq = cchir[:, :nkpts]
+    group.q = q
+    group.rwin = win[:nr]
+    group.chiq = chiq
+    group.chiq_mag = abs(chiq)
+    group.chiq_re  = chiq.real
+    group.chiq_im  = chiq.imag
+    if with_phase:
+        group.chiq_pha = complex_phase(chiq)
 
 
 def registerLarchPlugin():
     return (MODNAME, {'xftf': xftf,
                       'xftr': xftr,
+                      'xftf_many': xftf_many,
+                      'xftr_many': xftr_many,
                       'xftf_prep': xftf_prep,
                       'xftf_fast': xftf_fast,
                       'xftr_fast': xftr_fast,
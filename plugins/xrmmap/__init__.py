@@ -1,13 +1,14 @@
 from .configfile import FastMapConfig
 from .xsp3_hdf5 import read_xsp3_hdf5
 from .xrf_netcdf import read_xrf_netcdf
-from .xrd_netcdf import read_xrd_netcdf
-from .xrd_hdf5 import read_xrd_hdf5
+from .xrd_netcdf import read_xrd_netcdf, open_xrd_netcdf
+from .xrd_hdf5 import read_xrd_hdf5, open_xrd_hdf5
 from .asciifiles import (readASCII, readMasterFile, readROIFile,
                          readEnvironFile, read1DXRDFile, parseEnviron)
 from .xrm_mapfile import (read_xrfmap, read_xrmmap,
                           process_mapfolder,
-                          process_mapfolders,
+                          process_mapfolders, process_maprows,
+                          repack_mapfile,
                           h5str, ensure_subgroup,
                           GSEXRM_MapFile, GSEXRM_FileStatus,
                           GSEXRM_Exception)
@@ -27,6 +27,17 @@ def read_xrd_hdf5(fname, verbose=False, _larch=None):
 
     return xrd_data
 
+def open_xrd_hdf5(fname):
+    """open a HDF5 file for XRD mapping without reading the frames
+
+    Returns
+    -------
+    open h5py File and its (no_images, pixels_x, pixels_y) or
+    (pixels_x, pixels_y) dataset of frames
+    """
+    h5file = h5py.File(fname, 'r')
+    return h5file, h5file['entry/instrument/detector/data']
+
 def test_read(fname):
     print( fname,  os.stat(fname))
     fd = read_xrd_hdf5(fname, verbose=True)
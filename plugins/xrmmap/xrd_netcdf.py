@@ -34,6 +34,17 @@ def read_xrd_netcdf(fname,verbose=False):
 
     return xrd_data
 
+def open_xrd_netcdf(fname):
+    """open a netCDF file for XRD mapping without reading the frames
+
+    Returns
+    -------
+    open netcdf file and its memory-mapped (no_images, pixels_x, pixels_y)
+    or (pixels_x, pixels_y) array of frames
+    """
+    file_netcdf = netcdf_open(fname, mmap=True)
+    return file_netcdf, file_netcdf.variables['array_data'].data
+
 def read_xrd_netcdf_exptime(fname,verbose=False):
     '''
     returns header information for provided xrd netcdf file
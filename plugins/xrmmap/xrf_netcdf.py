@@ -64,6 +64,78 @@ class xMAPData(object):
 
 CLOCKTICK = 0.320  # xmap clocktick = 320 ns
 
+def aslong_view(d):
+    """view pairs of int16 words (low word first) along the last
+    axis of an array as int32, without unraveling the array"""
+    d = np.ascontiguousarray(d, dtype=np.int16)
+    return d.view(np.int32)
+
+def decode_xmap_buffers(array_data):
+    """decode xMAP mapping buffers for all arrays and modules at once
+
+    Parameters
+    ----------
+    array_data:  int16 array (narrays, nmodules, buffersize), as read
+                 (or memory-mapped) from the 'array_data' variable
+
+    Returns
+    -------
+    xMAPData with counts, times, and input/output counts for all pixels
+
+    Notes
+    -----
+    each buffer holds a 256 word header followed by a block for each of
+    its pixels, with acquisition times and i/o counts as longs in words
+    32:64 of the block, and the data at words 256: (full spectra) or
+    64: (ROI mode) of the block.  The used pixels of each buffer
+    (numPixels in the header of module 0) are copied for all modules
+    at once into the output arrays, with modules ordered as detectors
+    4*module + channel.
+    """
+    narrays, nmodules, buffersize = array_data.shape
+    modpixs   = max(124, array_data[0, 0, 8])
+    blocksize = (buffersize-256)//modpixs
+
+    # view of pixel blocks, ordered as (array, pixel, module, word)
+    dat = array_data[:, :, 256:256+modpixs*blocksize]
+    dat = dat.reshape((narrays, nmodules, modpixs, blocksize)).transpose(0, 2, 1, 3)
+    npix = [min(modpixs, int(n)) for n in array_data[:, 0, 8]]
+    npix_total = sum(npix)
+
+    def gather(words):
+        "copy words of the used pixel blocks for all modules, as native int16"
+        out = np.empty((npix_total, nmodules, words.stop-words.start), dtype=np.int16)
+        p1 = 0
+        for array, n in enumerate(npix):
+            out[p1:p1+n] = dat[array, :n, :, words]
+            p1 += n
+        return out
+
+    ndet = 4 * nmodules
+    mapmode = dat[0, 0, 0, 3]
+    if mapmode == 1:  # mapping, full spectra
+        nchans = array_data[0, 0, 20]
+        counts = gather(slice(256, 256+4*nchans))
+    elif mapmode == 2:  # ROI mode
+        # Note:  nchans = number of ROIS !!
+        nchans = max(dat[0, 0, 0, 8:12])
+        counts = gather(slice(64, 64+8*nchans)).view(np.int32).astype('i2')
+    else:
+        raise ValueError('unsupported xMAP mapping mode %i' % mapmode)
+
+    xmapdat = xMAPData(0, nmodules, nchans)
+    xmapdat.firstPixel = aslong_view(array_data[0, 0, 9:11])[0]
+    xmapdat.numPixels  = npix_total
+    xmapdat.counts     = counts.reshape((npix_total, ndet, nchans))
+
+    # times and i/o counts: (pixel, det, [real, live, icr, ocr])
+    t_times = gather(slice(32, 64)).view(np.int32).reshape((npix_total, ndet, 4))
+    xmapdat.realTime     = CLOCKTICK * t_times[:, :, 0]
+    xmapdat.liveTime     = CLOCKTICK * t_times[:, :, 1]
+    xmapdat.inputCounts  = t_times[:, :, 2].copy()
+    xmapdat.outputCounts = t_times[:, :, 3].copy()
+    return xmapdat
+
 def read_xrf_netcdf(fname, npixels=None, verbose=False):
     # Reads a netCDF file created with the DXP xMAP driver
     # with the netCDF plugin buffers
@@ -74,12 +146,12 @@ def read_xrf_netcdf(fname, npixels=None, verbose=False):
     read_ok = False
     fh = None
     try:
-        fh = netcdf_open(fname,'r')
+        fh = netcdf_open(fname, 'r', mmap=True)
         read_ok = True
     except:
         time.sleep(0.010)
         try:
-            fh = netcdf_open(fname,'r')
+            fh = netcdf_open(fname, 'r', mmap=True)
             read_ok = True
         except:
             pass
@@ -89,7 +161,7 @@ def read_xrf_netcdf(fname, npixels=None, verbose=False):
             fh.close()
         return None
 
-    array_data = fh.variables['array_data']
+    array_data = fh.variables['array_data'].data
     t1 = time.time()
 
     # array_data will normally be 3d:
@@ -100,66 +172,18 @@ def read_xrf_netcdf(fname, npixels=None, verbose=False):
     # here we force the data to be 3d
     shape = array_data.shape
     if len(shape) == 1:
-        array_data.shape = (1, 1, shape[0])
+        array_data = array_data.reshape((1, 1, shape[0]))
     elif len(shape) == 2:
-        array_data.shape = (1, shape[0], shape[1])
+        array_data = array_data.reshape((1, shape[0], shape[1]))
 
-    narrays, nmodules, buffersize = array_data.shape
-    modpixs    = max(124, array_data[0, 0, 8])
-    npix_total = 0
-    # real / live times are returned in microseconds.
-    for array in range(narrays):
-        for module in range(nmodules):
-            d   = array_data[array,module, :]
-            bh  = xMAPBufferHeader(d)
-            #if verbose and array==0:
-            dat = d[256:].reshape(modpixs, (d.size-256)/modpixs )
-
-            npix = bh.numPixels
-            if module == 0:
-                npix_total += npix
-                if array == 0:
-                    # first time through, (array,module)=(0,0) we
-                    # read mapping mode, set up how to slice the
-                    # data, and build data arrays in xmapdat
-                    mapmode = dat[0, 3]
-                    if mapmode == 1:  # mapping, full spectra
-                        nchans = d[20]
-                        data_slice = slice(256, 8448)
-                    elif mapmode == 2:  # ROI mode
-                        # Note:  nchans = number of ROIS !!
-                        nchans     = max(d[264:268])
-                        data_slice = slice(64, 64+8*nchans)
-                    xmapdat = xMAPData(narrays*modpixs, nmodules, nchans)
-                    xmapdat.firstPixel = bh.startingPixel
-
-            # acquistion times and i/o counts data are stored
-            # as longs in locations 32:64
-            t_times = aslong(dat[:npix, 32:64]).reshape(npix, 4, 4)
-            p1 = npix_total - npix
-            p2 = npix_total
-            xmapdat.realTime[p1:p2, :]     = t_times[:, :, 0]
-            xmapdat.liveTime[p1:p2, :]     = t_times[:, :, 1]
-            xmapdat.inputCounts[p1:p2, :]  = t_times[:, :, 2]
-            xmapdat.outputCounts[p1:p2, :] = t_times[:, :, 3]
-
-            # the data, extracted as per data_slice and mapmode
-            t_data = dat[:npix, data_slice]
-            if mapmode == 2:
-                t_data = aslong(t_data)
-            xmapdat.counts[p1:p2, :, :] = t_data.reshape(npix, 4, nchans)
+    xmapdat = decode_xmap_buffers(array_data)
+    del array_data
 
     t2 = time.time()
-    xmapdat.numPixels = npix_total
-    xmapdat.counts    = xmapdat.counts[:npix_total]
-    xmapdat.realTime = CLOCKTICK * xmapdat.realTime[:npix_total]
-    xmapdat.liveTime = CLOCKTICK * xmapdat.liveTime[:npix_total]
-    xmapdat.inputCounts  = xmapdat.inputCounts[:npix_total]
-    xmapdat.outputCounts = xmapdat.outputCounts[:npix_total]
     if verbose:
         print('   time to read file    = %5.1f ms' % ((t1-t0)*1000))
         print('   time to extract data = %5.1f ms' % ((t2-t1)*1000))
-        print('   read %i pixels ' %  npix_total)
+        print('   read %i pixels ' %  xmapdat.numPixels)
         print('   data shape:    ' ,  xmapdat.counts.shape)
     fh.close()
     return xmapdat
@@ -10,6 +10,9 @@ import numpy as np
 import six
 import scipy.stats as stats
 import json
+import hashlib
+import threading
+import traceback
 import multiprocessing as mp
 from functools import partial
 import larch
@@ -20,16 +23,45 @@ from larch_plugins.xrf import MCA, ROI
 from larch_plugins.xrmmap import (FastMapConfig, read_xrf_netcdf, read_xsp3_hdf5,
                                   readASCII, readMasterFile, readROIFile,
                                   readEnvironFile, parseEnviron, read_xrd_netcdf,
-                                  read_xrd_hdf5)
+                                  read_xrd_hdf5, open_xrd_netcdf, open_xrd_hdf5)
 from larch_plugins.xrd import (XRD,E_from_lambda,integrate_xrd_row,q_from_twth,
                                q_from_d,lambda_from_E,read_xrd_data)
 from larch_plugins.tomo import tomo_reconstruction,reshape_sinogram,trim_sinogram
 
+HAS_INOTIFY = False
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    HAS_INOTIFY = True
+except ImportError:
+    pass
+
+HAS_HDF5PLUGIN = False
+try:
+    import hdf5plugin
+    HAS_HDF5PLUGIN = True
+except ImportError:
+    pass
+
 
 NINIT = 32
+NPREFETCH = 4
+ROWS_PER_TASK = 32
+XRD2D_MEMBUDGET = 2**28  # bytes of 2D XRD frames to read at once
+CUMSUM_CHUNK = 16
+PYRAMID_MINSIZE = 128
 COMPRESSION_OPTS = 2
 COMPRESSION = 'gzip'
 #COMPRESSION = 'lzf'
+PLUGIN_COMPRESSION = ('blosc', 'lz4', 'zstd')
+# szip takes (coding, pixels per block), not a compression level
+SZIP_OPTS = ('nn', 16)
+# chunk layouts for spectra arrays (nrow, npts, nchan):
+#   'default'  : compromise between the two access patterns below
+#   'spectrum' : fast reads of full spectra at a few pixels
+#   'image'    : fast reads of a channel range (ROI map) over all pixels
+CHUNK_LAYOUTS = ('default', 'spectrum', 'image')
+SPECTRUM_CHUNK_NPTS = 8
+IMAGE_CHUNK_NCHAN = 16
 DEFAULT_ROOTNAME = 'xrmmap'
 NOT_OWNER = "Not Owner of HDF5 file %s"
 STEPS = 5001
@@ -194,6 +226,117 @@ def create_xrmmap(h5root, root=None, dimension=2, folder='', start_time=None):
 
     h5root.flush()
 
+def get_compress_args(compression=COMPRESSION, compression_opts=COMPRESSION_OPTS):
+    """return dict of h5py create_dataset() keywords for a compression name:
+    one of 'gzip', 'lzf', 'szip', None (no compression), or, with the
+    hdf5plugin package installed, 'blosc', 'lz4', 'zstd'
+
+    compression_opts is the compression level for 'gzip' and 'blosc'.
+    For 'szip', it is a tuple of ('ec' or 'nn', pixels per block),
+    with a compression level replaced by SZIP_OPTS.
+    """
+    if compression in (None, '', 'none', 'None'):
+        return {}
+    compression = compression.lower()
+    if compression == 'lzf':
+        return {'compression': 'lzf'}
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': compression_opts}
+    if compression == 'szip':
+        return {'compression': 'szip', 'compression_opts': szip_opts(compression_opts)}
+    if compression in PLUGIN_COMPRESSION:
+        if not HAS_HDF5PLUGIN:
+            raise GSEXRM_Exception("compression '%s' requires hdf5plugin" % compression)
+        if compression == 'blosc':
+            filt = hdf5plugin.Blosc(cname='lz4', clevel=compression_opts,
+                                    shuffle=hdf5plugin.Blosc.SHUFFLE)
+        elif compression == 'lz4':
+            filt = hdf5plugin.LZ4()
+        else:
+            filt = hdf5plugin.Zstd()
+        return dict(filt)
+    raise GSEXRM_Exception("unknown compression '%s'" % compression)
+
+def szip_opts(compression_opts):
+    "szip options tuple for compression_opts, see get_compress_args()"
+    if isinstance(compression_opts, (tuple, list)):
+        coding, ppb = compression_opts
+        if coding not in ('ec', 'nn'):
+            raise GSEXRM_Exception("szip coding must be 'ec' or 'nn'")
+        return (coding, int(ppb))
+    return SZIP_OPTS
+
+def compress_string(compression=COMPRESSION, compression_opts=COMPRESSION_OPTS):
+    "string describing compression, as for the 'Compression' attribute"
+    if compression in (None, '', 'none', 'None'):
+        return 'none'
+    if compression.lower() == 'szip':
+        return 'szip-%s%i' % szip_opts(compression_opts)
+    if compression.lower() in ('gzip', 'blosc'):
+        return '%s-%s' % (compression, compression_opts)
+    return '%s' % compression
+
+def replace_file(src, dest):
+    """rename file src to dest, replacing dest in one step where possible"""
+    if hasattr(os, 'replace'):
+        os.replace(src, dest)
+    else:  # Python 2: os.rename() replaces dest, except on Windows
+        if os.name == 'nt' and os.path.exists(dest):
+            os.unlink(dest)
+        os.rename(src, dest)
+
+def calc_chunksize(npts, nchan, layout='default'):
+    """chunk shape for a (nrow, npts, nchan) spectra array
+
+    layout 'spectrum' keeps whole spectra for a few pixels in each chunk,
+    layout 'image' keeps a few channels for a whole row in each chunk.
+    """
+    if layout == 'spectrum':
+        return (1, min(npts, SPECTRUM_CHUNK_NPTS), nchan)
+    elif layout == 'image':
+        return (1, npts, min(nchan, IMAGE_CHUNK_NCHAN))
+    xnpts = max(npts, 10)
+    nxx = min(xnpts-1, 2**int(np.log2(xnpts)))
+    nxm = 1024
+    if nxx > 256:
+        nxm = min(1024, int(65536*1.0/ nxx))
+    return (1, nxx, nxm)
+
+def benchmark_counts(dset, nsample=16, roiwidth=20):
+    """time the two common reads of a (nrow, npts, nchan) spectra dataset:
+    full spectra at single pixels, and maps of a channel range.
+
+    Returns
+    -------
+    dict with average times in sec for 'spectrum' and 'roimap' reads,
+    and the 'chunks' and 'compression' of the dataset
+    """
+    nrow, npts, nchan = dset.shape
+    rng = np.random.RandomState(1)
+    t0 = time.time()
+    for i in range(nsample):
+        dset[rng.randint(nrow), rng.randint(npts), :]
+    t1 = time.time()
+    nroi = max(1, nsample//4)
+    for i in range(nroi):
+        imin = rng.randint(max(1, nchan-roiwidth))
+        dset[:, :, imin:imin+roiwidth].sum(axis=2)
+    t2 = time.time()
+    return {'spectrum': (t1-t0)/nsample, 'roimap': (t2-t1)/nroi,
+            'chunks': dset.chunks, 'compression': dset.compression}
+
+def bin_map2(arr):
+    """sum 2x2 blocks over the first two axes of an array,
+    padding odd sizes with zeros"""
+    arr = np.asarray(arr)
+    ny, nx = arr.shape[:2]
+    if ny % 2 or nx % 2:
+        pad = [(0, ny % 2), (0, nx % 2)] + [(0, 0)]*(arr.ndim-2)
+        arr = np.pad(arr, pad, mode='constant')
+        ny, nx = arr.shape[:2]
+    out = arr.reshape((ny//2, 2, nx//2, 2) + arr.shape[2:]).sum(axis=3).sum(axis=1)
+    return out.astype(np.float32 if arr.dtype.kind == 'f' else np.int32)
+
 def ensure_subgroup(subgroup,group):
     
     if subgroup not in group.keys():
@@ -262,6 +405,157 @@ class GSEXRM_Exception(Exception):
     '''GSEXRM Exception: General Errors'''
     pass
 
+class GSEXRM_XRDFrames(object):
+    '''
+    lazy stack of 2D XRD frames for one row, read from the raw data file
+    one frame at a time, with mask and background applied to each frame.
+
+    Slicing along the frame axis (as for truncating or reversing a row)
+    returns a new stack sharing the same open file.  Frames beyond those
+    in the file read as zeros.
+
+    Frames with mask or background applied are float64, and are cast
+    to the type of the output dataset by write().
+    '''
+    def __init__(self, xrdfile, xrdtype=None, npts=None, xrd2dmask=None,
+                 xrd2dbkgd=None, flip=True):
+        if xrdtype == 'hdf5':
+            self._fh, data = open_xrd_hdf5(xrdfile)
+            self.rawtype = data.dtype
+        else:
+            self._fh, data = open_xrd_netcdf(xrdfile)
+            # netcdf frames hold unsigned counts as int16
+            self.rawtype = np.dtype('uint16')
+        self._data = data
+        if len(data.shape) == 2:
+            self._nframes, xpix, ypix = 1, data.shape[0], data.shape[1]
+        else:
+            self._nframes, xpix, ypix = data.shape
+        if npts is None:
+            npts = self._nframes
+        self.index = np.arange(npts)
+        self.shape = (npts, xpix, ypix)
+
+        self.mask2d = None
+        if xrd2dmask is not None:
+            dir = -1 if flip else 1
+            self.mask2d = np.ones((xpix, ypix)) - xrd2dmask[::dir]
+        self.bkgd = xrd2dbkgd
+        self.dtype = self.rawtype
+        if self.mask2d is not None or self.bkgd is not None:
+            self.dtype = np.dtype('float64')
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            out = GSEXRM_XRDFrames.__new__(GSEXRM_XRDFrames)
+            out.__dict__.update(self.__dict__)
+            out.index = self.index[key]
+            out.shape = (len(out.index),) + self.shape[1:]
+            return out
+        return self.frame(key)
+
+    def frame(self, i):
+        "return frame i, with mask and background applied"
+        j = self.index[i]
+        if j >= self._nframes:
+            return np.zeros(self.shape[1:], dtype=self.dtype)
+        if len(self._data.shape) == 2:
+            dat = self._data[:, :]
+        else:
+            dat = self._data[j]
+        dat = np.asarray(dat).astype(self.rawtype)
+        if self.mask2d is None and self.bkgd is None:
+            return dat
+        dat = dat.astype('float64')
+        if self.bkgd is not None:
+            dat = dat - self.bkgd
+        if self.mask2d is not None:
+            dat = self.mask2d*dat
+        dat[dat < 0] = 0
+        return dat
+
+    def read(self):
+        "return all frames as one array"
+        out = np.zeros(self.shape, dtype=self.dtype)
+        for i in range(len(self)):
+            out[i] = self.frame(i)
+        return out
+
+    def write(self, dset, irow):
+        """write frames to row irow of an HDF5 dataset, one frame at a
+        time, clipping frames to the range of an integer dataset"""
+        maxval = None
+        if dset.dtype.kind in 'iu' and self.dtype != dset.dtype:
+            maxval = np.iinfo(dset.dtype).max
+        for i in range(len(self)):
+            dat = self.frame(i)
+            if maxval is not None:
+                dat = np.clip(dat, 0, maxval).astype(dset.dtype)
+            dset[irow, i] = dat
+
+    def close(self):
+        self._data = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+class GSEXRM_FrameStack(object):
+    '''
+    proxy for a (nrow, npts, pixels_x, pixels_y) HDF5 dataset of 2D XRD
+    frames, reading frames in chunk order and no more than `budget`
+    bytes at a time.
+    '''
+    def __init__(self, dset, budget=XRD2D_MEMBUDGET):
+        self.dset = dset
+        self.shape = dset.shape
+        self.budget = budget
+        self.frame_bytes = dset.dtype.itemsize*dset.shape[2]*dset.shape[3]
+
+    def __getitem__(self, key):
+        return self.dset[key]
+
+    def blocks(self, area):
+        """yield (irow, slice) for blocks of frames covering the
+        pixels of an area mask, in chunk order"""
+        nrow, npts = self.shape[:2]
+        chunks = self.dset.chunks
+        nchunk = npts if chunks is None else chunks[1]
+        nblock = max(1, int(self.budget / self.frame_bytes))
+        if nblock >= nchunk:
+            nblock = nchunk*(nblock//nchunk)
+        for irow in np.where(area.any(axis=1))[0]:
+            cols = np.where(area[irow])[0]
+            start = cols.min()
+            while start <= cols.max():
+                stop = min(cols.max()+1, start + nblock)
+                if nblock < nchunk:   # do not read across chunks
+                    stop = min(stop, nchunk*(start//nchunk + 1))
+                if area[irow, start:stop].any():
+                    yield irow, slice(start, stop)
+                start = stop
+
+    def sum_area(self, area, callback=None):
+        """return sum of frames for pixels in an area mask
+
+        callback, if given, is called as callback(i, nblocks, npix)
+        for each block of frames read
+        """
+        out = np.zeros(self.shape[2:], dtype='float64')
+        blocks = list(self.blocks(area))
+        for i, (irow, xslice) in enumerate(blocks):
+            sel = area[irow, xslice]
+            if hasattr(callback , '__call__'):
+                callback(i, len(blocks), sel.sum())
+            frames = self.dset[irow, xslice]
+            if sel.all():
+                out += frames.sum(axis=0)
+            else:
+                out += frames[sel].sum(axis=0)
+        return out
+
 class GSEXRM_MapRow:
     '''
     read one row worth of data:
@@ -276,6 +570,7 @@ class GSEXRM_MapRow:
 
         self.read_ok = False
         self.nrows_expected = nrows_expected
+        self.flags = (FLAGxrf, FLAGxrd1D, FLAGxrd2D)
 
         ioff = ioffset
         offslice = slice(None, None, None)
@@ -315,12 +610,8 @@ class GSEXRM_MapRow:
                 xrf_reader = read_xsp3_hdf5
 
         if FLAGxrd2D or FLAGxrd1D:
-            if xrdtype == 'hdf5':
-                xrd_reader = read_xrd_hdf5
-            elif xrdtype == 'netcdf' or xrdfile.endswith('nc'):
-                xrd_reader = read_xrd_netcdf
-            else:
-                xrd_reader = read_xrd_netcdf
+            if xrdtype != 'hdf5':
+                xrdtype = 'netcdf'
 
 
         # reading can fail with IOError, generally meaning the file isn't
@@ -368,9 +659,11 @@ class GSEXRM_MapRow:
                     if xrf_dat is None:
                         print( 'Failed to read XRF data from %s' % self.xrffile)
                 if FLAGxrd2D or FLAGxrd1D:
-                    xrd_dat = xrd_reader(xrd_file, verbose=False)
-                    if xrd_dat is None:
-                        print( 'Failed to read XRD data from %s' % self.xrdfile)
+                    # frames are read one at a time, when needed
+                    xrd_dat = GSEXRM_XRDFrames(xrd_file, xrdtype=xrdtype,
+                                               npts=self.npts,
+                                               xrd2dmask=xrd2dmask,
+                                               xrd2dbkgd=xrd2dbkgd, flip=flip)
 
             except (IOError, IndexError):
                 time.sleep(0.010)
@@ -398,39 +691,15 @@ class GSEXRM_MapRow:
 
         ## SPECIFIC TO XRD data
         if FLAGxrd2D or FLAGxrd1D:
-            if self.npts == xrd_dat.shape[0]:
-                self.xrd2d = xrd_dat
-            elif self.npts > xrd_dat.shape[0]:
-                self.xrd2d = np.zeros((self.npts,xrd_dat.shape[1],xrd_dat.shape[2]))
-                self.xrd2d[0:xrd_dat.shape[0]] = xrd_dat
-            else:
-                self.xrd2d = xrd_dat[0:self.npts]
-
-            ############################################################################
-            ## subtracts background and applies mask, row by row
-            ## mkak 2018.02.01 
-            ## major speed up if no background or mask specified
-            ## updated mkak 2018.03.30
-            
-            if xrd2dmask is not None:
-                dir = -1 if flip else 1
-                mask2d = np.ones(self.xrd2d[0].shape)
-                mask2d = mask2d - xrd2dmask[::dir]
-                if xrd2dbkgd is not None:
-                    self.xrd2d = mask2d*(self.xrd2d-xrd2dbkgd)
-                else:
-                    self.xrd2d = mask2d*(self.xrd2d)
-            elif xrd2dbkgd is not None:
-                self.xrd2d = self.xrd2d-xrd2dbkgd
-            
-            ## limits all values to positive
-            self.xrd2d[self.xrd2d < 0] = 0
-            ############################################################################
+            ## frames padded with zeros or truncated to npts;
+            ## background and mask are applied frame by frame
+            self.xrd2d = xrd_dat
 
             if xrdcal is not None and FLAGxrd1D:
                 attrs = {'steps':steps,'flip':flip}
 
-                self.xrdq,self.xrd1d = integrate_xrd_row(self.xrd2d,xrdcal,**attrs)
+                xrd2d = self.xrd2d.read()
+                self.xrdq,self.xrd1d = integrate_xrd_row(xrd2d,xrdcal,**attrs)
 
                 if wdg > 1:
                     self.xrdq_wdg,self.xrd1d_wdg = [],[]
@@ -439,7 +708,7 @@ class GSEXRM_MapRow:
                         wdg_lmts = np.array([iwdg*wdg_sz, (iwdg+1)*wdg_sz]) - 180
 
                         attrs.update({'wedge_limits':wdg_lmts})
-                        q,counts = integrate_xrd_row(self.xrd2d,xrdcal,**attrs)
+                        q,counts = integrate_xrd_row(xrd2d,xrdcal,**attrs)
                         self.xrdq_wdg  += [q]
                         self.xrd1d_wdg += [counts]
 
@@ -681,9 +950,10 @@ class GSEXRM_MapFile(object):
     def __init__(self, filename=None, folder=None, root=None, chunksize=None,
                  xrdcal=None, xrd2dmask=None, xrd2dbkgd=None, xrd1dbkgd=None,
                  azwdgs=0, qstps=STEPS, flip=True, bkgdscale=1.,
-                 FLAGxrf=True, FLAGxrd1D=False, FLAGxrd2D=False,
+                 FLAGxrf=True, FLAGxrd1D=False, FLAGxrd2D=False, FLAGcumsum=False,
+                 FLAGpyramid=False,
                  compression=COMPRESSION, compression_opts=COMPRESSION_OPTS,
-                 facility='APS', beamline='13-ID-E',run='',proposal='',user=''):
+                 chunk_layout='default', facility='APS', beamline='13-ID-E',run='',proposal='',user=''):
 
         self.filename         = filename
         self.folder           = folder
@@ -702,14 +972,25 @@ class GSEXRM_MapFile(object):
         self._pixeltime       = None
         self.masterfile       = None
         self.masterfile_mtime = -1
-        self.compress_args = {'compression': compression}
-        if compression != 'lzf':
-            self.compress_args['compression_opts'] = compression_opts
+        self.xrftype          = None
+        self.xrdtype          = None
+        self._master_cache    = None
+        self._scanconf_mtime  = None
+        self._mapfolder       = None
+        self.subscribers      = []
+        self._watch_stop      = threading.Event()
+        if chunk_layout not in CHUNK_LAYOUTS:
+            raise GSEXRM_Exception("chunk_layout must be one of %s" % repr(CHUNK_LAYOUTS))
+        self.chunk_layout = chunk_layout
+        self.compress_args = get_compress_args(compression, compression_opts)
+        self.compress_desc = compress_string(compression, compression_opts)
 
         self.mono_energy  = None
         self.flag_xrf     = FLAGxrf
         self.flag_xrd1d   = FLAGxrd1D
         self.flag_xrd2d   = FLAGxrd2D
+        self.flag_cumsum  = FLAGcumsum
+        self.flag_pyramid = FLAGpyramid
 
         ## used for XRD
         self.bkgd_xrd2d     = None
@@ -865,7 +1146,7 @@ class GSEXRM_MapFile(object):
                     "'%s' is not a valid GSEXRM HDF5 file" % self.filename)
         self.filename = filename
         if self.h5root is None:
-            self.h5root = h5py.File(self.filename)
+            self.h5root = h5py.File(self.filename, 'a')
         self.xrmmap = self.h5root[root]
         if self.folder is None:
             self.folder = bytes2str(self.xrmmap.attrs.get('Map_Folder',''))
@@ -1000,10 +1281,8 @@ class GSEXRM_MapFile(object):
         self.add_data(group['environ'], 'address',  [six.b(a) for a in env_addr])
         self.add_data(group['environ'], 'value',    [six.b(a) for a  in env_val])
 
-        cmprstr = '%s' % self.compress_args['compression']
-        if self.compress_args['compression'] != 'lzf':
-            cmprstr = '%s-%s' % (cmprstr,self.compress_args['compression_opts'])
-        self.xrmmap.attrs['Compression'] = cmprstr
+        self.xrmmap.attrs['Compression'] = self.compress_desc
+        self.xrmmap.attrs['Chunk_Layout'] = self.chunk_layout
 
         self.h5root.flush()
 
@@ -1035,9 +1314,10 @@ class GSEXRM_MapFile(object):
 
         self.status = GSEXRM_FileStatus.hasdata
 
-    def process_row(self, irow, flush=False, callback=None):
+    def process_row(self, irow, flush=False, callback=None, row=None):
 
-        row = self.read_rowdata(irow)
+        if row is None:
+            row = self.read_rowdata(irow)
 
         if irow == 0:
             self.build_schema(row,verbose=True)
@@ -1047,15 +1327,110 @@ class GSEXRM_MapFile(object):
 
         if flush:
             self.resize_arrays(self.last_row+1)
+            if self.flag_pyramid:
+                self.build_pyramid()
             self.h5root.flush()
             if self._pixeltime is None:
                 self.calc_pixeltime()
 
             if hasattr(callback, '__call__'):
                 callback(filename=self.filename, status='complete')
-        
-    def process(self, maxrow=None, force=False, callback=None):
-        "look for more data from raw folder, process if needed"
+
+    def process_rows_pipelined(self, irow, nrows, nworkers=2,
+                               nprefetch=NPREFETCH, callback=None,
+                               timing_callback=None):
+        """process rows irow to nrows-1, with a pool of reader threads
+        reading and decoding upcoming rows while the calling thread adds
+        rows to the HDF5 file, strictly in order.
+
+        Parameters:
+          irow       first row to process
+          nrows      number of rows (last row is nrows-1)
+          nworkers   number of reader threads [2]
+          nprefetch  max number of rows read but not yet written [4]
+          callback   callback for progress, as for process()
+          timing_callback  function called after each row is written as
+                     timing_callback(row=, read=, wait=, write=), with
+                     row index, time to read the row (in reader thread),
+                     time spent waiting for the row, and time to write it.
+        """
+        if self.xrdcalfile is None:
+            self.xrdcalfile = bytes2str(self.xrmmap['xrd1D'].attrs.get('calfile',''))
+        nworkers  = max(1, int(nworkers))
+        nprefetch = max(nworkers, int(nprefetch))
+
+        # readers use these flags, and never change the flags of the file:
+        # rows that turn off a flag do so as they are written, in order
+        flags = (self.flag_xrf, self.flag_xrd1d, self.flag_xrd2d)
+
+        slots = threading.Semaphore(nprefetch)
+        cond  = threading.Condition()
+        state = {'next': irow, 'stop': False}
+        done  = {}
+
+        def reader():
+            while True:
+                # take a slot *before* the next row index, so that the
+                # lowest unwritten rows always hold the slots
+                slots.acquire()
+                with cond:
+                    i = state['next']
+                    state['next'] += 1
+                    if state['stop'] or i >= nrows:
+                        slots.release()
+                        return
+                t0 = time.time()
+                try:
+                    row, err = self.read_rowdata(i, flags=flags), None
+                except:
+                    row, err = None, sys.exc_info()
+                with cond:
+                    done[i] = (row, time.time()-t0, err)
+                    cond.notify_all()
+
+        threads = [threading.Thread(target=reader, name='maprow_reader%i' % i)
+                   for i in range(nworkers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for i in range(irow, nrows):
+                t0 = time.time()
+                with cond:
+                    while i not in done:
+                        cond.wait(0.5)
+                    row, tread, err = done.pop(i)
+                slots.release()
+                if err is not None:
+                    six.reraise(*err)
+                if row is not None:
+                    xrf, xrd1d, xrd2d = row.flags
+                    self.flag_xrf   = self.flag_xrf and xrf
+                    self.flag_xrd1d = self.flag_xrd1d and xrd1d
+                    self.flag_xrd2d = self.flag_xrd2d and xrd2d
+                t1 = time.time()
+                self.process_row(i, row=row, flush=(nrows-i<=1),
+                                 callback=callback)
+                if hasattr(timing_callback, '__call__'):
+                    timing_callback(row=i, read=tread, wait=t1-t0,
+                                    write=time.time()-t1)
+        finally:
+            with cond:
+                state['stop'] = True
+            for thread in threads:
+                slots.release()
+            for thread in threads:
+                thread.join()
+
+    def process(self, maxrow=None, force=False, callback=None,
+                nworkers=1, nprefetch=NPREFETCH, timing_callback=None):
+        """look for more data from raw folder, process if needed
+
+        with nworkers > 1, rows are read and decoded by a pool of nworkers
+        threads, up to nprefetch rows ahead of the row being written to
+        the HDF5 file.  See process_rows_pipelined().
+        """
 
         if not self.check_hostid():
             raise GSEXRM_Exception(NOT_OWNER % self.filename)
@@ -1074,7 +1449,18 @@ class GSEXRM_MapFile(object):
         if force or self.folder_has_newdata():
             irow = self.last_row + 1
             while irow < nrows:
+                # row 0 builds the schema, so is always processed first
+                if nworkers > 1 and irow > 0 and nrows-irow > 1:
+                    self.process_rows_pipelined(irow, nrows, nworkers=nworkers,
+                                                nprefetch=nprefetch,
+                                                callback=callback,
+                                                timing_callback=timing_callback)
+                    break
+                t0 = time.time()
                 self.process_row(irow, flush=(nrows-irow<=1), callback=callback)
+                if hasattr(timing_callback, '__call__'):
+                    timing_callback(row=irow, read=0.0, wait=0.0,
+                                    write=time.time()-t0)
                 irow  = irow + 1
 
         print(datetime.datetime.fromtimestamp(time.time()).strftime('End: %Y-%m-%d %H:%M:%S'))
@@ -1096,16 +1482,21 @@ class GSEXRM_MapFile(object):
             self.calc_pixeltime()
         return self._pixeltime
 
-    def read_rowdata(self, irow, offset=None):
+    def read_rowdata(self, irow, offset=None, flags=None):
         '''read a row worth of raw data from the Map Folder
         returns arrays of data
-        '''
 
-        if self.xrdcalfile is None:
-            self.xrdcalfile = bytes2str(self.xrmmap['xrd1D'].attrs.get('calfile',''))
+        flags, if given, are the (xrf, xrd1d, xrd2d) data flags to read
+        the row with.  The flags of the map file are then left alone,
+        and the master file is not re-read, so that rows can be read in
+        threads: the flags used for the row are row.flags.
+        '''
+        if flags is None:
+            if self.xrdcalfile is None:
+                self.xrdcalfile = bytes2str(self.xrmmap['xrd1D'].attrs.get('calfile',''))
 
-        if self.dimension is None or irow > len(self.rowdata):
-            self.read_master()
+            if self.dimension is None or irow > len(self.rowdata):
+                self.read_master()
 
         if self.folder is None or irow >= len(self.rowdata):
             return
@@ -1116,28 +1507,25 @@ class GSEXRM_MapFile(object):
         #    raise IOError('No XRF or XRD flags provided.')
         #    return
 
-        if scan_version > 1.35 or self.flag_xrd2d or self.flag_xrd1d:
-            yval, xrff, sisf, xpsf, xrdf, etime = self.rowdata[irow]
-
+        yval, xrff, sisf, xpsf, xrdf = self.get_rowfiles(irow)
 
-            if xrff.startswith('None'):
-                xrff = xrff.replace('None', 'xsp3')
-            if sisf.startswith('None'):
-                sisf = sisf.replace('None', 'struck')
-            if xpsf.startswith('None'):
-                xpsf = xpsf.replace('None', 'xps')
-            if xrdf.startswith('None'):
-                xrdf = xrdf.replace('None', 'pexrd')
+        if flags is None:
+            flag_xrf, flag_xrd1d, flag_xrd2d = (self.flag_xrf, self.flag_xrd1d,
+                                                self.flag_xrd2d)
         else:
-            yval, xrff, sisf, xpsf, etime = self.rowdata[irow]
-            xrdf = '_unused_'
+            flag_xrf, flag_xrd1d, flag_xrd2d = flags
 
         if '_unused_' in xrdf:
-            self.flag_xrd1d = False
-            self.flag_xrd2d = False
+            flag_xrd1d = False
+            flag_xrd2d = False
 
         if '_unused_' in xrff:
-            self.flag_xrf = False
+            flag_xrf = False
+
+        if flags is None:
+            self.flag_xrf   = flag_xrf
+            self.flag_xrd1d = flag_xrd1d
+            self.flag_xrd2d = flag_xrd2d
 
         reverse = None # (irow % 2 != 0)
 
@@ -1146,19 +1534,183 @@ class GSEXRM_MapFile(object):
             ioffset = 1
         if offset is not None:
             ioffset = offset
-        self.flag_xrf = self.flag_xrf and xrff != '_unused_'
         return GSEXRM_MapRow(yval, xrff, xrdf, xpsf, sisf, self.folder,
                              irow=irow, nrows_expected=self.nrows_expected,
                              ixaddr=self.ixaddr, dimension=self.dimension,
                              npts=self.npts, reverse=reverse, ioffset=ioffset,
-                             masterfile=self.masterfile, flip=self.flip,
+                             xrftype=self.xrftype, xrdtype=self.xrdtype,
+                             flip=self.flip,
                              xrdcal=self.xrdcalfile, xrd2dmask=self.mask_xrd2d,
                              xrd2dbkgd = self.bkgd_xrd2d,
                              wdg=self.azwdgs, steps=self.qstps,
-                             FLAGxrf=self.flag_xrf, FLAGxrd2D=self.flag_xrd2d,
-                             FLAGxrd1D=self.flag_xrd1d)
+                             FLAGxrf=flag_xrf, FLAGxrd2D=flag_xrd2d,
+                             FLAGxrd1D=flag_xrd1d)
 
 
+    def get_rowfiles(self, irow):
+        """return y value and names of XRF, SIS, XPS, and XRD
+        raw data files for a row"""
+        scan_version = getattr(self, 'scan_version', 1.00)
+        if scan_version > 1.35 or self.flag_xrd2d or self.flag_xrd1d:
+            yval, xrff, sisf, xpsf, xrdf, etime = self.rowdata[irow]
+
+            if xrff.startswith('None'):
+                xrff = xrff.replace('None', 'xsp3')
+            if sisf.startswith('None'):
+                sisf = sisf.replace('None', 'struck')
+            if xpsf.startswith('None'):
+                xpsf = xpsf.replace('None', 'xps')
+            if xrdf.startswith('None'):
+                xrdf = xrdf.replace('None', 'pexrd')
+        else:
+            yval, xrff, sisf, xpsf, etime = self.rowdata[irow]
+            xrdf = '_unused_'
+        return yval, xrff, sisf, xpsf, xrdf
+
+    def row_files_ready(self, irow, settle=0.5):
+        """return whether all raw data files for a row exist
+        and have not been modified for `settle` seconds"""
+        if irow >= len(self.rowdata):
+            return False
+        yval, xrff, sisf, xpsf, xrdf = self.get_rowfiles(irow)
+        fnames = [sisf, xpsf]
+        if self.flag_xrf:
+            fnames.append(xrff)
+        if self.flag_xrd1d or self.flag_xrd2d:
+            fnames.append(xrdf)
+        now = time.time()
+        for fname in fnames:
+            if '_unused_' in fname:
+                continue
+            try:
+                fstat = os.stat(os.path.join(self.folder, fname))
+            except OSError:
+                return False
+            if fstat.st_size < 1 or now - fstat.st_mtime < settle:
+                return False
+        return True
+
+    def row_nbytes(self, irow):
+        "return total size in bytes of the raw data files for a row"
+        yval, xrff, sisf, xpsf, xrdf = self.get_rowfiles(irow)
+        nbytes = 0
+        for fname in (xrff, sisf, xpsf, xrdf):
+            try:
+                nbytes += os.stat(os.path.join(self.folder, fname)).st_size
+            except OSError:
+                pass
+        return nbytes
+
+    def subscribe(self, func):
+        """add a function to be called as
+             func(row=irow, maxrow=nrows, filename=filename)
+        when a row is added by watch()"""
+        if func not in self.subscribers:
+            self.subscribers.append(func)
+
+    def unsubscribe(self, func):
+        "remove a function added with subscribe()"
+        if func in self.subscribers:
+            self.subscribers.remove(func)
+
+    def notify_subscribers(self, irow):
+        for func in self.subscribers[:]:
+            try:
+                func(row=irow, maxrow=len(self.rowdata), filename=self.filename)
+            except:
+                print('Error in map row subscriber %s' % repr(func))
+                print(sys.exc_info())
+
+    def stop_watch(self):
+        "stop a running watch()"
+        self._watch_stop.set()
+
+    def watch(self, timeout=None, poll_time=1.0, settle=0.5, callback=None,
+              subscriber=None, use_inotify=True):
+        """watch the map folder, adding each row to the HDF5 file as soon
+        as all its raw data files are complete, for live map building.
+
+        Parameters:
+          timeout     stop after this many seconds with no new rows [None]
+          poll_time   time (sec) between checks of the folder [1.0]
+          settle      time (sec) a raw data file must be unchanged before
+                      its row is read [0.5]
+          callback    callback for progress, as for process()
+          subscriber  function to add with subscribe()
+          use_inotify whether to use inotify to wait for changes in the
+                      folder, if available [True].  Otherwise, the folder
+                      is polled every poll_time seconds.
+
+        Returns the number of rows added.  Watching stops after the
+        expected number of rows has been added, on timeout, or when
+        stop_watch() is called (for example, from another thread).
+
+        Subscribers are called with the index of each new row.
+        """
+        if not self.check_hostid():
+            raise GSEXRM_Exception(NOT_OWNER % self.filename)
+        if subscriber is not None:
+            self.subscribe(subscriber)
+        self._watch_stop.clear()
+
+        notifier = None
+        if use_inotify and HAS_INOTIFY:
+            try:
+                notifier = INotify()
+                notifier.add_watch(self.folder, (inotify_flags.CLOSE_WRITE |
+                                                 inotify_flags.MOVED_TO |
+                                                 inotify_flags.MODIFY))
+            except (OSError, IOError):
+                notifier = None
+
+        nadded = 0
+        tlast = time.time()
+        try:
+            while not self._watch_stop.is_set():
+                self.read_master()
+                if (self.status == GSEXRM_FileStatus.created and
+                    self.row_files_ready(0, settle=settle)):
+                    self.initialize_xrmmap(callback=callback)
+                    if self.status == GSEXRM_FileStatus.hasdata:
+                        nadded += 1
+                        tlast = time.time()
+                        self.notify_subscribers(0)
+
+                if self.status == GSEXRM_FileStatus.hasdata:
+                    irow = self.last_row + 1
+                    while (not self._watch_stop.is_set() and
+                           self.row_files_ready(irow, settle=settle)):
+                        self.process_row(irow, callback=callback)
+                        if self.last_row < irow:  # row not read, try later
+                            break
+                        nadded += 1
+                        tlast = time.time()
+                        self.notify_subscribers(irow)
+                        irow = self.last_row + 1
+
+                if (self.nrows_expected is not None and
+                    self.last_row+1 >= self.nrows_expected):
+                    break
+                if timeout is not None and time.time()-tlast > timeout:
+                    break
+                if notifier is not None:
+                    notifier.read(timeout=int(1000*poll_time))
+                else:
+                    self._watch_stop.wait(poll_time)
+        finally:
+            if notifier is not None:
+                notifier.close()
+            if nadded > 0:
+                self.resize_arrays(self.last_row+1)
+                if self.flag_pyramid:
+                    self.build_pyramid()
+                self.h5root.flush()
+                if self._pixeltime is None:
+                    self.calc_pixeltime()
+                if hasattr(callback, '__call__'):
+                    callback(filename=self.filename, status='complete')
+        return nadded
+
     def add_rowdata(self, row, callback=None):
         '''adds a row worth of real data'''
 
@@ -1217,6 +1769,8 @@ class GSEXRM_MapFile(object):
                 for idet, gname in enumerate(mca_dets):
                     grp = self.xrmmap[gname]
                     grp['counts'][thisrow, :npts, :] = row.counts[idet, :npts, :]
+                    if 'cumcounts' in grp:
+                        grp['cumcounts'][thisrow, :npts, 1:] = row.counts[idet, :npts, :].cumsum(axis=1)
                     grp['dtfactor'][thisrow,  :npts] = row.dtfactor[idet, :npts]
                     grp['realtime'][thisrow,  :npts] = row.realtime[idet, :npts]
                     grp['livetime'][thisrow,  :npts] = row.livetime[idet, :npts]
@@ -1338,7 +1892,9 @@ class GSEXRM_MapFile(object):
 
         
         if self.flag_xrd2d and row.xrd2d is not None:
-            self.xrmmap['xrd2D/counts'][thisrow,] = row.xrd2d
+            row.xrd2d.write(self.xrmmap['xrd2D/counts'], thisrow)
+        if row.xrd2d is not None:
+            row.xrd2d.close()
 
         self.last_row = thisrow
         self.xrmmap.attrs['Last_Row'] = thisrow
@@ -1367,19 +1923,18 @@ class GSEXRM_MapFile(object):
             nmca, xnpts, nchan = 1, self.npts, 1
 
         if self.chunksize is None:
-            if xnpts < 10: xnpts=10
-            nxx = min(xnpts-1, 2**int(np.log2(xnpts)))
-            nxm = 1024
-            if nxx > 256:
-                nxm = min(1024, int(65536*1.0/ nxx))
-            self.chunksize = (1, nxx, nxm)
+            self.chunksize = calc_chunksize(xnpts, nchan, layout=self.chunk_layout)
+        # 2D maps are read whole, so never split rows into short chunks
+        mapchunks = self.chunksize[:-1]
+        if self.chunk_layout == 'spectrum':
+            mapchunks = (1, npts)
 
         if version_ge(self.version, '2.0.0'):
             sismap = xrmmap['scalars']
             sismap.attrs['type'] = 'scalar detectors'
             for aname in re.findall(r"[\w']+", row.sishead[-1]):
                 sismap.create_dataset(aname, (NINIT, npts), np.float32,
-                                      chunks=self.chunksize[:-1],
+                                      chunks=mapchunks,
                                       maxshape=(None, npts), **self.compress_args)
 
             # positions
@@ -1421,6 +1976,8 @@ class GSEXRM_MapFile(object):
                     dgrp.create_dataset('counts', (NINIT, npts, nchan), np.int16,
                                         chunks=self.chunksize,
                                         maxshape=(None, npts, nchan), **self.compress_args)
+                    if self.flag_cumsum:
+                        self.create_cumcounts(dgrp, NINIT, npts, nchan)
 
                     for name, dtype in (('realtime',  np.int    ),
                                         ('livetime',  np.int    ),
@@ -1436,7 +1993,7 @@ class GSEXRM_MapFile(object):
                         for aname,dtype in (('raw',  np.int16  ),
                                             ('cor',  np.float32)):
                             rgrp.create_dataset(aname, (NINIT, npts), dtype,
-                                                chunks=self.chunksize[:-1],
+                                                chunks=mapchunks,
                                                 maxshape=(None, npts), **self.compress_args)
                         lmtgrp = rgrp.create_dataset('limits', data=en[rlimit])
                         lmtgrp.attrs['type'] = 'energy'
@@ -1461,7 +2018,7 @@ class GSEXRM_MapFile(object):
                     rgrp = dgrp.create_group(rname)
                     for aname,dtype in (('raw',  np.int16  ),('cor',  np.float32)):
                         rgrp.create_dataset(aname, (NINIT, npts), dtype,
-                                            chunks=self.chunksize[:-1],
+                                            chunks=mapchunks,
                                             maxshape=(None, npts), **self.compress_args)
                     lmtgrp = rgrp.create_dataset('limits', data=en[rlimit], **self.compress_args)
                     lmtgrp.attrs['type'] = 'energy'
@@ -1592,7 +2149,8 @@ class GSEXRM_MapFile(object):
                 xrdgrp.create_dataset('mask', (xpixx, xpixy), np.uint16, **self.compress_args)
                 xrdgrp.create_dataset('background', (xpixx, xpixy), np.uint16, **self.compress_args)
 
-                chunksize_2DXRD = (1, npts, xpixx, xpixy)
+                # one frame per chunk, so frames are written and read singly
+                chunksize_2DXRD = (1, 1, xpixx, xpixy)
                 xrdgrp.create_dataset('counts', (NINIT, npts, xpixx, xpixy), np.uint16,
                                       chunks = chunksize_2DXRD,
                                       maxshape=(None, npts, xpixx, xpixy), **self.compress_args)
@@ -1780,6 +2338,8 @@ class GSEXRM_MapFile(object):
             dettype = bytes2str(detgrp.attrs.get('type', '')).lower()
             if 'mca' in dettype:
                 self.flag_xrf   = self.check_flag(detgrp)
+                if 'cumcounts' in detgrp:
+                    self.flag_cumsum = True
             elif 'xrd2d' in dettype:
                 self.flag_xrd2d = self.check_flag(detgrp)
             elif 'xrd1d' in dettype:
@@ -1795,6 +2355,8 @@ class GSEXRM_MapFile(object):
                     self.flag_xrd2d = True
                 except:
                     pass
+        if 'pyramid' in self.xrmmap:
+            self.flag_pyramid = True
 
     def check_flag(self,detgrp):
 
@@ -1833,6 +2395,8 @@ class GSEXRM_MapFile(object):
                     elif type_attr.startswith('mca'):
                         oldnrow, npts, nchan = g['counts'].shape
                         g['counts'].resize((nrow, npts, nchan))
+                        if 'cumcounts' in g:
+                            g['cumcounts'].resize((nrow, npts, nchan+1))
                         for aname in ('livetime', 'realtime',
                                       'inpcounts', 'outcounts', 'dtfactor'):
                             g[aname].resize((nrow, npts))
@@ -2301,24 +2865,76 @@ class GSEXRM_MapFile(object):
                 file_pid == os.getpid())
 
     def folder_has_newdata(self):
-        if self.folder is not None and isGSEXRM_MapFolder(self.folder):
+        if self.folder is not None and self._is_mapfolder():
             self.read_master()
             return (self.last_row < len(self.rowdata)-1)
         return False
 
+    def _is_mapfolder(self):
+        "isGSEXRM_MapFolder() for self.folder, remembering a valid folder"
+        if self.folder is None:
+            return False
+        if self._mapfolder != self.folder:
+            if not isGSEXRM_MapFolder(self.folder):
+                return False
+            self._mapfolder = self.folder
+        return True
+
+    def read_masterfile(self):
+        """read Master file, returning header, rows, and whether
+        the contents have changed since the last read.
+
+        The parsed contents are cached, keyed by file size and
+        modification time.  If the file has grown, as during a scan,
+        only the appended lines are read and parsed.
+        """
+        fname = self.masterfile
+        fstat = os.stat(fname)
+        cache = self._master_cache
+        if cache is not None and cache['filename'] == fname:
+            if (fstat.st_size == cache['size'] and
+                fstat.st_mtime == cache['mtime']):
+                return cache['header'], cache['rows'], False
+            if fstat.st_size < cache['offset']:
+                cache = None
+        else:
+            cache = None
+        if cache is None:
+            cache = {'filename': fname, 'offset': 0,
+                     'header': [], 'rows': []}
+
+        with open(fname, 'rb') as fh:
+            fh.seek(cache['offset'])
+            text = fh.read()
+        # parse only complete lines, leaving a partly written line
+        # to be read next time
+        nread = text.rfind(b'\n') + 1
+        for line in text[:nread].decode('utf-8', 'replace').splitlines():
+            if line.startswith('#') or line.startswith(';'):
+                cache['header'].append(line)
+            else:
+                cache['rows'].append(line.split())
+        cache['offset'] += nread
+        cache['size']  = fstat.st_size
+        cache['mtime'] = fstat.st_mtime
+        self._master_cache = cache
+        return cache['header'], cache['rows'], True
+
     def read_master(self):
         "reads master file for toplevel scan info"
-        if self.folder is None or not isGSEXRM_MapFolder(self.folder):
+        if self.folder is None or not self._is_mapfolder():
             return
         self.masterfile = os.path.join(nativepath(self.folder),self.MasterFile)
         mtime = int(os.stat(self.masterfile).st_mtime)
         self.masterfile_mtime = mtime
 
         try:
-            header, rows = readMasterFile(self.masterfile)
+            header, rows, changed = self.read_masterfile()
         except IOError:
             raise GSEXRM_Exception(
                 "cannot read Master file from '%s'" % self.masterfile)
+        if not changed and self.dimension is not None and len(self.rowdata) > 0:
+            return
 
         self.notes['end_time'] = isotime(os.stat(self.masterfile).st_ctime)
         self.master_header = header
@@ -2334,7 +2950,7 @@ class GSEXRM_MapFile(object):
                                  self.rowdata[il][2])
             # skip repeated rows in master file
             if yval != _yl and (xrff != _xl or sisf != _s1):
-                self.rowdata.append(row)
+                self.rowdata.append(list(row))
             #else:
             #    print(" skip row ", yval, xrff, sisf)
         self.scan_version = 1.00
@@ -2349,6 +2965,10 @@ class GSEXRM_MapFile(object):
                 self.scan_version = words[1].strip()
             elif 'scan.nrows_expected' in words[0].lower():
                 self.nrows_expected = int(words[1].strip())
+            elif line.startswith('#XRF.filetype'):
+                self.xrftype = line.split()[-1]
+            elif line.startswith('#XRD.filetype'):
+                self.xrdtype = line.split()[-1]
         self.scan_version = float(self.scan_version)
 
 
@@ -2368,9 +2988,13 @@ class GSEXRM_MapFile(object):
             for i,addxrd in enumerate(xrd_files):
                 self.rowdata[i].insert(4,addxrd)
 
-        cfile = FastMapConfig()
-        cfile.Read(os.path.join(self.folder, self.ScanFile))
-        self.mapconf = cfile.config
+        scanfile = os.path.join(self.folder, self.ScanFile)
+        scan_mtime = os.stat(scanfile).st_mtime
+        if self._scanconf_mtime != scan_mtime:
+            cfile = FastMapConfig()
+            cfile.Read(scanfile)
+            self.mapconf = cfile.config
+            self._scanconf_mtime = scan_mtime
 
         if self.filename is None:
             self.filename = self.mapconf['scan']['filename']
@@ -2492,56 +3116,121 @@ class GSEXRM_MapFile(object):
             dgroup = self._det_name(det)
             mapdat = self._det_group(det)
 
-        ix, iy, nmca = mapdat['counts'].shape
-
         npix = len(np.where(area)[0])
         if npix < 1:
             return None
-        sy, sx = [slice(min(_a), max(_a)+1) for _a in np.where(area)]
-        xmin, xmax, ymin, ymax = sx.start, sx.stop, sy.start, sy.stop
-        nx, ny = (xmax-xmin), (ymax-ymin)
-        NCHUNKSIZE = 16384 # 8192
-        use_chunks = nx*ny > NCHUNKSIZE
-        step = int((nx*ny)/NCHUNKSIZE)
 
-        if not use_chunks:
-            try:
-                if hasattr(callback , '__call__'):
-                    callback(1, 1, nx*ny)
-                counts = self.get_counts_rect(ymin, ymax, xmin, xmax,
-                                           mapdat=mapdat, area=area,
-                                           dtcorrect=dtcorrect)
-            except MemoryError:
-                use_chunks = True
-        if use_chunks:
-            counts = np.zeros(nmca)
-            if nx > ny:
-                for i in range(step+1):
-                    x1 = xmin + int(i*nx/step)
-                    x2 = min(xmax, xmin + int((i+1)*nx/step))
-                    if x1 >= x2: break
-                    if hasattr(callback , '__call__'):
-                        callback(i, step, (x2-x1)*ny)
-                    counts += self.get_counts_rect(ymin, ymax, x1, x2, mapdat=mapdat,
-                                                det=det, area=area,
-                                                dtcorrect=dtcorrect)
-            else:
-                for i in range(step+1):
-                    y1 = ymin + int(i*ny/step)
-                    y2 = min(ymax, ymin + int((i+1)*ny/step))
-                    if y1 >= y2: break
-                    if hasattr(callback , '__call__'):
-                        callback(i, step, nx*(y2-y1))
-                    counts += self.get_counts_rect(y1, y2, xmin, xmax, mapdat=mapdat,
-                                                det=det, area=area,
-                                                dtcorrect=dtcorrect)
+        dets = [dgroup]
+        if not tomo and 'sum' in dgroup:
+            dets = self.get_mca_detectors()
+
+        counts = self.get_area_cache(areaname, area, dgroup, dtcorrect)
+        if counts is None:
+            counts = self.sum_area_counts(area, dets, dtcorrect=dtcorrect,
+                                          callback=callback)
+            self.set_area_cache(areaname, area, dgroup, dtcorrect, counts)
 
+        sy, sx = [slice(min(_a), max(_a)+1) for _a in np.where(area)]
+        xmin, xmax, ymin, ymax = sx.start, sx.stop, sy.start, sy.stop
         ltime, rtime = self.get_livereal_rect(ymin, ymax, xmin, xmax, det=det,
                                               dtcorrect=dtcorrect, area=area)
         return self._getmca(dgroup, counts, areaname, npixels=npix,
                             real_time=rtime, live_time=ltime)
 
-    def get_mca_rect(self, ymin, ymax, xmin, xmax, det=None, dtcorrect=True):
+    def area_blocks(self, dset, area):
+        """return list of (yslice, xslice, mask) for blocks of an HDF5
+        map dataset that contain pixels of an area mask.  Blocks follow
+        the chunk layout of the dataset, and chunks with no pixels in
+        the area are skipped.
+        """
+        nrow, npts = dset.shape[:2]
+        area = np.asarray(area, dtype=bool)[:nrow, :npts]
+        chunks = dset.chunks
+        if chunks is None:
+            chunks = (1, npts)
+        cy, cx = chunks[0], chunks[1]
+        ys, xs = np.where(area)
+        if len(ys) < 1:
+            return []
+        blocks = []
+        for y0 in range(ys.min() - ys.min() % cy, ys.max()+1, cy):
+            for x0 in range(xs.min() - xs.min() % cx, xs.max()+1, cx):
+                sub = area[y0:y0+cy, x0:x0+cx]
+                if not sub.any():
+                    continue
+                ry, rx = np.where(sub)
+                sy = slice(y0 + ry.min(), y0 + ry.max()+1)
+                sx = slice(x0 + rx.min(), x0 + rx.max()+1)
+                blocks.append((sy, sx, area[sy, sx]))
+        return blocks
+
+    def sum_area_counts(self, area, dets, dtcorrect=True, callback=None):
+        """return counts summed over an area mask for a list of
+        detector groups, optionally dead-time corrected.
+
+        The counts are read block by block along the HDF5 chunk layout,
+        skipping chunks with no pixels in the area.
+        """
+        blocks = self.area_blocks(self.xrmmap[dets[0]]['counts'], area)
+        counts = None
+        for iblock, (sy, sx, mask) in enumerate(blocks):
+            if hasattr(callback , '__call__'):
+                callback(iblock, len(blocks), mask.sum())
+            for det in dets:
+                grp = self.xrmmap[det]
+                cts = grp['counts'][sy, sx][mask]
+                if dtcorrect and 'dtfactor' in grp:
+                    dtfact = grp['dtfactor'][sy, sx][mask].astype(np.float64)
+                    cts = cts * dtfact[:, np.newaxis]
+                cts = cts.sum(axis=0)
+                counts = cts if counts is None else counts + cts
+        return counts
+
+    def _area_cache_name(self, areaname, dgroup, dtcorrect):
+        ext = 'cor' if dtcorrect else 'raw'
+        return '%s__%s_%s' % (areaname, dgroup.replace('/', '_'), ext)
+
+    def _area_hash(self, area):
+        area = np.asarray(area, dtype=bool)
+        md5 = hashlib.md5(six.b(repr(area.shape)))
+        md5.update(np.packbits(area).tobytes())
+        return md5.hexdigest()
+
+    def get_area_cache(self, areaname, area, dgroup, dtcorrect):
+        """return cached summed counts for an area, or None if
+        not cached or if the area mask or map data have changed"""
+        if 'area_spectra' not in self.xrmmap:
+            return None
+        cache = self.xrmmap['area_spectra']
+        name = self._area_cache_name(areaname, dgroup, dtcorrect)
+        if name not in cache:
+            return None
+        dset = cache[name]
+        if (h5str(dset.attrs.get('mask_hash', '')) != self._area_hash(area) or
+            int(dset.attrs.get('last_row', -2)) != self.last_row):
+            return None
+        return dset[:]
+
+    def set_area_cache(self, areaname, area, dgroup, dtcorrect, counts):
+        """save summed counts for an area, keyed by area name, detector,
+        and a hash of the area mask"""
+        if counts is None or not self.check_hostid():
+            return
+        try:
+            cache = ensure_subgroup('area_spectra', self.xrmmap)
+            cache.attrs['type'] = 'area spectra cache'
+            name = self._area_cache_name(areaname, dgroup, dtcorrect)
+            if name in cache:
+                del cache[name]
+            dset = cache.create_dataset(name, data=counts)
+            dset.attrs['mask_hash'] = self._area_hash(area)
+            dset.attrs['last_row'] = self.last_row
+            self.h5root.flush()
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def get_mca_rect(self, ymin, ymax, xmin, xmax, det=None, dtcorrect=True,
+                     level=0):
         '''return mca counts for a map rectangle, optionally
 
         Parameters
@@ -2552,12 +3241,21 @@ class GSEXRM_MapFile(object):
         xmax :       int       high x index
         det :        optional, None or int         index of detector
         dtcorrect :  optional, bool [True]         dead-time correct data
+        level :      optional, int [0]             pyramid level: indices are for
+                                                   maps binned by 2**level
 
         Returns
         -------
         MCA object for XRF counts in rectangle
 
+        Notes
+        -----
+        for level > 0, the binned spectra of the pyramid (see build_pyramid)
+        are used.  These are only stored for the dead-time corrected sum
+        of detectors, so `det` and `dtcorrect` are ignored.
         '''
+        if level > 0:
+            return self._get_mca_rect_level(ymin, ymax, xmin, xmax, level)
 
         dgroup = self._det_name(det)
         mapdat = self._det_group(det)
@@ -2571,6 +3269,191 @@ class GSEXRM_MapFile(object):
         return self._getmca(dgroup, counts, name, npixels=npix,
                             real_time=rtime, live_time=ltime)
 
+    def _get_mca_rect_level(self, ymin, ymax, xmin, xmax, level):
+        "get_mca_rect() for a pyramid level"
+        path = 'pyramid/level%i/mcasum/counts' % level
+        if path not in self.xrmmap:
+            raise GSEXRM_Exception("no pyramid level %i for summed spectra" % level)
+        counts = self.xrmmap[path][ymin:ymax, xmin:xmax, :]
+        counts = counts.sum(axis=0).sum(axis=0)
+        scale = 2**level
+        name = 'rect(y=[%i:%i], x==[%i:%i], level=%i)' % (ymin, ymax, xmin, xmax, level)
+        npix = (ymax-ymin+1)*(xmax-xmin+1)*scale*scale
+        ltime, rtime = self.get_livereal_rect(ymin*scale, ymax*scale,
+                                              xmin*scale, xmax*scale, det=None,
+                                              area=None)
+        return self._getmca('mcasum', counts, name, npixels=npix,
+                            real_time=rtime, live_time=ltime)
+
+    def build_pyramid(self, nlevels=None):
+        """build a pyramid of multi-resolution summaries of the map:
+        ROI maps, scalars, and summed (dead-time corrected) spectra,
+        binned by 2x2, 4x4, ..., stored in groups 'pyramid/level1',
+        'pyramid/level2', ...
+
+        Parameters
+        ---------
+        nlevels :  optional, int [None]    number of levels.  By default,
+                   levels are added until the map is smaller than
+                   PYRAMID_MINSIZE pixels on a side.
+        """
+        if not self.check_hostid():
+            raise GSEXRM_Exception(NOT_OWNER % self.filename)
+        if not version_ge(self.version, '2.0.0'):
+            print('pyramid not supported for map file version %s' % self.version)
+            return
+        xrmmap = self.xrmmap
+        ny, nx = xrmmap['positions/pos'].shape[:2]
+        if nlevels is None:
+            nlevels = 0
+            while max(ny, nx) > PYRAMID_MINSIZE*2**nlevels:
+                nlevels += 1
+        if 'pyramid' in xrmmap:
+            del xrmmap['pyramid']
+        pgrp = xrmmap.create_group('pyramid')
+        pgrp.attrs['type'] = 'pyramid'
+        pgrp.attrs['desc'] = 'binned ROI maps and summed spectra'
+        pgrp.attrs['nlevels'] = nlevels
+        if nlevels < 1:
+            return
+
+        paths = ['scalars/%s' % name for name in xrmmap['scalars']]
+        for det, dgrp in xrmmap['roimap'].items():
+            for roi, rgrp in dgrp.items():
+                for aname in ('raw', 'cor'):
+                    if aname in rgrp:
+                        paths.append('roimap/%s/%s/%s' % (det, roi, aname))
+
+        for path in paths:
+            data = xrmmap[path][:]
+            for level in range(1, nlevels+1):
+                data = bin_map2(data)
+                self.add_data(pgrp, 'level%i/%s' % (level, path), data)
+
+        if 'mcasum' in xrmmap and 'counts' in xrmmap['mcasum']:
+            src = xrmmap['mcasum/counts']
+            for level in range(1, nlevels+1):
+                nrow, npts, nchan = src.shape
+                dst = pgrp.create_dataset('level%i/mcasum/counts' % level,
+                                          ((nrow+1)//2, (npts+1)//2, nchan), np.int32,
+                                          chunks=(1, (npts+1)//2, min(nchan, 1024)),
+                                          **self.compress_args)
+                for irow in range(0, nrow, 2):
+                    dst[irow//2] = bin_map2(src[irow:irow+2])[0]
+                src = dst
+        self.h5root.flush()
+
+    def benchmark_access(self, det=None, nsample=16, roiwidth=20):
+        """time reading full spectra at single pixels and ROI maps
+        for the counts of a detector, see benchmark_counts()"""
+        return benchmark_counts(self._det_group(det)['counts'],
+                                nsample=nsample, roiwidth=roiwidth)
+
+    def repack(self, filename=None, chunk_layout='spectrum',
+               compression=COMPRESSION, compression_opts=COMPRESSION_OPTS,
+               benchmark=True, callback=None):
+        """rewrite map file with a new chunk layout and compression
+
+        Parameters
+        ---------
+        filename :         optional, str [None]   name of new file. If None,
+                                                  this map file is replaced.
+        chunk_layout :     optional, str ['spectrum']  one of CHUNK_LAYOUTS
+        compression :      optional, str ['gzip']      see get_compress_args()
+        compression_opts : optional, int [2]           compression level,
+                                                       see get_compress_args()
+        benchmark :        optional, bool [True]       time reads before and after
+        callback :         optional, function          called as callback(name=name)
+                                                       for each dataset copied
+
+        Returns
+        -------
+        dict with 'filename' and, with benchmark, 'before' and 'after'
+        results of benchmark_access()
+        """
+        if not self.check_hostid():
+            raise GSEXRM_Exception(NOT_OWNER % self.filename)
+        if chunk_layout not in CHUNK_LAYOUTS:
+            raise GSEXRM_Exception("chunk_layout must be one of %s" % repr(CHUNK_LAYOUTS))
+        compress_args = get_compress_args(compression, compression_opts)
+
+        report = {}
+        if benchmark:
+            report['before'] = self.benchmark_access()
+
+        self.xrmmap.attrs['Last_Row'] = self.last_row
+        self.h5root.flush()
+        replace = filename is None
+        if replace:
+            filename = '%s.repack' % self.filename
+
+        def is_spectra(name, dset):
+            return (len(dset.shape) == 3 and dset.chunks is not None and
+                    name.split('/')[-1] == 'counts')
+
+        def copy_attrs(src, dst):
+            for key, val in src.attrs.items():
+                dst.attrs[key] = val
+
+        out = h5py.File(filename, 'w')
+        try:
+            copy_attrs(self.h5root, out)
+            def copy(name, obj):
+                if isinstance(obj, h5py.Group):
+                    copy_attrs(obj, out.require_group(name))
+                    return
+                if callback is not None:
+                    callback(name=name)
+                if obj.chunks is None:
+                    dset = out.create_dataset(name, data=obj[()])
+                else:
+                    chunks = obj.chunks
+                    if is_spectra(name, obj):
+                        chunks = calc_chunksize(obj.shape[1], obj.shape[2],
+                                                layout=chunk_layout)
+                    dset = out.create_dataset(name, obj.shape, obj.dtype,
+                                              chunks=chunks, maxshape=obj.maxshape,
+                                              **compress_args)
+                    if len(obj.shape) > 1:
+                        for i in range(0, obj.shape[0], chunks[0]):
+                            dset[i:i+chunks[0]] = obj[i:i+chunks[0]]
+                    else:
+                        dset[...] = obj[...]
+                copy_attrs(obj, dset)
+            self.h5root.visititems(copy)
+            xrmmap = out[self.xrmmap.name]
+            xrmmap.attrs['Compression'] = compress_string(compression, compression_opts)
+            xrmmap.attrs['Chunk_Layout'] = chunk_layout
+        finally:
+            out.close()
+
+        if replace:
+            self.h5root.close()
+            self.h5root = None
+            replace_file(filename, self.filename)
+            filename = self.filename
+            self.open(self.filename, root=self.root, check_status=False)
+            self.chunksize = None
+            self.chunk_layout = chunk_layout
+            self.compress_args = compress_args
+            self.compress_desc = compress_string(compression, compression_opts)
+        report['filename'] = filename
+
+        if benchmark:
+            if replace:
+                report['after'] = self.benchmark_access()
+            else:
+                with h5py.File(filename, 'r') as fh:
+                    dgroup = self._det_group(None).name
+                    report['after'] = benchmark_counts(fh[dgroup]['counts'])
+            print('repacked %s' % filename)
+            for key in ('before', 'after'):
+                rep = report[key]
+                print(' %6s: chunks=%s compression=%s spectrum=%.2f ms roimap=%.2f ms' %
+                      (key, repr(rep['chunks']), rep['compression'],
+                       1000*rep['spectrum'], 1000*rep['roimap']))
+        return report
+
     def get_counts_rect(self, ymin, ymax, xmin, xmax, mapdat=None, det=None,
                         area=None, dtcorrect=True, tomo=False):
         '''return counts for a map rectangle, optionally
@@ -2805,6 +3688,11 @@ class GSEXRM_MapFile(object):
         except:
             pass
 
+        if xrddir == 'xrd2D':
+            # frames are summed a block at a time, in chunk order
+            counts = GSEXRM_FrameStack(mapdat['counts']).sum_area(area, callback=callback)
+            return self._getXRD(mapname, counts, areaname, xrddir, **kws)
+
         sy, sx = [slice(min(_a), max(_a)+1) for _a in np.where(area)]
         xmin, xmax, ymin, ymax = sx.start, sx.stop, sy.start, sy.stop
         nx, ny = (xmax-xmin), (ymax-ymin)
@@ -3045,6 +3933,64 @@ class GSEXRM_MapFile(object):
 
         return roigroup,det_list,sumdet
 
+    def create_cumcounts(self, dgrp, nrow, npts, nchan):
+        """create dataset of counts summed over channels for an mca
+        detector group: cumcounts[:, :, i] = counts[:, :, :i].sum(axis=2),
+        so that the map for any range of channels is the difference of
+        two slices.  Chunks hold a few channels for all pixels in a row.
+        """
+        return dgrp.create_dataset('cumcounts', (nrow, npts, nchan+1), np.int32,
+                                   chunks=(1, npts, min(CUMSUM_CHUNK, nchan+1)),
+                                   maxshape=(None, npts, nchan+1),
+                                   **self.compress_args)
+
+    def add_cumcounts(self):
+        """add cumulative counts (see create_cumcounts) to each
+        mca detector of an existing map file"""
+        if not self.check_hostid():
+            raise GSEXRM_Exception(NOT_OWNER % self.filename)
+        for det in self.get_mca_detectors():
+            dgrp = self.xrmmap[det]
+            if 'cumcounts' in dgrp:
+                continue
+            nrow, npts, nchan = dgrp['counts'].shape
+            cumcounts = self.create_cumcounts(dgrp, nrow, npts, nchan)
+            for irow in range(nrow):
+                cumcounts[irow, :, 1:] = dgrp['counts'][irow].cumsum(axis=1)
+        self.flag_cumsum = True
+        self.h5root.flush()
+
+    def get_mca_detectors(self):
+        "list of names of real (not summed) mca detector groups"
+        return [det for det in sorted(self.xrmmap.keys()) if
+                bytes2str(self.xrmmap[det].attrs.get('type', '')).startswith('mca det')]
+
+    def get_channel_range(self, det, emin=None, emax=None, by_energy=True):
+        """return channel range (imin, imax) for an mca detector
+        for energies (in keV) or channels emin to emax"""
+        dgrp = self.xrmmap[det]
+        nchan = dgrp['counts'].shape[-1]
+        if not by_energy:
+            imin = 0 if emin is None else emin
+            imax = nchan if emax is None else emax
+        else:
+            eaxis = dgrp['energy'][:]
+            imin, imax = 0, nchan
+            if emin is not None:
+                imin = (np.abs(eaxis-emin)).argmin()
+            if emax is not None:
+                imax = (np.abs(eaxis-emax)).argmin()+1
+        return int(max(0, imin)), int(min(nchan, imax))
+
+    def get_channel_counts(self, det, imin, imax):
+        """return map of counts in channels imin to imax-1 for an mca
+        detector, using cumulative counts if available"""
+        dgrp = self.xrmmap[det]
+        if 'cumcounts' in dgrp:
+            cumcounts = dgrp['cumcounts']
+            return cumcounts[:, :, imax].astype(np.int64) - cumcounts[:, :, imin]
+        return dgrp['counts'][:, :, imin:imax].sum(axis=2)
+
     def add_xrfroi(self, Erange, roiname, unit='keV'):
 
         if not self.flag_xrf:
@@ -3060,24 +4006,14 @@ class GSEXRM_MapFile(object):
             if roiname in roigroup[det]:
                 raise ValueError("Name '%s' exists in 'roimap/%s' arrays." % (roiname,det))
 
-        roi_limits,dtfctrs,icounts = [],[],[]
+        detraw, detcor = [], []
         for det in det_list:
-            xrmdet = self.xrmmap[det]
-            if unit.startswith('chan'):
-                imin,imax = Erange
-            else:
-                Eaxis = xrmdet['energy'][:]
+            imin, imax = self.get_channel_range(det, emin=Erange[0], emax=Erange[1],
+                                                by_energy=not unit.startswith('chan'))
+            raw = self.get_channel_counts(det, imin, imax)
+            detraw += [raw]
+            detcor += [raw*self.xrmmap[det]['dtfactor'][:]]
 
-                imin = (np.abs(Eaxis-Erange[0])).argmin()
-                imax = (np.abs(Eaxis-Erange[1])).argmin()+1
-
-
-            roi_limits += [[int(imin), int(imax)]]
-            dtfctrs += [xrmdet['dtfactor']]
-            icounts += [np.array(xrmdet['counts'][:])]
-
-        detraw = [icnt[:,:,slice(*islc)].sum(axis=2)        for icnt,islc        in zip(icounts,roi_limits)]
-        detcor = [icnt[:,:,slice(*islc)].sum(axis=2)*dtfctr for icnt,islc,dtfctr in zip(icounts,roi_limits,dtfctrs)]
         detraw = np.einsum('kij->ijk', detraw)
         detcor = np.einsum('kij->ijk', detcor)
 
@@ -3158,7 +4094,8 @@ class GSEXRM_MapFile(object):
         return roiname, detname
 
 
-    def get_roimap(self, roiname, det=None, hotcols=False, dtcorrect=True):
+    def get_roimap(self, roiname, det=None, hotcols=False, dtcorrect=True,
+                   level=0):
         '''extract roi map for a pre-defined roi by name
 
         Parameters
@@ -3167,11 +4104,16 @@ class GSEXRM_MapFile(object):
         det        :  str                       detector name
         dtcorrect  :  optional, bool [True]     dead-time correct data
         hotcols    :  optional, bool [False]    suppress hot columns
+        level      :  optional, int [0]         pyramid level: return map
+                                                binned (summed) by 2**level
 
         Returns
         -------
         ndarray for ROI data
         '''
+        if level > 0:
+            return self._get_roimap_level(roiname, det=det, hotcols=hotcols,
+                                          dtcorrect=dtcorrect, level=level)
 
         #scan_version = getattr(self, 'scan_version', 1.00)
         #hotcols = hotcols or scan_version < 1.36
@@ -3223,13 +4165,75 @@ class GSEXRM_MapFile(object):
                 return self.xrmmap[detname][:, :, roi]
 
 
+    def _get_roimap_level(self, roiname, det=None, hotcols=False,
+                          dtcorrect=True, level=1):
+        """get_roimap() for a pyramid level, binning the full
+        map if the ROI is not in the pyramid"""
+        ppath = None
+        if roiname not in ('1', 1) and version_ge(self.version, '2.0.0'):
+            roi, dpath = self.check_roi(roiname, det)
+            if type(roiname) is str and roiname.endswith('raw'):
+                dtcorrect = False
+            ext = 'cor' if dtcorrect else 'raw'
+            if dpath.startswith('roimap'):
+                path = '%s/%s/%s' % (dpath, roi, ext)
+            else:
+                path = '%s/%s' % (dpath, roi if ext == 'cor' else '%s_raw' % roi)
+            ppath = 'pyramid/level%i/%s' % (level, path)
+        if ppath is not None and ppath in self.xrmmap:
+            out = self.xrmmap[ppath][:]
+        else:
+            out = self.get_roimap(roiname, det=det, dtcorrect=dtcorrect)
+            for i in range(level):
+                out = bin_map2(out)
+        if hotcols:
+            out = out[:, 1:-1]
+        return out
+
     def get_mca_erange(self, det=None, dtcorrect=True,
                        emin=None, emax=None, by_energy=True):
-        '''extract map for an ROI set here, by energy range:
+        '''extract map for an ROI set here, by energy range
 
-        not implemented
+        Parameters
+        ---------
+        det        :  str or int                detector name or number [None]
+                                                None or 'mcasum' means the sum
+                                                of all detectors
+        dtcorrect  :  optional, bool [True]     dead-time correct data
+        emin       :  optional, float [None]    low end of range
+        emax       :  optional, float [None]    high end of range
+        by_energy  :  optional, bool [True]     emin, emax are energies (keV),
+                                                otherwise channel numbers
+
+        Returns
+        -------
+        ndarray for ROI data
+
+        Notes
+        -----
+        this is fast (two slices per detector) for map files with
+        cumulative counts, see FLAGcumsum and add_cumcounts().
         '''
-        pass
+        det_list = self.get_mca_detectors()
+        if (type(det) is str and det.isdigit()) or type(det) is int:
+            det = 'mca%i' % int(det)
+        if det is not None:
+            det = det.replace('det', 'mca')
+            if det in det_list:
+                det_list = [det]
+            elif det != 'mcasum':
+                raise ValueError("detector '%s' not found: use one of %s" %
+                                 (det, ', '.join(det_list + ['mcasum'])))
+
+        out = None
+        for dname in det_list:
+            imin, imax = self.get_channel_range(dname, emin=emin, emax=emax,
+                                                by_energy=by_energy)
+            dmap = self.get_channel_counts(dname, imin, imax)
+            if dtcorrect:
+                dmap = dmap*self.xrmmap[dname]['dtfactor'][:]
+            out = dmap if out is None else out + dmap
+        return out
 
     def get_rgbmap(self, rroi, groi, broi, det=None, rdet=None, gdet=None, bdet=None,
                    hotcols=True, dtcorrect=True, scale_each=True, scales=None):
@@ -3362,9 +4366,26 @@ def read_fake1(filename, root=None):
 def read_fake2(filename, root=None):
     raise ValueError("cannot open %s" % filename)
 
-def process_mapfolder(path, take_ownership=False, **kws):
+def repack_mapfile(filename, newfile=None, chunk_layout='spectrum',
+                   compression=COMPRESSION, compression_opts=COMPRESSION_OPTS,
+                   root=None, benchmark=True):
+    """rewrite a map file with a new chunk layout and compression,
+    printing read timings before and after.  See GSEXRM_MapFile.repack()
+    """
+    g = GSEXRM_MapFile(filename=filename, root=root)
+    try:
+        return g.repack(filename=newfile, chunk_layout=chunk_layout,
+                        compression=compression,
+                        compression_opts=compression_opts,
+                        benchmark=benchmark)
+    finally:
+        g.close()
+
+def process_mapfolder(path, take_ownership=False, nworkers=1, **kws):
     """process a single map folder
     with optional keywords passed to GSEXRM_MapFile
+
+    with nworkers > 1, rows are read with a pool of reader threads
     """
     try:
         kws['xrdcal'] = kws.pop('poni')
@@ -3382,7 +4403,7 @@ def process_mapfolder(path, take_ownership=False, **kws):
             if take_ownership:
                 g.take_ownership()
             if g.check_ownership():
-                g.process()
+                g.process(nworkers=nworkers)
             else:
                 print( 'Skipping file %s: not owner' % path)
         except KeyboardInterrupt:
@@ -3394,9 +4415,73 @@ def process_mapfolder(path, take_ownership=False, **kws):
         finally:
             g.close()
 
-def process_mapfolders(folders, ncpus=None, take_ownership=False, **kws):
+def process_maprows(path, nrows=None, nworkers=1, take_ownership=False, **kws):
+    """process up to nrows new rows of a map folder, resuming after the
+    last row already in its HDF5 file, and close the file.
+
+    Returns
+    -------
+    dict with 'path', first row 'irow', number of rows 'nrows' processed,
+    'last_row' in file, 'total' number of rows in folder, bytes of raw
+    data read 'nbytes', elapsed 'time', and 'error' (None or traceback)
+    """
+    out = {'path': path, 'irow': 0, 'nrows': 0, 'last_row': -1, 'total': 0,
+           'nbytes': 0, 'time': 0.0, 'error': None}
+    t0 = time.time()
+    g = None
+    try:
+        g = GSEXRM_MapFile(folder=path, **kws)
+        if take_ownership:
+            g.take_ownership()
+        if not g.check_ownership():
+            raise GSEXRM_Exception(NOT_OWNER % g.filename)
+        irow = out['irow'] = g.last_row + 1
+        maxrow = None if nrows is None else irow + nrows
+        g.process(maxrow=maxrow, nworkers=nworkers)
+        out['nrows'] = g.last_row + 1 - irow
+        out['nbytes'] = sum([g.row_nbytes(i) for i in range(irow, g.last_row+1)])
+        out['total'] = len(g.rowdata)
+    except KeyboardInterrupt:
+        raise
+    except:
+        out['error'] = traceback.format_exc()
+    finally:
+        if g is not None and g.h5root is not None:
+            out['last_row'] = g.last_row
+            g.close()
+    out['time'] = time.time() - t0
+    return out
+
+def _process_maprows(args):
+    "process_maprows() for a tuple of args, for multiprocessing"
+    path, nrows, nworkers, kws = args
+    return process_maprows(path, nrows=nrows, nworkers=nworkers, **kws)
+
+def _mapfolder_nrows(path):
+    "number of rows listed in the Master file of a map folder"
+    header, rows = readMasterFile(os.path.join(path, 'Master.dat'))
+    return len(rows)
+
+def process_mapfolders(folders, ncpus=None, take_ownership=False,
+                       rows_per_task=ROWS_PER_TASK, progress_file=None, **kws):
     """process a list of map folders
     with optional keywords passed to GSEXRM_MapFile
+
+    Each folder is processed in tasks of rows_per_task rows, in a pool of
+    ncpus processes.  Only one task at a time works on any folder, so that
+    each HDF5 file has a single writer.  Idle processes take the folder
+    with the most rows left, and when there are fewer unfinished folders
+    than processes, the rows of each task are read with more threads.
+
+    Each task closes its HDF5 file with the last row written, so that an
+    interrupted conversion resumes from there.  With progress_file, the
+    state of each folder is also saved as JSON, and folders completed in
+    an earlier run are skipped.
+
+    Returns
+    -------
+    dict of {folder: status} with 'nrows', 'last_row', 'total', 'nbytes',
+    'time', 'status' ('done', 'failed', or 'pending') and 'error'
     """
     try:
         kws['xrdcal'] = kws.pop('poni')
@@ -3404,14 +4489,98 @@ def process_mapfolders(folders, ncpus=None, take_ownership=False, **kws):
         pass
     if ncpus is None:
         ncpus = max(1, mp.cpu_count()-1)
-    if ncpus == 0:
-        for path in folders:
-            process_mapfolder(path, **kws)
-    else:
-        pool = mp.Pool(ncpus)
-        kws['take_ownership'] = take_ownership
-        myfunc = partial(process_mapfolder, **kws)
-        pool.map(myfunc, folders)
+    kws['take_ownership'] = take_ownership
+
+    progress = {}
+    if progress_file is not None and os.path.exists(progress_file):
+        with open(progress_file, 'r') as fh:
+            progress = json.load(fh)
+
+    status = {}
+    for path in folders:
+        if not (os.path.isdir(path) and isGSEXRM_MapFolder(path)):
+            print('Skipping %s: not a map folder' % path)
+            continue
+        total = _mapfolder_nrows(path)
+        prev = progress.get(path, {})
+        if prev.get('status') == 'done' and prev.get('total') == total:
+            print('Skipping %s: done' % path)
+            continue
+        status[path] = {'nrows': 0, 'last_row': prev.get('last_row', -1),
+                        'total': total, 'nbytes': 0, 'time': 0.0,
+                        'status': 'pending', 'error': None}
+
+    def save_progress():
+        if progress_file is not None:
+            progress.update(status)
+            with open(progress_file, 'w') as fh:
+                json.dump(progress, fh, indent=1)
+
+    def next_tasks(running, nslots):
+        "pick folders for idle slots, those with the most rows left first"
+        waiting = [p for p, st in status.items()
+                   if st['status'] == 'pending' and p not in running]
+        waiting.sort(key=lambda p: status[p]['last_row']-status[p]['total'])
+        nactive = max(1, len(running) + len(waiting))
+        nworkers = max(1, ncpus // nactive)
+        return [(p, rows_per_task, nworkers, kws) for p in waiting[:nslots]]
+
+    def report(result):
+        path = result['path']
+        st = status[path]
+        for key in ('nrows', 'nbytes', 'time'):
+            st[key] += result[key]
+        st['last_row'] = result['last_row']
+        st['total'] = max(st['total'], result['total'])
+        if result['error'] is not None:
+            st['status'] = 'failed'
+            st['error'] = result['error']
+            print('Could not convert %s:\n%s' % (path, result['error']))
+        elif result['nrows'] < 1 or st['last_row'] >= st['total']-1:
+            st['status'] = 'done'
+        dt = max(result['time'], 1.e-9)
+        print('%s: rows %i to %i of %i, %.2f rows/s, %.2f MB/s' %
+              (path, result['irow'], result['last_row'], st['total'],
+               result['nrows']/dt, result['nbytes']/(1.e6*dt)))
+        save_progress()
+
+    running = set()
+    try:
+        if ncpus == 0:
+            while True:
+                tasks = next_tasks(running, 1)
+                if len(tasks) < 1:
+                    break
+                report(_process_maprows(tasks[0]))
+        else:
+            pool = mp.Pool(ncpus)
+            results = []
+            while True:
+                for args in next_tasks(running, ncpus-len(running)):
+                    running.add(args[0])
+                    results.append(pool.apply_async(_process_maprows, (args,)))
+                if len(results) < 1:
+                    break
+                ready = [r for r in results if r.ready()]
+                if len(ready) < 1:
+                    time.sleep(0.1)
+                    continue
+                for r in ready:
+                    results.remove(r)
+                    result = r.get()
+                    running.discard(result['path'])
+                    report(result)
+            pool.close()
+            pool.join()
+    finally:
+        save_progress()
+
+    for path, st in status.items():
+        dt = max(st['time'], 1.e-9)
+        print('%s: %s, %i rows in %.1f s, %.2f rows/s, %.2f MB/s' %
+              (path, st['status'], st['nrows'], st['time'],
+               st['nrows']/dt, st['nbytes']/(1.e6*dt)))
+    return status
 
 
 def registerLarchPlugin():
@@ -3420,5 +4589,7 @@ def registerLarchPlugin():
                     'read_fake1': read_fake1,
                     'read_fake2': read_fake2,
                     'process_mapfolder': process_mapfolder,
+                    'repack_mapfile': repack_mapfile,
+                    'process_maprows': process_maprows,
                     'process_mapfolders': process_mapfolders})
 
@@ -82,40 +82,48 @@ def read_xsp3_hdf5(fname, npixels=None, verbose=False,
     t1 = time.time()
     if ndpix < npix:
         out.counts = np.zeros((npix, ndet, nchan), dtype='f8')
-        out.counts[:ndpix, :, :]  = counts[:]
+        counts.read_direct(out.counts, np.s_[:ndpix], np.s_[:ndpix])
     else:
-        out.counts = counts[:]
+        out.counts = counts[:ndpix]
 
     if estimate_dtc:
         dtc_taus = XSPRESS3_TAUS
         if _larch is not None and _larch.symtable.has_symbol('_sys.gsecars.xspress3_taus'):
             dtc_taus = _larch.symtable._sys.gsecars.xspress3_taus
 
-    for i in range(ndet):
-        chan = "CHAN%i" %(i+1)
-        clock_ticks = ndattr['%sSCA0' % chan].value
-        reset_ticks = ndattr["%sSCA1" % chan].value
-        all_events  = ndattr["%sSCA3" % chan].value
-        if "%sEventWidth" in ndattr:
-            event_width = 1.0 + ndattr['%sEventWidth' % chan].value
-        else:
-            event_width = 6.0
-
-        clock_ticks[np.where(clock_ticks<10)] = 10.0
-        rtime = clockrate * clock_ticks
-        out.realTime[:, i] = rtime
-        out.liveTime[:, i] = rtime
-        ocounts = out.counts[:, i, 1:-1].sum(axis=1)
-        ocounts[np.where(ocounts<0.1)] = 0.1
-        out.outputCounts[:, i] = ocounts
-
-        dtfactor = clock_ticks/(clock_ticks - (all_events*event_width + reset_ticks))
-        out.inputCounts[:, i] = dtfactor * ocounts
-
-        if estimate_dtc:
-            ocr = ocounts/(rtime*1.e-6)
+    # NDAttributes for all channels as (npix, ndet) arrays, with
+    # default used for channels without the attribute
+    def chan_attrs(fmt, default=None):
+        out = np.empty((npix, ndet), dtype='f8')
+        for i in range(ndet):
+            name = fmt % (i+1)
+            if default is not None and name not in ndattr:
+                out[:, i] = default
+            else:
+                out[:, i] = ndattr[name][()]
+        return out
+
+    clock_ticks = chan_attrs('CHAN%iSCA0')
+    reset_ticks = chan_attrs('CHAN%iSCA1')
+    all_events  = chan_attrs('CHAN%iSCA3')
+    event_width = 1.0 + chan_attrs('CHAN%iEventWidth', default=5.0)
+
+    clock_ticks[np.where(clock_ticks<10)] = 10.0
+    rtime = clockrate * clock_ticks
+    out.realTime[:, :] = rtime
+    out.liveTime[:, :] = rtime
+    ocounts = out.counts[:, :, 1:-1].sum(axis=2, dtype='f8')
+    ocounts[np.where(ocounts<0.1)] = 0.1
+    out.outputCounts[:, :] = ocounts
+
+    dtfactor = clock_ticks/(clock_ticks - (all_events*event_width + reset_ticks))
+    out.inputCounts[:, :] = dtfactor * ocounts
+
+    if estimate_dtc:
+        for i in range(ndet):
+            ocr = ocounts[:, i]/(rtime[:, i]*1.e-6)
             icr = estimate_icr(ocr, dtc_taus[i], niter=3)
-            out.inputCounts[:, i] = icr * (rtime*1.e-6)
+            out.inputCounts[:, i] = icr * (rtime[:, i]*1.e-6)
 
     h5file.close()
     t2 = time.time()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for symbol lookup in Larch scripts
+
+Each script is dominated by name lookups: builtins and math functions
+found late in the search path, members of groups, and local variables
+of Procedures.  The scripts are run with the SymbolTable lookup cache
+(_sys.lookup_cache) on and off, and with and without compilation of
+loops, and the best of several runs is reported.
+
+usage:  python benchmark_symboltable.py [nrepeat]
+"""
+from __future__ import print_function
+import sys
+import time
+from larch import Interpreter
+
+SETUP = """
+dat = group(npts=11, scale=2.0, offset=0.5)
+def poly(x, a, b):
+    return a + b*x
+#enddef
+"""
+
+SCRIPTS = {}
+SCRIPTS['math_names'] = """
+total = 0.
+for i in range(20000):
+    total = total + sin(i*pi/180.0) + sqrt(abs(i)) + log10(i+1)
+#endfor
+"""
+
+SCRIPTS['group_members'] = """
+total = 0.
+for i in range(20000):
+    total = total + dat.scale*i + dat.offset*dat.npts
+#endfor
+"""
+
+SCRIPTS['procedure_calls'] = """
+total = 0.
+for i in range(10000):
+    total = total + poly(i, dat.offset, dat.scale)
+#endfor
+"""
+
+SCRIPTS['local_names'] = """
+def loop(n):
+    a, b, total = 1, 2, 0
+    for i in range(n):
+        total = total + a*i - b
+    #endfor
+    return total
+#enddef
+total = loop(20000)
+"""
+
+def run_benchmark(script, lookup_cache=True, use_compiler=True, nrepeat=3):
+    "return best run time and result for a script"
+    best, result = None, None
+    larch = Interpreter(use_compiler=use_compiler)
+    larch.symtable._sys.lookup_cache = lookup_cache
+    larch.eval(SETUP)
+    for i in range(nrepeat):
+        t0 = time.time()
+        larch.eval(script)
+        dt = time.time() - t0
+        if len(larch.error) > 0:
+            raise RuntimeError(larch.error[0].get_error()[1])
+        result = larch.symtable.get_symbol('total')
+        if best is None or dt < best:
+            best = dt
+    return best, result
+
+if __name__ == '__main__':
+    nrepeat = 3
+    if len(sys.argv) > 1:
+        nrepeat = int(sys.argv[1])
+
+    print("%-18s %-9s %9s %9s %8s" % ('script', 'compiled', 'no cache',
+                                      'cache', 'speedup'))
+    for name, script in sorted(SCRIPTS.items()):
+        for use_compiler in (False, True):
+            t_off, r_off = run_benchmark(script, lookup_cache=False,
+                                         use_compiler=use_compiler,
+                                         nrepeat=nrepeat)
+            t_on, r_on = run_benchmark(script, lookup_cache=True,
+                                       use_compiler=use_compiler,
+                                       nrepeat=nrepeat)
+            if abs(r_on - r_off) > 1.e-8*max(1, abs(r_off)):
+                print("%s: results differ: %s, %s" % (name, r_off, r_on))
+            print("%-18s %-9s %8.3fs %8.3fs %7.2fx" % (name, use_compiler,
+                                                       t_off, t_on,
+                                                       t_off/max(t_on, 1.e-9)))
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  compiled loops and procedures give the same results
+  and errors as the Interpreter
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from larch import Interpreter
+from larch import compiler
+
+LOOPS = """
+total = 0
+for i in range(10):
+    if i == 7:
+        break
+    elif i % 2 == 0:
+        continue
+    endif
+    total = total + i
+endfor
+n = 0
+while n < 20:
+    n += 3
+endwhile
+out = [total, n]
+"""
+
+SLICES = """
+a = zeros(8)
+for i in range(1):
+    a[0:6:2] = 1
+endfor
+b = zeros(8)
+b[1:7:3] = 2
+out = [list(a), list(b)]
+"""
+
+RETURNS = """
+def first_over(limit):
+    x = 0
+    for i in range(20):
+        x = x + i
+        if x > limit:
+            return x
+        endif
+    endfor
+    return 190
+enddef
+
+def nested(limit):
+    for i in range(5):
+        j = 0
+        while j < 5:
+            if i*j > limit:
+                return (i, j)
+            endif
+            j = j + 1
+        endwhile
+    endfor
+    return None
+enddef
+out = [first_over(20), first_over(500), nested(6), nested(50)]
+"""
+
+LOOP_ERROR = """
+x = 1
+for i in range(3):
+    y = i
+    z = undefined_name + 1
+endfor
+"""
+
+PROC_LOOP_ERROR = """
+def g():
+    a = 1
+    for i in range(3):
+        b = a/0
+    endfor
+enddef
+x = 2
+g()
+"""
+
+PROC_ERROR = """
+def h():
+    a = 1
+    b = a + 2
+    c = nosuch
+enddef
+x = 2
+h()
+"""
+
+LOCALS = """
+def scaled():
+    return x*10
+enddef
+x = 0
+seen = []
+for i in range(4):
+    x = i
+    seen.append(scaled())
+endfor
+out = [x, i, seen]
+"""
+
+RESERVED = """
+for i in range(3):
+    group = i
+endfor
+"""
+
+class TestCompiler(unittest.TestCase):
+    '''testing compiled Larch code against the Interpreter'''
+
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp(prefix='larch_compiled')
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def interp(self, use_compiler=True):
+        larch = Interpreter(with_plugins=False, use_compiler=use_compiler)
+        larch.compiler.cachedir = self.cachedir
+        return larch
+
+    def run_text(self, text, use_compiler=True):
+        """run text, returning 'out' and (error name, line number)
+        of the first error"""
+        larch = self.interp(use_compiler=use_compiler)
+        larch.eval(text, fname='test.lar')
+        error = None
+        if len(larch.error) > 0:
+            err = larch.error[0]
+            error = (err.get_error()[0], err.lineno)
+        out = None
+        if larch.symtable.has_symbol('out'):
+            out = larch.symtable.get_symbol('out')
+        return out, error
+
+    def compare(self, text):
+        compiled = self.run_text(text, use_compiler=True)
+        interpreted = self.run_text(text, use_compiler=False)
+        self.assertEqual(compiled, interpreted)
+        return compiled
+
+    def test_loops(self):
+        "loops with break and continue"
+        out, error = self.compare(LOOPS)
+        self.assertTrue(error is None)
+        self.assertEqual(out, [1+3+5, 21])
+
+    def test_slice_step(self):
+        "assignment to slices with a step"
+        out, error = self.compare(SLICES)
+        self.assertTrue(error is None)
+        self.assertEqual(out[0], [1, 0, 1, 0, 1, 0, 0, 0])
+        self.assertEqual(out[1], [0, 2, 0, 0, 2, 0, 0, 0])
+
+    def test_return_in_loop(self):
+        "return from inside loops in a procedure"
+        out, error = self.compare(RETURNS)
+        self.assertTrue(error is None)
+        self.assertEqual(out, [21, 190, (2, 4), None])
+
+    def test_error_lines(self):
+        "errors are reported at the same line"
+        for text, exc_name, lineno in ((LOOP_ERROR, 'NameError', 3),
+                                       (PROC_LOOP_ERROR, 'ZeroDivisionError', 4),
+                                       (PROC_ERROR, 'NameError', 5)):
+            out, error = self.compare(text)
+            self.assertEqual(error, (exc_name, lineno))
+
+    def test_error_message(self):
+        "compiled code does not appear in error messages"
+        larch = self.interp(use_compiler=True)
+        larch.eval(PROC_ERROR, fname='test.lar')
+        msg = larch.error[0].get_error()[1]
+        self.assertTrue("name 'nosuch' is not defined" in msg)
+        self.assertFalse(compiler.COMPILED_FILENAME in msg)
+        self.assertFalse('compiler.py' in msg)
+
+    def test_cached_lines(self):
+        "code cached on disk keeps its own line numbers"
+        self.compare(LOOP_ERROR)
+        out, error = self.compare('\n\n' + LOOP_ERROR)
+        self.assertEqual(error, ('NameError', 5))
+
+    def test_disk_cache_size(self):
+        "the disk cache holds at most CODECACHE_NFILES files"
+        nfiles = compiler.CODECACHE_NFILES
+        compiler.CODECACHE_NFILES = 4
+        try:
+            larch = self.interp(use_compiler=True)
+            for i in range(10):
+                larch.eval("for i in range(%i):\n    x = i\nendfor\n" % (i+1))
+            cfiles = os.listdir(self.cachedir)
+            self.assertEqual(len(cfiles), 4)
+            self.assertTrue(all(f.endswith('.lcc') for f in cfiles))
+        finally:
+            compiler.CODECACHE_NFILES = nfiles
+
+    def test_locals(self):
+        "assigned names are seen by procedures and kept after loops"
+        out, error = self.compare(LOCALS)
+        self.assertTrue(error is None)
+        self.assertEqual(out, [3, 3, [0, 10, 20, 30]])
+
+    def test_reserved_name(self):
+        "assigning to reserved names is still an error"
+        out, error = self.compare(RESERVED)
+        self.assertFalse(error is None)
+
+    def test_callbacks(self):
+        "callbacks are run for names assigned in compiled loops"
+        larch = self.interp(use_compiler=True)
+        larch.eval('x = -1')
+        values = []
+        def onchange(group=None, value=None, symbolname=None):
+            values.append((symbolname, value))
+        larch.symtable.add_callback('x', onchange)
+        larch.eval("for i in range(4):\n    x = i\nendfor\n")
+        self.assertEqual(values[-1], ('x', 3))
+
+    def test_default(self):
+        "the Interpreter does not compile by default"
+        larch = Interpreter(with_plugins=False)
+        self.assertFalse(larch.use_compiler)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestCompiler,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  differential KK transform engines
+"""
+import unittest
+import numpy as np
+from importlib import import_module
+
+from utils import TestCase
+
+
+class TestDiffKK(TestCase):
+    '''testing diffKK transform engines'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        # larch_plugins.xafs.diffkk is also the name of the diffkk function
+        self.kk = import_module('larch_plugins.xafs.diffkk')
+        self.energy = np.linspace(8800.0, 9800.0, 500)
+        self.fpp = (0.3*(self.energy > 8979) +
+                    np.exp(-((self.energy-9000.0)/30.0)**2) +
+                    0.01*np.sin(self.energy/7.0))
+
+    def test_reverse(self):
+        "fft reverse transform matches vector and scalar forms"
+        out = self.kk.kkmclr_fft(self.energy, self.fpp)
+        vec = self.kk.kkmclr(self.energy, self.fpp)
+        sca = np.array(self.kk.kkmclr_sca(self.energy, self.fpp))
+        scale = abs(vec).max()
+        self.assertTrue(abs(out - vec).max() < 1.e-9*scale)
+        self.assertTrue(abs(out - sca).max() < 1.e-9*scale)
+
+    def test_forward(self):
+        "fft forward transform matches scalar form"
+        out = self.kk.kkmclf_fft(self.energy, self.fpp)
+        sca = np.array(self.kk.kkmclf_sca(self.energy, self.fpp))
+        scale = abs(sca).max()
+        self.assertTrue(abs(out - sca).max() < 1.e-9*scale)
+
+    def test_bad_input(self):
+        "fft transforms reject arrays of different or odd length"
+        for func in (self.kk.kkmclf_fft, self.kk.kkmclr_fft):
+            self.assertRaises(ValueError, func, self.energy, self.fpp[:-2])
+            self.assertRaises(ValueError, func, self.energy[:-1], self.fpp[:-1])
+
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestDiffKK,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -740,6 +740,46 @@ class TestEval(TestCase):
         self.isvalue('o1', 3.5)
         self.isvalue('o2', 1.5)
 
+    def test_lookup_cache(self):
+        """test that cached symbol lookups follow shadowing and deletion"""
+        self.interp("x = sin(0)")
+        self.isvalue('x', 0)
+        self.interp("sin = 3")
+        self.isvalue('sin', 3)
+        self.interp("del sin")
+        self.assertTrue(self.symtable.get_symbol('sin') is np.sin)
+
+        self.symtable.new_group('_extra')
+        self.symtable.set_symbol('_extra.pi', 'shadow')
+        self.symtable._sys.searchGroups.insert(0, '_extra')
+        self.symtable._fix_searchGroups(force=True)
+        self.isvalue('pi', 'shadow')
+        self.interp("del _extra.pi")
+        self.isnear('pi', np.pi)
+        setattr(self.symtable._extra, 'pi', 'direct')
+        self.isvalue('pi', 'direct')
+
+        setup = """
+        def f(x):
+            pi = x
+            return pi
+        #enddef
+        """
+        self.interp(textwrap.dedent(setup))
+        self.interp("y = f(2)")
+        self.isvalue('y', 2)
+        self.isvalue('pi', 'direct')
+
+        # parameters added to a searched parameter group
+        from larch.fitting import ParameterGroup
+        self.symtable.set_symbol('_pars', ParameterGroup(_larch=self.interp))
+        self.symtable._sys.searchGroups.insert(0, '_pars')
+        self.symtable._fix_searchGroups(force=True)
+        self.symtable.set_symbol('_extra.amp', 'shadow')
+        self.isvalue('amp', 'shadow')
+        self.symtable._pars._ParameterGroup__add('amp', value=2.5)
+        self.assertEqual(self.symtable.get_symbol('amp').value, 2.5)
+
 
     def test_astdump(self):
         """test ast parsing and dumping"""
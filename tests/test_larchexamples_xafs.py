@@ -117,7 +117,7 @@ class TestScripts(TestCase):
         self.runscript('doc_feffit1.lar', dirname='../examples/feffit/')
         assert(len(self.session.get_errors()) == 0)
 
-        self.isTrue('out.nfev > 20')
+        self.isTrue('out.nfev > 10')
         self.isTrue('out.nfev < 100')
         self.isTrue('out.chi_square > 0.2')
         self.isTrue('out.chi_square < 2000')
@@ -149,6 +149,59 @@ class TestScripts(TestCase):
         self.isTrue('path1.geom[0][1] == 26')
         self.isTrue('path1.geom[1][1] == 8')
 
+    def test15_autobk_many(self):
+        self.runscript('autobk_many.lar', dirname='../examples/xafs/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("stack.chi.shape == (8, len(cu.k))")
+        self.isTrue("stack.bkg.shape == stack.mu.shape")
+        self.isTrue("len(stack.edge_step) == 8")
+        self.isTrue("chi_diff < 1.e-3")
+
+    def test16_xafsft_many(self):
+        self.runscript('xafsft_many.lar', dirname='../examples/xafs/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("stack.chir_mag.shape == (16, len(stack.r))")
+        self.isTrue("stack.chiq_re.shape == (16, len(stack.q))")
+        self.isTrue("chir_diff < 1.e-8")
+        self.isTrue("chiq_diff < 1.e-8")
+
+    def test17_autobk_linear(self):
+        self.runscript('autobk_linear.lar', dirname='../examples/xafs/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("all(converged)")
+        self.isTrue("max(niters) < 100")
+        self.isTrue("max(chi_diffs) < 0.02")
+        self.isTrue("max(redchi_ratios) < 1.001")
+
+    def test18_feffit_jacobian(self):
+        self.runscript('feffit_jacobian.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue('out_jac.nfev < out_fd.nfev')
+        self.isNear('out_jac.chi_square/out_fd.chi_square', 1.0, places=4)
+        self.isNear('pars_jac.amp.value',    0.93, places=1)
+        self.isTrue('abs(pars_jac.amp.value - pars_fd.amp.value) < 1.e-4')
+        self.isTrue('abs(pars_jac.del_e0.value - pars_fd.del_e0.value) < 1.e-3')
+        self.isTrue('abs(pars_jac.sig2.value - pars_fd.sig2.value) < 1.e-5')
+        self.isTrue('abs(pars_jac.del_r.value - pars_fd.del_r.value) < 1.e-5')
+
+    def test19_feffit_workers(self):
+        self.runscript('feffit_workers.lar', dirname='../examples/feffit/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue('out2.nfev > 10')
+        self.isNear('pars2.amp.value',    0.93, places=1)
+        self.isTrue('abs(out1.chi_square - out2.chi_square) < 1.e-6*out1.chi_square')
+        self.isTrue('abs(pars1.amp.value - pars2.amp.value) < 1.e-6')
+        self.isTrue('abs(pars1.del_e0.value - pars2.del_e0.value) < 1.e-6')
+        self.isTrue('abs(pars1.sig2.value - pars2.sig2.value) < 1.e-8')
+        self.isTrue('abs(pars1.del_r.value - pars2.del_r.value) < 1.e-8')
+
+    def test20_wavelet_many(self):
+        self.runscript('wavelet_many.lar', dirname='../examples/xafs/')
+        assert(len(self.session.get_errors()) == 0)
+        self.isTrue("stack.wcauchy.shape == (4, 326, len(cu.k))")
+        self.isTrue("stack.wcauchy_mag.shape == stack.wcauchy.shape")
+        self.isTrue("wave_diff < 1.e-12")
+
 if __name__ == '__main__':  # pragma: no cover
     for suite in (TestScripts,):
         suite = unittest.TestLoader().loadTestsFromTestCase(suite)
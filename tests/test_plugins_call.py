@@ -3,7 +3,10 @@
   Calling Functions from Plugins
 """
 import unittest
+import os
 import time
+import shutil
+import tempfile
 import ast
 import numpy as np
 from sys import version_info
@@ -13,6 +16,25 @@ import larch
 import sys
 larch.site_config.plugins_path.insert(0, '.')
 
+LAZY_PLUGINS = {'lzbad/lzbad.py': "import no_such_module\n",
+                'lzgood/lzfuncs.py': '''
+def lz_triple(x):
+    return 3*x
+
+def registerLarchPlugin():
+    return ('_lztest', {'lz_triple': lz_triple})
+''',
+                'lzgood/lzgroups.py': '''
+from larch import Group
+
+class LzGroup(Group):
+    def __init__(self, **kws):
+        Group.__init__(self, **kws)
+
+def registerLarchGroups():
+    return (LzGroup,)
+'''}
+
 
 class TestPlugins(TestCase):
     '''testing plugins'''
@@ -131,6 +153,92 @@ class TestPlugins(TestCase):
         self.isValue('b', 3)
         self.NoExceptionRaised()
 
+    def test6(self):
+        "test lazy loading of plugin from manifest"
+        from larch.plugin_manifest import LazyPluginLoader
+        manifest = {'modules': [{'key': 'tests/test_larch_plugin',
+                                 'name': 'test_larch_plugin',
+                                 'path': os.path.abspath('.'),
+                                 'group': '_tests',
+                                 'symbols': {'_tests': ['fcn1', 'add2']},
+                                 'commands': [], 'eager': False}]}
+        loader = LazyPluginLoader(manifest, _larch=self.session._larch)
+        loader.setup()
+        self.assertTrue('add2' in dir(self.symtable._tests))
+        self.assertFalse('tests/test_larch_plugin' in
+                         self.symtable._sys.import_times)
+
+        self.trytext("a = add2(1, 2)")
+        self.isValue('a', 4)
+        self.NoExceptionRaised()
+        self.assertTrue('tests/test_larch_plugin' in
+                        self.symtable._sys.import_times)
+        self.trytext("b = _tests.f1_larch(5)")
+        self.isValue('b', 10)
+
+    def test7(self):
+        "test writing, reading, and lazy loading of a plugin manifest"
+        from larch import builtins
+        from larch.plugin_manifest import (PluginRecorder, LazyPluginLoader,
+                                           read_manifest)
+        tmpdir = tempfile.mkdtemp(prefix='larch_manifest')
+        try:
+            plugins_dir = os.path.join(tmpdir, 'plugins')
+            for fname, text in LAZY_PLUGINS.items():
+                fname = os.path.join(plugins_dir, fname)
+                if not os.path.exists(os.path.dirname(fname)):
+                    os.makedirs(os.path.dirname(fname))
+                with open(fname, 'w') as fh:
+                    fh.write(text)
+
+            recorder = PluginRecorder(plugins_dir)
+            for pname in ('lzbad', 'lzgood'):
+                builtins._addplugin(os.path.join(plugins_dir, pname),
+                                    _larch=self.session._larch,
+                                    recorder=recorder)
+            mfile = os.path.join(tmpdir, 'manifest.json')
+            self.assertTrue(recorder.save(filename=mfile))
+            self.assertEqual(sorted(os.listdir(tmpdir)),
+                             ['manifest.json', 'plugins'])
+
+            manifest = read_manifest(plugins_dir, filename=mfile)
+            self.assertTrue(manifest is not None)
+            mods = dict((mod['name'], mod) for mod in manifest['modules'])
+            self.assertTrue(mods['lzbad']['failed'])
+            self.assertTrue(mods['lzgroups']['eager'])
+            self.assertFalse(mods['lzfuncs']['eager'])
+            self.assertEqual(mods['lzfuncs']['symbols'],
+                             {'_lztest': ['lz_triple']})
+
+            session = LarchSession()
+            symtable = session.symtable
+            loader = LazyPluginLoader(manifest, _larch=session._larch)
+            loader.setup()
+            self.assertTrue('LzGroup' in [g.__name__ for g in
+                                          symtable._sys.saverestore_groups])
+            self.assertFalse('lzgood/lzfuncs' in symtable._sys.import_times)
+            self.assertFalse('lzbad/lzbad' in symtable._sys.import_times)
+
+            session.run("a = lz_triple(3)")
+            self.assertEqual(len(session.get_errors()), 0)
+            self.assertEqual(session.get_symbol('a'), 9)
+            self.assertTrue('lzgood/lzfuncs' in symtable._sys.import_times)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test8(self):
+        "test that a manifest that cannot be written leaves no files"
+        from larch.plugin_manifest import PluginRecorder
+        tmpdir = tempfile.mkdtemp(prefix='larch_manifest')
+        try:
+            recorder = PluginRecorder(tmpdir)
+            recorder.modules.append({'key': 'bad', 'value': object()})
+            mfile = os.path.join(tmpdir, 'manifest.json')
+            self.assertFalse(recorder.save(filename=mfile))
+            self.assertEqual(os.listdir(tmpdir), [])
+        finally:
+            shutil.rmtree(tmpdir)
+
 
 
 if __name__ == '__main__':  # pragma: no cover
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  save and restore of Larch data in HDF5 save files
+"""
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from utils import TestCase
+from larch import Group, Parameter, isParameter
+
+class TestSaveRestore(TestCase):
+    '''testing save and restore'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.io import save_restore
+        self.sr = save_restore
+        # restored MCAs are made from the class registered for save and
+        # restore, which is not larch_plugins.xrf.mca.MCA if the xrf
+        # plugin has been loaded
+        groups = self.symtable._sys.saverestore_groups
+        registered = [g for g in groups if g.__name__ == 'MCA']
+        if len(registered) > 0:
+            self.MCA = registered[0]
+        else:
+            from larch_plugins.xrf.mca import MCA
+            groups.append(MCA)
+            self.MCA = MCA
+        self.tmpdir = tempfile.mkdtemp(prefix='larch_save')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def save(self, fname, *args, **kws):
+        fname = os.path.join(self.tmpdir, fname)
+        self.sr.save(fname, *args, _larch=self.session._larch, **kws)
+        return fname
+
+    def restore(self, fname, **kws):
+        return self.sr.restore(fname, top_level=False,
+                               _larch=self.session._larch, **kws)
+
+    def make_data(self):
+        x = np.linspace(0, 10, 2001)
+        dat = Group(x=x, y=np.sin(x), iy=np.arange(200, dtype=np.int32),
+                    z=np.exp(1j*x[:50]), c=2-3j, label='data', n=7,
+                    sub=Group(mu=np.cos(x), label='subgroup',
+                              pars=Group(amp=Parameter(name='amp', value=2.5,
+                                                       vary=True, min=0))))
+        tup = (x[:10], 'a', 3)
+        dct = {'a': x[:20], 'b': {'c': 1.5}, 3: 'three'}
+        mca = self.MCA(counts=np.arange(2048)*2, nchans=2048, offset=-0.01,
+                       slope=0.01, name='mca1')
+        return dat, tup, dct, mca
+
+    def test_roundtrip(self):
+        "save and restore arrays, groups, tuples, dicts, and MCAs"
+        dat, tup, dct, mca = self.make_data()
+        fname = self.save('test1.h5', dat, tup, dct, mca, 3.5)
+        out = self.restore(fname)
+
+        rdat = out.var_00001
+        self.assertTrue(isinstance(rdat, Group))
+        for attr in ('x', 'y', 'iy', 'z'):
+            self.assertEqual(getattr(rdat, attr).dtype,
+                             getattr(dat, attr).dtype)
+            self.assertTrue(np.all(getattr(rdat, attr) == getattr(dat, attr)))
+        self.assertEqual(rdat.c, 2-3j)
+        self.assertEqual(rdat.label, 'data')
+        self.assertEqual(rdat.n, 7)
+        self.assertTrue(np.all(rdat.sub.mu == dat.sub.mu))
+        self.assertEqual(rdat.sub.label, 'subgroup')
+
+        amp = rdat.sub.pars.amp
+        self.assertTrue(isParameter(amp))
+        self.assertEqual(amp.value, 2.5)
+        self.assertTrue(amp.vary)
+        self.assertEqual(amp.min, 0)
+
+        rtup = out.var_00002
+        self.assertTrue(isinstance(rtup, tuple))
+        self.assertTrue(np.all(rtup[0] == tup[0]))
+        self.assertEqual(rtup[1:], ('a', 3))
+
+        rdct = out.var_00003
+        self.assertEqual(sorted(rdct.keys(), key=str), [3, 'a', 'b'])
+        self.assertTrue(np.all(rdct['a'] == dct['a']))
+        self.assertEqual(rdct['b'], {'c': 1.5})
+        self.assertEqual(rdct[3], 'three')
+
+        rmca = out.var_00004
+        self.assertEqual(type(rmca).__name__, 'MCA')
+        self.assertTrue(isinstance(rmca, self.MCA))
+        self.assertTrue(np.all(rmca.counts == mca.counts))
+        self.assertEqual(rmca.slope, 0.01)
+        self.assertEqual(rmca.name, 'mca1')
+
+        self.assertEqual(out.var_00005, 3.5)
+
+    def test_unnamed(self):
+        "unnamed items are saved with unique names"
+        fname = self.save('test2.h5', np.arange(5), np.ones(3))
+        self.assertEqual([name for name, desc in
+                          self.sr.savefile_contents(fname)],
+                         ['var_00001', 'var_00002'])
+        fname = self.save('test2.sav', np.arange(5), 'a', format='json')
+        out = self.restore(fname)
+        self.assertTrue(np.all(out.var_00001 == np.arange(5)))
+        self.assertEqual(out.var_00002, 'a')
+
+    def test_items(self):
+        "restore selected items"
+        dat, tup, dct, mca = self.make_data()
+        fname = self.save('test3.h5', dat, tup, dct)
+        out = self.restore(fname, items=['var_00001.sub.mu', 'var_00002'])
+        self.assertEqual(sorted(dir(out)),
+                         ['_restore_metadata_', 'var_00001', 'var_00002'])
+        self.assertEqual(dir(out.var_00001), ['sub'])
+        self.assertEqual(dir(out.var_00001.sub), ['mu'])
+        self.assertTrue(np.all(out.var_00001.sub.mu == dat.sub.mu))
+        self.assertEqual(out.var_00002[1:], ('a', 3))
+
+        out = self.restore(fname, items='var_00001.x')
+        self.assertTrue(np.all(out.var_00001.x == dat.x))
+
+        self.assertRaises(KeyError, self.restore, fname,
+                          items=['var_00001.nosuch'])
+        self.assertRaises(KeyError, self.restore, fname, items=['nosuch'])
+
+    def test_contents(self):
+        "list the contents of a save file"
+        dat, tup, dct, mca = self.make_data()
+        fname = self.save('test4.h5', dat, tup, mca)
+        contents = dict(self.sr.savefile_contents(fname))
+        self.assertEqual(contents['var_00001'], 'Group')
+        self.assertEqual(contents['var_00001.x'],
+                         'array<shape=(2001,), type=float64>')
+        self.assertEqual(contents['var_00001.label'], 'value')
+        self.assertEqual(contents['var_00001.sub'], 'Group')
+        self.assertEqual(contents['var_00001.sub.mu'],
+                         'array<shape=(2001,), type=float64>')
+        self.assertEqual(contents['var_00002'], 'tuple, length 3')
+        self.assertEqual(contents['var_00003'], 'MCA')
+        self.assertEqual(contents['var_00003.counts'],
+                         'array<shape=(2048,), type=%s>' % mca.counts.dtype)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestSaveRestore,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  sigma2 models for Feff Paths
+"""
+import unittest
+import os
+import numpy as np
+
+from utils import TestCase
+
+FEFFDIR = '../examples/feffit'
+
+# correlated Debye sigma2 at T=300, theta=315, from sigma2_correldebye_py()
+SIGMA2_DEBYE = {'Feff_Cu/feff0001.dat': 0.0090381502,
+                'Feff_Cu/feff0003.dat': 0.0101679190,
+                'Feff_Cu/feff0005.dat': 0.0115018870,
+                'Feff_Cu/feff0009.dat': 0.0116608938,
+                'feff_feo01.dat':       0.0234917493}
+
+class TestSigma2Models(TestCase):
+    '''testing sigma2 models'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xafs import sigma2_models
+        from larch_plugins.xafs.feffdat import FeffDatFile
+        self.s2 = sigma2_models
+        self.feffdat = {}
+        for fname in SIGMA2_DEBYE:
+            self.feffdat[fname] = FeffDatFile(os.path.join(FEFFDIR, fname),
+                                              _larch=self.session._larch)
+
+    def correldebye_args(self, fdat, tk=300.0, theta=315.0):
+        geom = fdat.geom
+        return (len(geom), tk, theta, fdat.rnorman,
+                [atom[4] for atom in geom], [atom[5] for atom in geom],
+                [atom[6] for atom in geom], [atom[3] for atom in geom])
+
+    def test_correldebye(self):
+        "vectorized correlated Debye model matches the scalar form"
+        for fname, sigma2 in SIGMA2_DEBYE.items():
+            fdat = self.feffdat[fname]
+            args = self.correldebye_args(fdat)
+            self.assertAlmostEqual(self.s2.sigma2_correldebye_py(*args),
+                                   sigma2, places=9)
+            self.assertAlmostEqual(self.s2.sigma2_correldebye_np(*args),
+                                   sigma2, places=9)
+            self.assertAlmostEqual(self.s2.sigma2_correldebye(*args),
+                                   sigma2, places=9)
+            self.assertAlmostEqual(self.s2.sigma2_debye_feffdat(300.0, 315.0, fdat),
+                                   sigma2, places=9)
+
+    def test_temperatures(self):
+        "vectorized correlated Debye model at other temperatures"
+        fdat = self.feffdat['Feff_Cu/feff0003.dat']
+        for tk, theta in ((10.0, 315.0), (77.0, 200.0), (600.0, 450.0)):
+            args = self.correldebye_args(fdat, tk=tk, theta=theta)
+            self.assertAlmostEqual(self.s2.sigma2_debye_feffdat(tk, theta, fdat),
+                                   self.s2.sigma2_correldebye_py(*args),
+                                   places=10)
+
+    def test_debint(self):
+        "Gauss-Legendre integration matches Romberg integration"
+        rx = np.linspace(0, 40, 41)
+        for tx in (0.2, 1.0, 5.0, 50.0):
+            out = self.s2.debint_array(rx, tx)
+            ref = np.array([self.s2.debint(r, tx) for r in rx])
+            self.assertTrue(abs(out - ref).max() < 1.e-8*abs(ref).max())
+
+    def test_cache(self):
+        "cached sigma2 values follow temperature and path geometry"
+        fdat1 = self.feffdat['Feff_Cu/feff0001.dat']
+        fdat5 = self.feffdat['Feff_Cu/feff0005.dat']
+        s1 = self.s2.sigma2_debye_feffdat(300.0, 315.0, fdat1)
+        self.assertEqual(s1, self.s2.sigma2_debye_feffdat(300.0, 315.0, fdat1))
+        self.assertTrue(self.s2.sigma2_debye_feffdat(310.0, 315.0, fdat1) > s1)
+        self.assertTrue(self.s2.sigma2_debye_feffdat(300.0, 315.0, fdat5) > s1)
+
+    def test_fiteval(self):
+        "sigma2_debye in a path parameter expression"
+        self.session.run("path1 = feffpath('%s/Feff_Cu/feff0001.dat', "
+                         "sigma2='sigma2_debye(300, 315)')" % FEFFDIR)
+        self.session.run("ff2chi([path1])")
+        self.NoExceptionRaised()
+        pars = self.getSym('path1').path_paramvals()
+        self.assertAlmostEqual(pars['sigma2'],
+                               SIGMA2_DEBYE['Feff_Cu/feff0001.dat'], places=9)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestSigma2Models,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  binary and shared array transfer from a local Larch server
+"""
+import unittest
+import os
+import tempfile
+from threading import Thread
+import numpy as np
+from six.moves.xmlrpc_client import ServerProxy
+
+from larch import isgroup
+from larch import xmlrpc_server
+
+class TestLarchServer(unittest.TestCase):
+    '''testing get_binarydata() from a Larch server'''
+
+    def setUp(self):
+        self.rpc = xmlrpc_server
+        port = self.rpc.get_next_port(port=5966)
+        self.server = self.rpc.LarchServer(host='localhost', port=port)
+        self.thread = Thread(target=self.server.run)
+        self.thread.start()
+        self.client = ServerProxy('http://localhost:%d' % port,
+                                  allow_none=True)
+        self.client.larch('x = linspace(0, 10, 5001)')
+        self.client.larch('n = arange(24, dtype=int32).reshape(4, 6)')
+        self.client.larch("g = group(x=x, z=x*(1-2j), label='a group', "
+                          "sub=group(n=n, vals=(n, 'a', 2.5)))")
+
+    def tearDown(self):
+        self.client.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def shared_files(self):
+        prefix = self.rpc.shared_prefix()
+        return [f for f in os.listdir(self.rpc.SHARED_DIR)
+                if f.startswith(prefix)]
+
+    def check_arrays(self, shared):
+        x = np.linspace(0, 10, 5001)
+        n = np.arange(24, dtype=np.int32).reshape(4, 6)
+        out = self.rpc.get_array(self.client, 'x', shared=shared)
+        self.assertEqual(out.dtype, x.dtype)
+        self.assertTrue(np.all(out == x))
+
+        out = self.rpc.get_array(self.client, 'n', shared=shared)
+        self.assertEqual(out.dtype, n.dtype)
+        self.assertEqual(out.shape, (4, 6))
+        self.assertTrue(np.all(out == n))
+
+        grp = self.rpc.get_array(self.client, 'g', shared=shared)
+        self.assertTrue(isgroup(grp))
+        self.assertTrue(np.all(grp.x == x))
+        self.assertEqual(grp.z.dtype, np.complex128)
+        self.assertTrue(np.all(grp.z == x*(1-2j)))
+        self.assertEqual(grp.label, 'a group')
+        self.assertTrue(np.all(grp.sub.n == n))
+        self.assertTrue(isinstance(grp.sub.vals, tuple))
+        self.assertTrue(np.all(grp.sub.vals[0] == n))
+        self.assertEqual(grp.sub.vals[1:], ('a', 2.5))
+
+        out = self.rpc.get_array(self.client, "[x, {'n': n}]", shared=shared)
+        self.assertTrue(np.all(out[0] == x))
+        self.assertTrue(np.all(out[1]['n'] == n))
+
+    def test_binary(self):
+        "arrays sent as binary data"
+        self.check_arrays(shared=False)
+        self.assertEqual(self.client.get_binarydata('1.5 + 2'), 3.5)
+
+    def test_shared(self):
+        "arrays sent as shared files"
+        self.check_arrays(shared=True)
+        self.assertEqual(self.shared_files(), [])
+
+    def test_shared_remote(self):
+        "shared arrays are refused for other hosts"
+        self.server.request_address = ('10.1.2.3', 40000)
+        self.assertFalse(self.server.is_local_request())
+        self.assertRaises(ValueError, self.server.get_binarydata, 'x', True)
+        self.assertEqual(self.shared_files(), [])
+        # requests from this host set the address again
+        out = self.rpc.get_array(self.client, 'x', shared=True)
+        self.assertEqual(len(out), 5001)
+        self.assertTrue(self.server.is_local_request())
+
+    def test_shared_files(self):
+        "only shared array files are read and removed by clients"
+        fd, fname = tempfile.mkstemp(prefix='larch_', suffix='.npy',
+                                     dir=os.path.abspath('.'))
+        os.close(fd)
+        try:
+            obj = {'__class__': 'SharedArray', 'filename': fname}
+            self.assertRaises(ValueError, self.rpc.decode4rpc, obj)
+            self.assertTrue(os.path.exists(fname))
+        finally:
+            os.unlink(fname)
+
+        fd, fname = tempfile.mkstemp(prefix='other_', suffix='.npy',
+                                     dir=self.rpc.SHARED_DIR)
+        os.close(fd)
+        try:
+            obj = {'__class__': 'SharedArray', 'filename': fname}
+            self.assertRaises(ValueError, self.rpc.decode4rpc, obj)
+            self.assertTrue(os.path.exists(fname))
+        finally:
+            os.unlink(fname)
+
+    def test_clean_shared(self):
+        "stale shared files are removed"
+        self.rpc.encode4rpc(np.arange(10), shared=True)
+        self.rpc.encode4rpc(np.arange(20), shared=True)
+        self.assertEqual(len(self.shared_files()), 2)
+        self.rpc.clean_shared_files()
+        self.assertEqual(len(self.shared_files()), 2)
+        self.rpc.clean_shared_files(maxage=0)
+        self.assertEqual(self.shared_files(), [])
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestLarchServer,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)
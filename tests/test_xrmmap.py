@@ -0,0 +1,907 @@
+#!/usr/bin/env python
+""" Larch Tests:
+  X-ray microprobe map files
+"""
+import unittest
+import os
+import time
+import shutil
+import tempfile
+import threading
+import numpy as np
+import h5py
+
+from larch.utils.strutils import bytes2str
+from utils import TestCase
+
+class TestXRMMap(TestCase):
+    '''base for tests of GSEXRM_MapFile, on synthetic HDF5 map files'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        from larch_plugins.xrmmap import xrm_mapfile
+        self.xrm = xrm_mapfile
+        self.tmpdir = tempfile.mkdtemp(prefix='larch_xrmmap')
+        self.h5files = []
+
+    def tearDown(self):
+        for fh in self.h5files:
+            fh.close()
+        shutil.rmtree(self.tmpdir)
+
+    def new_mapfile(self, **kws):
+        """GSEXRM_MapFile with an empty xrmmap group in a new HDF5 file,
+        without a raw data folder: attributes can be set with keywords"""
+        fname = os.path.join(self.tmpdir, 'map%i.h5' % len(self.h5files))
+        h5root = h5py.File(fname, 'w')
+        self.h5files.append(h5root)
+        self.xrm.create_xrmmap(h5root)
+
+        mfile = self.xrm.GSEXRM_MapFile.__new__(self.xrm.GSEXRM_MapFile)
+        mfile.__dict__.update(filename=fname, folder=None, h5root=h5root,
+                              xrmmap=h5root[self.xrm.DEFAULT_ROOTNAME],
+                              version='2.0.1', status=None, last_row=-1,
+                              rowdata=[], masterfile=None,
+                              _master_cache=None, _mapfolder=None,
+                              _pixeltime=None, subscribers=[],
+                              _watch_stop=threading.Event(),
+                              flag_xrf=True, flag_xrd1d=False,
+                              flag_xrd2d=False, flag_pyramid=False,
+                              xrdcalfile=None,
+                              compress_args=self.xrm.get_compress_args(),
+                              chunk_layout='default')
+        mfile.__dict__.update(kws)
+        mfile.take_ownership()
+        return mfile
+
+    def add_detectors(self, mfile, ndet=2, nrow=12, npts=16, nchan=256,
+                      chunks=None, maxcounts=20):
+        """add mca detector groups with random counts and dead-time
+        factors to a map file, returning the counts for each detector"""
+        rng = np.random.RandomState(3)
+        counts = {}
+        for i in range(1, ndet+1):
+            dname = 'mca%i' % i
+            dgrp = mfile.xrmmap.create_group(dname)
+            dgrp.attrs['type'] = 'mca detector'
+            counts[dname] = rng.randint(0, maxcounts, (nrow, npts, nchan)).astype('int16')
+            dgrp.create_dataset('counts', data=counts[dname], chunks=chunks,
+                                **mfile.compress_args)
+            dgrp.create_dataset('energy', data=0.01*np.arange(nchan))
+            dgrp.create_dataset('dtfactor', data=rng.uniform(1, 1.2, (nrow, npts)))
+        mfile.xrmmap.create_group('mcasum').attrs['type'] = 'virtual mca detector'
+        mfile.ndet = ndet
+        mfile.last_row = nrow - 1
+        return counts
+
+class TestCompression(TestXRMMap):
+    '''compression options for map datasets'''
+
+    def test_args(self):
+        "create_dataset() keywords for compression names"
+        get_args = self.xrm.get_compress_args
+        self.assertEqual(get_args(None), {})
+        self.assertEqual(get_args('lzf'), {'compression': 'lzf'})
+        self.assertEqual(get_args('gzip', 4),
+                         {'compression': 'gzip', 'compression_opts': 4})
+        self.assertEqual(get_args('szip', 2),
+                         {'compression': 'szip', 'compression_opts': ('nn', 16)})
+        self.assertEqual(get_args('szip', ('ec', 8)),
+                         {'compression': 'szip', 'compression_opts': ('ec', 8)})
+        self.assertRaises(self.xrm.GSEXRM_Exception, get_args, 'szip', ('xx', 8))
+        self.assertRaises(self.xrm.GSEXRM_Exception, get_args, 'bzip2')
+        self.assertEqual(self.xrm.compress_string('szip', 2), 'szip-nn16')
+
+    def test_write(self):
+        "datasets are written with each available compression"
+        names = [None, 'gzip', 'lzf']
+        if h5py.h5z.filter_avail(h5py.h5z.FILTER_SZIP):
+            names.append('szip')
+        data = np.arange(64*256, dtype=np.int32).reshape(64, 256) % 13
+        mfile = self.new_mapfile()
+        for name in names:
+            dset = mfile.xrmmap['work'].create_dataset(str(name), data=data,
+                                                       chunks=(16, 64),
+                                                       **self.xrm.get_compress_args(name))
+            self.assertEqual(dset.compression, name)
+            self.assertTrue(np.all(dset[:] == data))
+
+class TestXRFReaders(TestXRMMap):
+    '''readers for xMAP netCDF and Xspress3 HDF5 raw data files'''
+
+    def xmap_buffers(self, npix, nmodules=1, mode=1, nchan=64, nrois=6):
+        """xMAP mapping buffers with 124 pixels per buffer, with
+        npix used pixels in each buffer, and random data"""
+        rng = np.random.RandomState(11)
+        modpixs = 124
+        blocksize = 256 + 4*nchan if mode == 1 else 8448
+        buff = np.zeros((len(npix), nmodules, 256 + modpixs*blocksize), dtype='i2')
+        for iarr, n in enumerate(npix):
+            for imod in range(nmodules):
+                buff[iarr, imod, 3] = mode
+                buff[iarr, imod, 8] = n
+                buff[iarr, imod, 9] = 1000 + iarr*modpixs
+                buff[iarr, imod, 20] = nchan
+                blocks = buff[iarr, imod, 256:].reshape((modpixs, blocksize))
+                blocks[:, 3] = mode
+                # times and i/o counts: low words only
+                blocks[:, 32:64:2] = rng.randint(1, 30000, (modpixs, 16))
+                if mode == 1:
+                    blocks[:, 256:256+4*nchan] = rng.randint(0, 200, (modpixs, 4*nchan))
+                else:
+                    blocks[:, 8:12] = nrois
+                    blocks[:, 64:64+8*nrois:2] = rng.randint(0, 3000, (modpixs, 4*nrois))
+        return buff
+
+    def xmap_expected(self, buff, nchan=64, nrois=6):
+        "decode xMAP buffers pixel by pixel"
+        narr, nmod, size = buff.shape
+        mode = buff[0, 0, 3]
+        blocksize = (size - 256)//124
+        counts, times = [], []
+        for iarr in range(narr):
+            for ipix in range(buff[iarr, 0, 8]):
+                pcounts, ptimes = [], []
+                for imod in range(nmod):
+                    off = 256 + ipix*blocksize
+                    block = buff[iarr, imod, off:off+blocksize].astype(np.int64)
+                    for ichan in range(4):
+                        ptimes.append([block[32 + 2*(4*ichan+k)] for k in range(4)])
+                        if mode == 1:
+                            pcounts.append(block[256+ichan*nchan:256+(ichan+1)*nchan])
+                        else:
+                            i0 = 64 + 2*ichan*nrois
+                            pcounts.append(block[i0:i0+2*nrois:2])
+                counts.append(pcounts)
+                times.append(ptimes)
+        return np.array(counts), np.array(times)
+
+    def check_xmap(self, out, buff, **kws):
+        counts, times = self.xmap_expected(buff, **kws)
+        self.assertEqual(out.numPixels, counts.shape[0])
+        self.assertEqual(out.firstPixel, 1000)
+        self.assertTrue(np.all(out.counts == counts))
+        self.assertTrue(np.allclose(out.realTime, 0.320*times[:, :, 0]))
+        self.assertTrue(np.allclose(out.liveTime, 0.320*times[:, :, 1]))
+        self.assertTrue(np.all(out.inputCounts == times[:, :, 2]))
+        self.assertTrue(np.all(out.outputCounts == times[:, :, 3]))
+
+    def test_xmap_spectra(self):
+        "xMAP full spectrum buffers, with a partly used last buffer"
+        from larch_plugins.xrmmap.xrf_netcdf import decode_xmap_buffers
+        buff = self.xmap_buffers((124, 124, 60))
+        out = decode_xmap_buffers(buff)
+        self.assertEqual(out.counts.shape, (308, 4, 64))
+        self.check_xmap(out, buff)
+
+    def test_xmap_modules(self):
+        "xMAP buffers for two modules are ordered as detectors 1 to 8"
+        from larch_plugins.xrmmap.xrf_netcdf import decode_xmap_buffers
+        buff = self.xmap_buffers((124, 30), nmodules=2)
+        out = decode_xmap_buffers(buff)
+        self.assertEqual(out.counts.shape, (154, 8, 64))
+        self.check_xmap(out, buff)
+
+    def test_xmap_rois(self):
+        "xMAP ROI mode buffers"
+        from larch_plugins.xrmmap.xrf_netcdf import decode_xmap_buffers
+        buff = self.xmap_buffers((124, 50), mode=2)
+        out = decode_xmap_buffers(buff)
+        self.assertEqual(out.counts.shape, (174, 4, 6))
+        self.check_xmap(out, buff)
+
+    def test_xmap_netcdf(self):
+        "read an xMAP netCDF file"
+        import scipy.io.netcdf
+        from larch_plugins.xrmmap import read_xrf_netcdf
+        buff = self.xmap_buffers((124, 124, 20))
+        fname = os.path.join(self.tmpdir, 'xmap.nc')
+        fh = scipy.io.netcdf.netcdf_file(fname, 'w')
+        for name, size in zip(('array', 'module', 'word'), buff.shape):
+            fh.createDimension(name, size)
+        fh.createVariable('array_data', 'i2', ('array', 'module', 'word'))[:] = buff
+        fh.close()
+        out = read_xrf_netcdf(fname)
+        self.check_xmap(out, buff)
+        del out
+
+    def write_xsp3(self, fname, counts, attrs):
+        with h5py.File(fname, 'w') as fh:
+            fh.create_dataset('entry/instrument/detector/data', data=counts)
+            ndattr = fh.create_group('entry/instrument/NDAttributes')
+            for name, val in attrs.items():
+                ndattr.create_dataset(name, data=val)
+
+    def test_xsp3(self):
+        "Xspress3 HDF5 file with per-frame EventWidth for some channels"
+        from larch_plugins.xrmmap import read_xsp3_hdf5
+        rng = np.random.RandomState(5)
+        npix, ndet, nchan = 40, 4, 128
+        counts = rng.randint(0, 100, (npix, ndet, nchan)).astype('u4')
+        clock = rng.randint(70000, 90000, (npix, ndet)).astype('f8')
+        clock[3, 1] = 2
+        reset = rng.randint(0, 2000, (npix, ndet)).astype('f8')
+        events = rng.randint(0, 3000, (npix, ndet)).astype('f8')
+        width = 6.0*np.ones((npix, ndet))
+        attrs = {}
+        for i in range(ndet):
+            attrs['CHAN%iSCA0' % (i+1)] = clock[:, i]
+            attrs['CHAN%iSCA1' % (i+1)] = reset[:, i]
+            attrs['CHAN%iSCA3' % (i+1)] = events[:, i]
+        for i in (0, 2):
+            evwidth = rng.randint(3, 9, npix).astype('f8')
+            attrs['CHAN%iEventWidth' % (i+1)] = evwidth
+            width[:, i] = 1.0 + evwidth
+        fname = os.path.join(self.tmpdir, 'xsp3.h5')
+        self.write_xsp3(fname, counts, attrs)
+
+        out = read_xsp3_hdf5(fname)
+        clock[np.where(clock < 10)] = 10.0
+        ocounts = counts[:, :, 1:-1].sum(axis=2).astype('f8')
+        dtfactor = clock/(clock - (events*width + reset))
+        self.assertEqual(out.numPixels, npix)
+        self.assertTrue(np.all(out.counts == counts))
+        self.assertTrue(np.allclose(out.realTime, 12.5e-3*clock))
+        self.assertTrue(np.allclose(out.outputCounts, ocounts))
+        self.assertTrue(np.allclose(out.inputCounts, dtfactor*ocounts))
+
+class TestXRDFrames(TestXRMMap):
+    '''GSEXRM_XRDFrames and GSEXRM_FrameStack: 2D XRD frames of a row'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        rng = np.random.RandomState(9)
+        self.raw = rng.randint(0, 60000, (7, 32, 24))
+        self.mask = (rng.uniform(size=(32, 24)) < 0.2).astype('f8')
+        self.bkgd = rng.uniform(0, 2000, (32, 24))
+
+    def write_hdf5(self, dtype='uint32'):
+        fname = os.path.join(self.tmpdir, 'xrd.h5')
+        with h5py.File(fname, 'w') as fh:
+            fh.create_dataset('entry/instrument/detector/data',
+                              data=self.raw.astype(dtype))
+        return fname
+
+    def write_netcdf(self):
+        import scipy.io.netcdf
+        fname = os.path.join(self.tmpdir, 'xrd.nc')
+        fh = scipy.io.netcdf.netcdf_file(fname, 'w')
+        for name, size in zip(('frame', 'x', 'y'), self.raw.shape):
+            fh.createDimension(name, size)
+        var = fh.createVariable('array_data', 'i2', ('frame', 'x', 'y'))
+        var[:] = self.raw.astype('uint16').astype('i2')
+        fh.close()
+        return fname
+
+    def expected(self, npts, raw=None):
+        if raw is None:
+            raw = self.raw
+        out = np.zeros((npts,) + raw.shape[1:])
+        n = min(npts, raw.shape[0])
+        out[:n] = raw[:n]
+        out = (1.0 - self.mask[::-1])*(out - self.bkgd)
+        out[out < 0] = 0
+        return out
+
+    def test_frames(self):
+        "frames from HDF5 and netCDF files, with mask and background"
+        for xrdtype, fname in (('hdf5', self.write_hdf5()),
+                               ('netcdf', self.write_netcdf())):
+            for npts in (5, 7, 9):
+                frames = self.xrm.GSEXRM_XRDFrames(fname, xrdtype=xrdtype, npts=npts,
+                                                   xrd2dmask=self.mask,
+                                                   xrd2dbkgd=self.bkgd)
+                self.assertEqual(frames.shape, (npts, 32, 24))
+                out = frames[::-1].read()
+                self.assertEqual(out.dtype, np.float64)
+                self.assertTrue(np.allclose(out, self.expected(npts)[::-1]))
+                frames.close()
+            frames = self.xrm.GSEXRM_XRDFrames(fname, xrdtype=xrdtype)
+            self.assertTrue(np.all(frames.read() == self.raw))
+            frames.close()
+
+    def test_counts_above_uint16(self):
+        "HDF5 frames are not truncated to 16 bits before the background"
+        self.raw[:, 5, 5] = 70000 + np.arange(7)
+        fname = self.write_hdf5('uint32')
+        frames = self.xrm.GSEXRM_XRDFrames(fname, xrdtype='hdf5',
+                                           xrd2dbkgd=self.bkgd)
+        self.mask[:] = 0
+        self.assertTrue(np.allclose(frames.read(), self.expected(7)))
+
+        mfile = self.new_mapfile()
+        dset = mfile.xrmmap['work'].create_dataset('counts', (2, 7, 32, 24), np.uint16)
+        frames.write(dset, 1)
+        expected = np.clip(self.expected(7), 0, 65535).astype('uint16')
+        self.assertTrue(np.all(dset[1] == expected))
+        self.assertTrue(np.all(dset[1, :, 5, 5] == 65535))
+        frames.close()
+
+    def test_stack(self):
+        "sums of frames over an area, read in blocks"
+        rng = np.random.RandomState(4)
+        nrow, npts = 6, 40
+        data = rng.randint(0, 100, (nrow, npts, 16, 8)).astype('uint16')
+        area = rng.uniform(size=(nrow, npts)) < 0.3
+        mfile = self.new_mapfile()
+        for chunks in ((1, 1, 16, 8), (1, npts, 16, 8)):
+            dset = mfile.xrmmap['work'].create_dataset('c%i' % chunks[1],
+                                                       data=data, chunks=chunks)
+            for budget in (16*8*2*3, 16*8*2*100, 2**28):
+                stack = self.xrm.GSEXRM_FrameStack(dset, budget=budget)
+                self.assertTrue(np.all(stack.sum_area(area) ==
+                                       data[area].sum(axis=0)))
+
+class PipelinedRow(object):
+    "stand-in for GSEXRM_MapRow: row index, data flags and reader thread"
+    def __init__(self, irow, flags):
+        self.irow = irow
+        self.flags = flags
+        self.thread = threading.current_thread().name
+
+class TestPipelinedRows(TestXRMMap):
+    '''process_rows_pipelined(): rows read in threads, written in order'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = self.new_mapfile(xrdcalfile='', flag_xrd1d=True)
+        self.written = []
+        self.mfile.read_rowdata = self.read_rowdata
+        self.mfile.process_row = self.process_row
+        self.badrow = None
+        self.noxrd_row = None
+        self.rows = []
+
+    def read_rowdata(self, irow, flags=None):
+        if irow == self.badrow:
+            raise IOError('cannot read row %i' % irow)
+        # rows finish reading out of order
+        time.sleep(0.002*((7*irow) % 5))
+        if flags is None:
+            flags = (self.mfile.flag_xrf, self.mfile.flag_xrd1d,
+                     self.mfile.flag_xrd2d)
+        if irow == self.noxrd_row:
+            flags = (flags[0], False, False)
+        return PipelinedRow(irow, flags)
+
+    def process_row(self, irow, row=None, flush=False, callback=None):
+        if row is None:
+            row = self.read_rowdata(irow)
+        self.assertEqual(row.irow, irow)
+        self.written.append((irow, flush))
+        self.rows.append(row)
+        self.mfile.last_row = irow
+
+    def test_order(self):
+        "rows are written in order, flushing after the last row"
+        nthreads = threading.active_count()
+        timing = []
+        self.mfile.process_rows_pipelined(1, 40, nworkers=4, nprefetch=6,
+                                          timing_callback=lambda **kw: timing.append(kw))
+        self.assertEqual([i for i, flush in self.written], list(range(1, 40)))
+        self.assertEqual([i for i, flush in self.written if flush], [39])
+        self.assertEqual([t['row'] for t in timing], list(range(1, 40)))
+        self.assertEqual(threading.active_count(), nthreads)
+
+    def test_error(self):
+        "an error reading a row is raised after writing the rows before it"
+        nthreads = threading.active_count()
+        self.badrow = 17
+        self.assertRaises(IOError, self.mfile.process_rows_pipelined,
+                          1, 40, nworkers=3)
+        self.assertEqual([i for i, flush in self.written], list(range(1, 17)))
+        self.assertEqual(threading.active_count(), nthreads)
+
+    def test_flags(self):
+        "readers use the flags at the start, rows change them in order"
+        self.noxrd_row = 5
+        self.mfile.process_rows_pipelined(1, 20, nworkers=3)
+        self.assertEqual([r.flags for r in self.rows if r.irow != 5],
+                         [(True, True, False)]*18)
+        self.assertTrue(self.mfile.flag_xrf)
+        self.assertFalse(self.mfile.flag_xrd1d)
+
+    def test_process(self):
+        "process() on a new file writes row 0, then pipelines the rest"
+        mfile = self.mfile
+        mfile.__dict__.update(status=self.xrm.GSEXRM_FileStatus.created,
+                              rowdata=[None]*30, dimension=2, mapconf={})
+        mfile.read_master = lambda: None
+        mfile.add_map_config = lambda conf: None
+        mfile.process(nworkers=3, force=True)
+        self.assertEqual([i for i, flush in self.written], list(range(30)))
+        self.assertEqual([i for i, flush in self.written if flush], [0, 29])
+        threads = [r.thread for r in self.rows]
+        self.assertFalse(threads[0].startswith('maprow_reader'))
+        self.assertTrue(all(t.startswith('maprow_reader') for t in threads[1:]))
+
+        # row 0 is also written first for a file with no rows yet
+        self.written, self.rows = [], []
+        mfile.last_row = -1
+        mfile.process(nworkers=3, force=True)
+        self.assertEqual([i for i, flush in self.written], list(range(30)))
+        threads = [r.thread for r in self.rows]
+        self.assertFalse(threads[0].startswith('maprow_reader'))
+        self.assertTrue(all(t.startswith('maprow_reader') for t in threads[1:]))
+
+MASTER_HEADER = """#Scan.version = 1.4
+#Scan.nrows_expected = 3
+#XRF.filetype = hdf5
+; yposition  xrffile  structfile  xpsfile
+"""
+
+class TestMasterFile(TestXRMMap):
+    '''read_masterfile(): cached, incremental reading of the Master file'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        from larch_plugins.xrmmap import readMasterFile
+        self.readMasterFile = readMasterFile
+        self.mfile = self.new_mapfile()
+        self.mfile.masterfile = os.path.join(self.tmpdir, 'Master.dat')
+        self.write(MASTER_HEADER + '0.0 xsp3.001 struck.001 xps.001\n', 'w')
+
+    def write(self, text, mode='a'):
+        with open(self.mfile.masterfile, mode) as fh:
+            fh.write(text)
+
+    def test_read(self):
+        "the parsed file matches readMasterFile(), and is read once"
+        header, rows, changed = self.mfile.read_masterfile()
+        self.assertTrue(changed)
+        self.assertEqual((header, rows),
+                         self.readMasterFile(self.mfile.masterfile))
+        self.assertFalse(self.mfile.read_masterfile()[2])
+
+    def test_append(self):
+        "lines appended during a scan are added, partial lines are not"
+        self.mfile.read_masterfile()
+        self.write('0.1 xsp3.002 struck.002 xps.002\n0.2 xsp3.003')
+        header, rows, changed = self.mfile.read_masterfile()
+        self.assertTrue(changed)
+        self.assertEqual([r[0] for r in rows], ['0.0', '0.1'])
+
+        self.write(' struck.003 xps.003\n')
+        header, rows, changed = self.mfile.read_masterfile()
+        self.assertEqual((header, rows),
+                         self.readMasterFile(self.mfile.masterfile))
+        self.assertEqual(self.mfile._master_cache['offset'],
+                         os.path.getsize(self.mfile.masterfile))
+
+    def test_rewrite(self):
+        "a new, shorter file is read from the start"
+        self.write(MASTER_HEADER + '0.0 a b c\n0.1 d e f\n', 'w')
+        self.mfile.read_masterfile()
+        self.write(MASTER_HEADER + '1.0 g h i\n', 'w')
+        header, rows, changed = self.mfile.read_masterfile()
+        self.assertTrue(changed)
+        self.assertEqual(rows, [['1.0', 'g', 'h', 'i']])
+
+class TestWatch(TestXRMMap):
+    '''watch(): rows added as their raw data files are written'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = mfile = self.new_mapfile(status=self.xrm.GSEXRM_FileStatus.created,
+                                              scan_version=2.0, nrows_expected=None,
+                                              _pixeltime=1.0)
+        mfile.xrmmap.attrs['Map_Folder'] = self.tmpdir
+        mfile.masterfile = os.path.join(self.tmpdir, 'Master.dat')
+        mfile.read_master = self.read_master
+        mfile.initialize_xrmmap = self.initialize_xrmmap
+        mfile.process_row = self.process_row
+        mfile.resize_arrays = self.resize_arrays
+        self.nrows = None
+
+    def read_master(self):
+        if os.path.exists(self.mfile.masterfile):
+            self.mfile.rowdata = self.mfile.read_masterfile()[1]
+
+    def initialize_xrmmap(self, callback=None):
+        self.mfile.status = self.xrm.GSEXRM_FileStatus.hasdata
+        self.process_row(0)
+
+    def process_row(self, irow, callback=None):
+        self.mfile.last_row = irow
+
+    def resize_arrays(self, nrow):
+        self.nrows = nrow
+
+    def write_rows(self, nrows, delay=0.2):
+        for i in range(nrows):
+            for prefix in ('xsp3', 'struck', 'xps'):
+                with open(os.path.join(self.tmpdir, '%s.%3.3i' % (prefix, i)), 'w') as fh:
+                    fh.write('data')
+            with open(self.mfile.masterfile, 'a') as fh:
+                fh.write('%i None.%3.3i None.%3.3i None.%3.3i _unused_ 0\n' % (i, i, i, i))
+            time.sleep(delay)
+
+    def test_watch(self):
+        "all expected rows are added, in order, as they are written"
+        self.mfile.nrows_expected = 5
+        writer = threading.Thread(target=self.write_rows, args=(5,))
+        writer.start()
+        added = []
+        nrows = self.mfile.watch(timeout=10, poll_time=0.05, settle=0.1,
+                                 use_inotify=False,
+                                 subscriber=lambda **kw: added.append(kw['row']))
+        writer.join()
+        self.assertEqual(nrows, 5)
+        self.assertEqual(added, [0, 1, 2, 3, 4])
+        self.assertEqual(self.nrows, 5)
+
+    def test_timeout(self):
+        "watching stops after timeout with no new rows"
+        self.write_rows(2, delay=0)
+        time.sleep(0.1)
+        nrows = self.mfile.watch(timeout=0.3, poll_time=0.05, settle=0.05,
+                                 use_inotify=False)
+        self.assertEqual(nrows, 2)
+        self.assertEqual(self.mfile.watch(timeout=0.2, poll_time=0.05,
+                                          use_inotify=False), 0)
+
+    def test_stop(self):
+        "stop_watch() from another thread"
+        timer = threading.Timer(0.3, self.mfile.stop_watch)
+        timer.start()
+        t0 = time.time()
+        self.assertEqual(self.mfile.watch(poll_time=0.05), 0)
+        self.assertTrue(time.time() - t0 < 5.0)
+
+class TestCumCounts(TestXRMMap):
+    '''add_cumcounts(), get_mca_erange(): maps for ranges of channels'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = self.new_mapfile()
+        self.counts = self.add_detectors(self.mfile, nchan=200)
+
+    def direct(self, dets, imin, imax, dtcorrect=True):
+        out = 0
+        for det in dets:
+            dmap = self.counts[det][:, :, imin:imax].sum(axis=2)
+            if dtcorrect:
+                dmap = dmap*self.mfile.xrmmap[det]['dtfactor'][:]
+            out = out + dmap
+        return out
+
+    def check_erange(self):
+        mfile = self.mfile
+        # energy is 0.01 keV per channel
+        out = mfile.get_mca_erange(emin=0.64, emax=1.10)
+        self.assertTrue(np.allclose(out, self.direct(('mca1', 'mca2'), 64, 111)))
+        out = mfile.get_mca_erange(det=2, dtcorrect=False, emin=20, emax=150,
+                                   by_energy=False)
+        self.assertTrue(np.all(out == self.direct(('mca2',), 20, 150, False)))
+        out = mfile.get_mca_erange(det='mca1', dtcorrect=False)
+        self.assertTrue(np.all(out == self.direct(('mca1',), 0, 200, False)))
+        out = mfile.get_mca_erange(det='mcasum', emin=0.64, emax=1.10)
+        self.assertTrue(np.allclose(out, self.direct(('mca1', 'mca2'), 64, 111)))
+
+    def test_erange(self):
+        "maps from counts match direct sums"
+        self.check_erange()
+
+    def test_unknown_detector(self):
+        "an unknown detector is an error, not the sum of all detectors"
+        for det in ('mca3', 3, 'det7', 'xrd2d'):
+            self.assertRaises(ValueError, self.mfile.get_mca_erange, det=det)
+
+    def test_cumcounts(self):
+        "maps from cumulative counts match direct sums"
+        self.mfile.add_cumcounts()
+        self.assertTrue(self.mfile.flag_cumsum)
+        for det in ('mca1', 'mca2'):
+            dgrp = self.mfile.xrmmap[det]
+            self.assertEqual(dgrp['cumcounts'].shape, (12, 16, 201))
+            self.assertTrue(np.all(dgrp['cumcounts'][:, :, -1] ==
+                                   self.counts[det].sum(axis=2)))
+        self.check_erange()
+
+class TestAreaCounts(TestXRMMap):
+    '''sum_area_counts() and the cache of area spectra'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = self.new_mapfile()
+        self.counts = self.add_detectors(self.mfile, nrow=24, npts=32,
+                                         chunks=(1, 8, 64))
+        # thin diagonal band
+        self.area = np.zeros((24, 32), dtype=bool)
+        for i in range(24):
+            self.area[i, max(0, i-2):i+2] = True
+
+    def direct(self, area, dtcorrect=True):
+        out = 0
+        for det, counts in self.counts.items():
+            cts = counts[area].astype(np.float64)
+            if dtcorrect:
+                cts = cts*self.mfile.xrmmap[det]['dtfactor'][:][area][:, np.newaxis]
+            out = out + cts.sum(axis=0)
+        return out
+
+    def test_blocks(self):
+        "blocks follow the chunks, skipping chunks outside the area"
+        blocks = self.mfile.area_blocks(self.mfile.xrmmap['mca1/counts'], self.area)
+        self.assertEqual(sum(mask.sum() for sy, sx, mask in blocks), self.area.sum())
+        for sy, sx, mask in blocks:
+            self.assertEqual(sy.stop - sy.start, 1)
+            self.assertTrue(sx.stop - sx.start <= 8)
+            self.assertEqual(sx.start//8, (sx.stop-1)//8)
+        self.assertEqual(self.mfile.area_blocks(self.mfile.xrmmap['mca1/counts'],
+                                                np.zeros((24, 32), dtype=bool)), [])
+
+    def test_sum(self):
+        "summed area counts match direct sums"
+        dets = ['mca1', 'mca2']
+        nblocks = []
+        out = self.mfile.sum_area_counts(self.area, dets, dtcorrect=True,
+                                         callback=lambda i, n, npix: nblocks.append(n))
+        self.assertTrue(np.allclose(out, self.direct(self.area)))
+        self.assertTrue(len(nblocks) > 0)
+        out = self.mfile.sum_area_counts(self.area, dets, dtcorrect=False)
+        self.assertTrue(np.all(out == self.direct(self.area, dtcorrect=False)))
+        # a single pixel
+        area = np.zeros((24, 32), dtype=bool)
+        area[5, 7] = True
+        out = self.mfile.sum_area_counts(area, ['mca2'], dtcorrect=False)
+        self.assertTrue(np.all(out == self.counts['mca2'][5, 7]))
+
+    def test_cache(self):
+        "cached area spectra are used only for the same mask and data"
+        mfile = self.mfile
+        counts = mfile.sum_area_counts(self.area, ['mca1', 'mca2'])
+        self.assertTrue(mfile.get_area_cache('band', self.area, 'mcasum', True) is None)
+        mfile.set_area_cache('band', self.area, 'mcasum', True, counts)
+        self.assertTrue(np.all(mfile.get_area_cache('band', self.area, 'mcasum', True)
+                               == counts))
+        self.assertTrue(mfile.get_area_cache('band', self.area, 'mcasum', False) is None)
+        self.assertTrue(mfile.get_area_cache('band', ~self.area, 'mcasum', True) is None)
+        mfile.last_row += 1
+        self.assertTrue(mfile.get_area_cache('band', self.area, 'mcasum', True) is None)
+
+class TestPyramid(TestXRMMap):
+    '''bin_map2() and build_pyramid(): maps binned by 2x2, 4x4, ...'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = mfile = self.new_mapfile()
+        rng = np.random.RandomState(7)
+        self.shape = (21, 33)
+        xrmmap = mfile.xrmmap
+        xrmmap['positions'].create_dataset('pos', data=np.zeros(self.shape + (2,)))
+        xrmmap['scalars'].create_dataset('I0', data=rng.uniform(size=self.shape))
+        roi = xrmmap['roimap'].create_group('mcasum/Fe Ka')
+        roi.create_dataset('cor', data=rng.uniform(size=self.shape))
+        roi.create_dataset('raw', data=rng.randint(0, 100, self.shape))
+        self.counts = rng.randint(0, 50, self.shape + (64,)).astype('int16')
+        xrmmap.create_dataset('mcasum/counts', data=self.counts)
+
+    def test_bin_map2(self):
+        "2x2 sums, padding odd sizes"
+        arr = np.arange(5*7*3).reshape(5, 7, 3)
+        out = self.xrm.bin_map2(arr)
+        self.assertEqual(out.shape, (3, 4, 3))
+        self.assertEqual(out.dtype, np.int32)
+        self.assertEqual(out.sum(), arr.sum())
+        self.assertEqual(out[0, 0, 0], arr[:2, :2, 0].sum())
+        self.assertEqual(out[2, 3, 1], arr[4, 6, 1])
+        self.assertEqual(self.xrm.bin_map2(np.ones((4, 4))).dtype, np.float32)
+
+    def test_build(self):
+        "all levels keep the sums of maps and spectra"
+        self.xrm.PYRAMID_MINSIZE, minsize = 4, self.xrm.PYRAMID_MINSIZE
+        try:
+            self.mfile.build_pyramid()
+        finally:
+            self.xrm.PYRAMID_MINSIZE = minsize
+        pyramid = self.mfile.xrmmap['pyramid']
+        self.assertEqual(pyramid.attrs['nlevels'], 4)
+        ny, nx = self.shape
+        for level in (1, 2, 3, 4):
+            scale = 2**level
+            shape = (-(-ny//scale), -(-nx//scale))
+            lgrp = pyramid['level%i' % level]
+            self.assertEqual(lgrp['mcasum/counts'].shape, shape + (64,))
+            self.assertEqual(lgrp['mcasum/counts'][:].sum(),
+                             self.counts.astype(np.int64).sum())
+            for path in ('scalars/I0', 'roimap/mcasum/Fe Ka/cor',
+                         'roimap/mcasum/Fe Ka/raw'):
+                self.assertEqual(lgrp[path].shape, shape)
+                self.assertAlmostEqual(lgrp[path][:].sum(),
+                                       self.mfile.xrmmap[path][:].sum(), places=2)
+
+    def test_mca_rect(self):
+        "spectra for a rectangle of a pyramid level"
+        mfile = self.mfile
+        mfile.build_pyramid(nlevels=2)
+        mfile._getmca = lambda dgroup, counts, name, **kws: (counts, kws)
+        mfile.get_livereal_rect = lambda *args, **kws: (1.0, 1.0)
+        counts, kws = mfile._get_mca_rect_level(1, 3, 2, 5, 2)
+        self.assertTrue(np.all(counts == self.counts[4:12, 8:20].sum(axis=(0, 1))))
+        self.assertEqual(kws['npixels'], 3*4*16)
+        self.assertRaises(self.xrm.GSEXRM_Exception,
+                          mfile._get_mca_rect_level, 1, 3, 2, 5, 3)
+
+class TestRepack(TestXRMMap):
+    '''repack(): map files rewritten with a new chunk layout'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.mfile = mfile = self.new_mapfile(root='xrmmap', dimension=2)
+        mfile.read_master = lambda: None
+        self.add_detectors(mfile, nrow=6, npts=20, nchan=64,
+                           chunks=(2, 20, 64))
+        mfile.xrmmap['roimap'].create_dataset('mcasum_raw',
+                                              data=np.arange(240.).reshape(6, 20, 2))
+        mfile.xrmmap['config/notes'].attrs['note'] = 'repacked'
+        mfile.xrmmap.attrs['Last_Row'] = mfile.last_row
+        mfile.h5root.flush()
+        self.before = self.contents(mfile.h5root)
+
+    def contents(self, h5root):
+        "data and attributes of all groups and datasets"
+        out = {'/': (None, dict(h5root.attrs))}
+        def visit(name, obj):
+            data = obj[()] if isinstance(obj, h5py.Dataset) else None
+            out[name] = (data, dict(obj.attrs))
+        h5root.visititems(visit)
+        return out
+
+    def check_repacked(self, h5root, layout):
+        after = self.contents(h5root)
+        self.assertEqual(sorted(after.keys()), sorted(self.before.keys()))
+        for name, (data, attrs) in self.before.items():
+            adata, aattrs = after[name]
+            if data is not None:
+                self.assertEqual(adata.dtype, data.dtype)
+                self.assertTrue(np.all(adata == data))
+            if name == 'xrmmap':
+                attrs = dict(attrs)
+                attrs.pop('Chunk_Layout', None)
+                attrs.pop('Compression', None)
+                self.assertEqual(bytes2str(aattrs.pop('Chunk_Layout')), layout)
+                self.assertEqual(bytes2str(aattrs.pop('Compression')),
+                                 self.xrm.compress_string(self.xrm.COMPRESSION,
+                                                          self.xrm.COMPRESSION_OPTS))
+            self.assertEqual(sorted(aattrs.keys()), sorted(attrs.keys()))
+            for key, val in attrs.items():
+                self.assertTrue(np.all(aattrs[key] == val))
+        chunks = self.xrm.calc_chunksize(20, 64, layout=layout)
+        for det in ('mca1', 'mca2'):
+            self.assertEqual(h5root['xrmmap/%s/counts' % det].chunks, chunks)
+
+    def test_new_file(self):
+        "a new file has the same data and attributes, in the new layout"
+        for layout in ('spectrum', 'image'):
+            fname = os.path.join(self.tmpdir, 'repack_%s.h5' % layout)
+            out = self.mfile.repack(filename=fname, chunk_layout=layout,
+                                    benchmark=False)
+            self.assertEqual(out['filename'], fname)
+            with h5py.File(fname, 'r') as fh:
+                self.check_repacked(fh, layout)
+            self.assertEqual(self.mfile.h5root['xrmmap/mca1/counts'].chunks,
+                             (2, 20, 64))
+        self.assertEqual(self.contents(self.mfile.h5root).keys(),
+                         self.before.keys())
+
+    def test_replace(self):
+        "the map file is replaced, and reopened"
+        mfile = self.mfile
+        fname = mfile.filename
+        for layout in ('image', 'spectrum'):
+            out = mfile.repack(chunk_layout=layout, benchmark=False)
+            self.h5files.append(mfile.h5root)
+            self.assertEqual(out['filename'], fname)
+            self.assertEqual(mfile.filename, fname)
+            self.assertEqual(mfile.chunk_layout, layout)
+            self.assertEqual(os.listdir(self.tmpdir), [os.path.basename(fname)])
+            self.check_repacked(mfile.h5root, layout)
+        # the reopened file can be written to
+        mfile.xrmmap.attrs['Last_Row'] = 3
+
+    def test_repack_mapfile(self):
+        "repack_mapfile() opens, repacks and closes a map file"
+        fname = self.mfile.filename
+        self.mfile.close()
+        newfile = os.path.join(self.tmpdir, 'repacked.h5')
+        out = self.xrm.repack_mapfile(fname, newfile=newfile,
+                                      chunk_layout='image', benchmark=False)
+        self.assertEqual(out['filename'], newfile)
+        with h5py.File(newfile, 'r') as fh:
+            self.check_repacked(fh, 'image')
+
+class TestMapFolders(TestXRMMap):
+    '''process_mapfolders(): conversion of map folders in row-range tasks'''
+
+    def setUp(self):
+        TestXRMMap.setUp(self)
+        self.totals = {'A': 100, 'B': 10, 'C': 45}
+        self.folders = []
+        for name, nrows in sorted(self.totals.items()):
+            path = os.path.join(self.tmpdir, name)
+            os.mkdir(path)
+            for fname in ('Scan.ini', 'Environ.dat', 'xsp3.000'):
+                with open(os.path.join(path, fname), 'w') as fh:
+                    fh.write('#\n')
+            with open(os.path.join(path, 'Master.dat'), 'w') as fh:
+                fh.write(MASTER_HEADER)
+                for i in range(nrows):
+                    fh.write('%i xsp3.%3.3i struck.%3.3i xps.%3.3i\n' % (i, i, i, i))
+            self.folders.append(path)
+        self.last_row = {}
+        self.tasks = []
+        self.failing = None
+        self._process_maprows = self.xrm.process_maprows
+        self.xrm.process_maprows = self.process_maprows
+
+    def tearDown(self):
+        self.xrm.process_maprows = self._process_maprows
+        TestXRMMap.tearDown(self)
+
+    def process_maprows(self, path, nrows=None, nworkers=1, **kws):
+        "convert rows of a folder, as a task"
+        name = os.path.basename(path)
+        total = self.totals[name]
+        last = self.last_row.get(name, -1)
+        out = {'path': path, 'irow': last+1, 'total': total,
+               'time': 0.01, 'error': None}
+        if name == self.failing and last >= 3:
+            out.update(nrows=0, last_row=last, nbytes=0, error='read error')
+            return out
+        nrows = min(nrows, total-1-last)
+        self.last_row[name] = last + nrows
+        self.tasks.append((name, last+1, nrows, nworkers))
+        out.update(nrows=nrows, last_row=last+nrows, nbytes=1000*nrows)
+        return out
+
+    def test_tasks(self):
+        "folders are converted in tasks, largest folder first"
+        status = self.xrm.process_mapfolders(self.folders, ncpus=0,
+                                             rows_per_task=16)
+        for path in self.folders:
+            name = os.path.basename(path)
+            self.assertEqual(status[path]['status'], 'done')
+            self.assertEqual(status[path]['nrows'], self.totals[name])
+            self.assertEqual(status[path]['last_row'], self.totals[name]-1)
+        self.assertEqual(self.tasks[0], ('A', 0, 16, 1))
+        self.assertTrue(max(t[2] for t in self.tasks) <= 16)
+        for name, total in self.totals.items():
+            rows = [t[1:3] for t in self.tasks if t[0] == name]
+            self.assertEqual(sum(n for i, n in rows), total)
+            self.assertEqual([i for i, n in rows],
+                             list(range(0, total, 16)))
+
+    def test_failed(self):
+        "a failed folder does not stop the others"
+        self.failing = 'C'
+        status = self.xrm.process_mapfolders(self.folders, ncpus=0,
+                                             rows_per_task=4)
+        cpath = os.path.join(self.tmpdir, 'C')
+        self.assertEqual(status[cpath]['status'], 'failed')
+        self.assertEqual(status[cpath]['last_row'], 3)
+        self.assertEqual(status[cpath]['error'], 'read error')
+        for name in ('A', 'B'):
+            self.assertEqual(status[os.path.join(self.tmpdir, name)]['status'], 'done')
+
+    def test_progress(self):
+        "a progress file resumes conversion, skipping finished folders"
+        pfile = os.path.join(self.tmpdir, 'progress.json')
+        self.failing = 'C'
+        self.xrm.process_mapfolders(self.folders, ncpus=0, rows_per_task=16,
+                                    progress_file=pfile)
+        self.failing = None
+        self.tasks = []
+        status = self.xrm.process_mapfolders(self.folders, ncpus=0,
+                                             rows_per_task=16,
+                                             progress_file=pfile)
+        self.assertEqual(list(status.keys()), [os.path.join(self.tmpdir, 'C')])
+        self.assertEqual(self.tasks[0], ('C', 16, 16, 1))
+        self.assertEqual(status[os.path.join(self.tmpdir, 'C')]['status'], 'done')
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestCompression, TestXRFReaders, TestXRDFrames,
+                  TestPipelinedRows, TestMasterFile, TestWatch, TestCumCounts,
+                  TestAreaCounts, TestPyramid, TestRepack, TestMapFolders):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=13).run(suite)